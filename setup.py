@@ -22,6 +22,7 @@ setup(
     zip_safe = True,
 
     install_requires = ['rdflib>=3.2.1'],
+    extras_require = {'sparql': ['rdfextras']},
 
     classifiers = [
         'Development Status :: 3 - Alpha',
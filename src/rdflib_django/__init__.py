@@ -7,9 +7,14 @@ you can create a new Graph using:
 >>> import rdflib
 >>> g = rdflib.Graph('Django')
 
+To store statements using a term dictionary, use:
+
+>>> g = rdflib.Graph('DjangoTermDictionary')
+
 """
 from rdflib.plugin import register
 from rdflib.store import Store
 
 
 register('Django', Store, 'rdflib_django.store', 'DjangoStore')
+register('DjangoTermDictionary', Store, 'rdflib_django.termstore', 'TermStore')
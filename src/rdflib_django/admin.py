@@ -41,3 +41,5 @@ admin.site.register(models.NamespaceModel, NamespaceAdmin)
 
 admin.site.register(models.URIStatement)
 admin.site.register(models.LiteralStatement)
+admin.site.register(models.Term)
+admin.site.register(models.TermStatement)
@@ -0,0 +1,260 @@
+"""
+Microbenchmarks for the store.
+
+The benchmarks write to the configured database, so run them against a scratch database,
+for instance from ``python manage.py shell``::
+
+    >>> from rdflib_django import benchmarks
+    >>> benchmarks.compare_triples(size=100000)  # doctest: +SKIP
+    {'models': 17.9, 'rows': 7.5}
+
+The results are the number of microseconds spent per triple.
+
+The rdf_benchmark management command runs a broader suite on a synthetic dataset, whose
+predicates follow a skewed distribution and whose statements are spread over many contexts:
+
+>>> quads = list(generate_dataset(1000, contexts=5))
+>>> len(quads), len(set(c for s, p, o, c in quads))
+(1000, 5)
+>>> quads == list(generate_dataset(1000, contexts=5))
+True
+>>> predicates = [p for s, p, o, c in quads]
+>>> predicates.count(EX.p0) > 3 * predicates.count(EX.p5)
+True
+"""
+import bisect
+import datetime
+import random
+import timeit
+import django
+from django.db import connection
+import rdflib
+from rdflib.graph import Graph
+from rdflib.namespace import RDF, RDFS, Namespace
+from rdflib.term import URIRef, Literal
+from rdflib_django import models
+from rdflib_django.bulk import export_statements
+from rdflib_django.store import DjangoStore, _get_named_graph_id
+
+
+BENCHMARK_CONTEXT = URIRef('http://rdflib-django.readthedocs.org/benchmark')
+
+#: The namespace of the resources, classes and predicates of the synthetic dataset.
+EX = Namespace('http://example.com/benchmark/')
+
+#: The number of predicates of the synthetic dataset. The k-th predicate is k times less frequent than the first.
+PREDICATE_COUNT = 20
+
+#: One in this many resources is described by many literals.
+LITERAL_HEAVY_RATIO = 5
+
+#: The shapes of the triple patterns that are timed: bound terms are marked with s, p or o.
+PATTERN_SHAPES = ('spo', 'sp?', 's?o', '?po', 's??', '?p?', '??o', '???')
+
+#: The SPARQL queries that are timed, if rdfextras is installed.
+SPARQL_QUERIES = {
+    'bgp': "SELECT ?s ?label WHERE { ?s a ex:Type0 ; rdfs:label ?label } LIMIT 100",
+    'filter': "SELECT ?s ?n WHERE { ?s ex:count ?n FILTER (?n > 50) } ORDER BY ?n LIMIT 100",
+    'optional': "SELECT ?s ?d WHERE { ?s a ex:Type1 OPTIONAL { ?s ex:description ?d } }",
+}
+
+
+def fill_graph(graph, size):
+    """
+    Adds size triples to a graph, half of them with a literal object.
+    """
+    graph.addN(
+        quad
+        for i in range(size // 2)
+        for quad in [(URIRef('http://example.com/resource/{0}'.format(i)), RDF.type,
+                      URIRef('http://example.com/Type{0}'.format(i % 10)), graph),
+                     (URIRef('http://example.com/resource/{0}'.format(i)), RDFS.label,
+                      Literal('Resource {0}'.format(i), lang='en'), graph)])
+
+
+def triples_with_models(graph):
+    """
+    Yields the triples of a graph the way the store did before reading raw rows: by iterating
+    query sets and instantiating a model for every statement.
+    """
+    named_graph_id = _get_named_graph_id(graph)
+    for model in (models.URIStatement, models.LiteralStatement):
+        for statement in model.objects.filter(context_id=named_graph_id):
+            yield statement.as_triple()
+
+
+def compare_triples(size=10000, repeat=3):
+    """
+    Compares reading all triples of a graph with size triples by instantiating models, and by reading raw rows.
+
+    Returns the best time per triple in microseconds for both.
+    """
+    graph = rdflib.Graph('Django', identifier=BENCHMARK_CONTEXT)
+    graph.remove((None, None, None))
+    fill_graph(graph, size)
+    try:
+        assert set(triples_with_models(graph)) == set(graph)
+
+        count = float(len(graph))
+        return {
+            'models': min(timeit.repeat(lambda: list(triples_with_models(graph)), number=1, repeat=repeat)) / count * 1e6,
+            'rows': min(timeit.repeat(lambda: list(graph), number=1, repeat=repeat)) / count * 1e6,
+        }
+    finally:
+        graph.remove((None, None, None))
+
+
+def generate_dataset(size, contexts=10, seed=0):
+    """
+    Yields size (s, p, o, context) quads of a synthetic dataset, in which context is the
+    identifier of one of contexts named graphs. The dataset only depends on its parameters.
+
+    Every resource has a type. One in LITERAL_HEAVY_RATIO resources is described by labels in
+    several languages, a description, a number and a date; the others link to other resources
+    through predicates that follow a Zipf distribution, with the occasional literal.
+    """
+    rng = random.Random(seed)
+    predicates = [EX['p{0}'.format(k)] for k in range(PREDICATE_COUNT)]
+    cumulative = []
+    for k in range(PREDICATE_COUNT):
+        cumulative.append((cumulative[-1] if cumulative else 0) + 1.0 / (k + 1))
+
+    count = 0
+    i = 0
+    while count < size:
+        resource = EX['resource/{0}'.format(i)]
+        context = EX['context/{0}'.format(i % contexts)]
+        statements = [(RDF.type, EX['Type{0}'.format(rng.randrange(10))])]
+        if i % LITERAL_HEAVY_RATIO == 0:
+            statements.extend((RDFS.label, Literal(u'Resource {0}'.format(i), lang=lang)) for lang in ('en', 'nl', 'fr'))
+            statements.append((EX.description, Literal(u' '.join(u'word{0}'.format(rng.randrange(1000))
+                                                                for _ in range(rng.randrange(5, 50))))))
+            statements.append((EX['count'], Literal(rng.randrange(100))))
+            statements.append((EX.date, Literal(datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(5000)))))
+        else:
+            for _ in range(rng.randrange(1, 5)):
+                predicate = predicates[bisect.bisect(cumulative, rng.random() * cumulative[-1])]
+                if rng.random() < 0.2:
+                    statements.append((predicate, Literal(u'value {0}'.format(rng.randrange(1000)))))
+                else:
+                    statements.append((predicate, EX['resource/{0}'.format(rng.randrange(max(i, 1)))]))
+
+        for predicate, obj in statements[:size - count]:
+            yield resource, predicate, obj, context
+        count += min(len(statements), size - count)
+        i += 1
+
+
+def _time(function, repeat):
+    """
+    Returns the best time in seconds of repeat calls of a function.
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def _result(seconds, operations):
+    """
+    Returns the result of a benchmark of a number of operations.
+    """
+    return {
+        'seconds': seconds,
+        'operations': operations,
+        'operations_per_second': operations / seconds if seconds else None,
+    }
+
+
+class _NullStream(object):
+    """
+    Stream that discards everything written to it.
+    """
+
+    def write(self, data):
+        pass
+
+
+def _get_pattern(shape, (s, p, o)):
+    """
+    Returns the triple pattern of a shape that matches a triple.
+    """
+    return (s if shape[0] == 's' else None, p if shape[1] == 'p' else None, o if shape[2] == 'o' else None)
+
+
+def run_benchmarks(store, size=10000, contexts=10, repeat=3, seed=0, samples=100, log=None):  # pylint: disable=R0913,R0914
+    """
+    Times the operations of a store on a synthetic dataset of size statements in contexts named graphs.
+
+    Bulk loading, adding and removing are timed once; reads are timed repeat times and the best time
+    is kept. Every pattern shape is timed on samples triples of the dataset, within their context and
+    across all contexts. The benchmark contexts are removed before and after the run.
+
+    Returns a dictionary that maps the names of the benchmarks to their seconds, operations and operations per second.
+    The optional log callback is called with the name of every benchmark before it runs.
+    """
+    graphs = dict((identifier, Graph(store, identifier=identifier))
+                  for identifier in (EX['context/{0}'.format(i)] for i in range(contexts)))
+    rng = random.Random(seed)
+    results = {}
+
+    def run(name, function, operations, times=repeat):
+        if log is not None:
+            log(name)
+        results[name] = _result(_time(function, times), operations)
+
+    for graph in graphs.values():
+        store.remove_context(graph)
+
+    try:
+        quads = [(s, p, o, graphs[c]) for s, p, o, c in generate_dataset(size, contexts, seed)]
+        run('bulk_load', lambda: store.addN(quads), len(quads), times=1)
+
+        added = [(EX['added/{0}'.format(i)], RDFS.label, Literal(u'Added {0}'.format(i)), rng.choice(quads)[3])
+                 for i in range(samples)]
+        run('add', lambda: [store.add((s, p, o), c) for s, p, o, c in added], len(added), times=1)
+
+        sample = rng.sample(quads, min(samples, len(quads)))
+        for shape in PATTERN_SHAPES:
+            patterns = [(_get_pattern(shape, (s, p, o)), c) for s, p, o, c in sample]
+            run('triples_' + shape, lambda: [list(store.triples(pattern, c)) for pattern, c in patterns], len(patterns))
+            if shape != '???':
+                run('triples_all_contexts_' + shape,
+                    lambda: [list(store.triples(pattern, None)) for pattern, _ in patterns], len(patterns))
+
+        run('len_context', lambda: [len(graph) for graph in graphs.values()], len(graphs))
+        run('len_store', store.__len__, 1)
+        run('contexts', lambda: list(store.contexts()), 1)
+
+        if type(store) is DjangoStore:
+            run('export_nt', lambda: export_statements(_NullStream(), chunk_size=store.batch_size), 1)
+            run('export_nquads', lambda: export_statements(_NullStream(), quads=True, chunk_size=store.batch_size), 1)
+
+        try:
+            import rdfextras
+            rdfextras.registerplugins()
+        except ImportError:
+            pass
+        else:
+            namespaces = {'ex': EX, 'rdf': RDF, 'rdfs': RDFS}
+            for name, query in SPARQL_QUERIES.items():
+                run('sparql_' + name, lambda: [list(graph.query(query, initNs=namespaces)) for graph in graphs.values()],
+                    len(graphs))
+
+        run('remove', lambda: [store.remove((s, p, o), c) for s, p, o, c in sample], len(sample), times=1)
+        run('remove_pattern', lambda: [store.remove((s, None, None), c) for s, p, o, c in added], len(added), times=1)
+    finally:
+        if log is not None:
+            log('remove_context')
+        results['remove_context'] = _result(_time(lambda: [store.remove_context(graph) for graph in graphs.values()], 1),
+                                            len(graphs))
+
+    return results
+
+
+def get_environment():
+    """
+    Returns the versions and database that benchmarks run against.
+    """
+    return {
+        'django': django.get_version(),
+        'rdflib': rdflib.__version__,
+        'database': connection.vendor,
+    }
@@ -0,0 +1,242 @@
+"""
+Support for loading and exporting large amounts of RDF.
+
+Parsers add their triples one by one to a graph. By parsing into a graph that is backed
+by a BufferedStore, the parsed triples are passed in batches to the addN implementation
+of the store of the target graph, without ever holding more than one batch in memory.
+
+>>> import rdflib
+>>> target = rdflib.Graph('Django')
+>>> buffered = BufferedStore(target, batch_size=2)
+>>> sink = rdflib.Graph(buffered)
+>>> sink = sink.parse(data='<http://example.com/a> <http://example.com/b> <http://example.com/c> .\\n', format='nt')
+>>> len(target)
+0
+>>> buffered.flush()
+>>> len(target)
+1
+
+Exporting works the other way around: export_statements writes the statements in the store
+to a stream as N-Triples or N-Quads, reading the statement tables in chunks and without
+building an rdflib Graph.
+
+>>> import sys
+>>> export_statements(sys.stdout, target.identifier)
+<http://example.com/a> <http://example.com/b> <http://example.com/c> .
+
+To synchronize a graph with a new version of its source, the parsed triples are collected in a
+SortedTriples store instead. sync_graph then compares them with the stored triples and only writes
+the difference:
+
+>>> incoming = SortedTriples(batch_size=2)
+>>> sink = rdflib.Graph(incoming)
+>>> sink = sink.parse(data='<http://example.com/a> <http://example.com/b> <http://example.com/d> .\\n', format='nt')
+>>> sync_graph(target, incoming)
+(1, 1, 0)
+>>> export_statements(sys.stdout, target.identifier)
+<http://example.com/a> <http://example.com/b> <http://example.com/d> .
+"""
+import cPickle
+import heapq
+import tempfile
+from rdflib.plugins.serializers.nquads import _nq_row
+from rdflib.plugins.serializers.nt import _nt_row
+from rdflib.store import Store
+from rdflib_django import indexes, models, sql
+from rdflib_django.fields import deserialize_uri
+
+
+#: The formats supported by export_statements.
+EXPORT_FORMATS = ('nt', 'nquads')
+
+
+class BufferedStore(Store):
+    """
+    Write-only store that buffers triples and flushes them into a target graph.
+
+    Every time the buffer contains batch_size triples, it is flushed using the addN method of
+    the store of the target graph. After every flush, the optional on_flush callback is called
+    with the total number of triples flushed so far.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self, target, batch_size, on_flush=None):
+        assert batch_size > 0
+        super(BufferedStore, self).__init__()
+        self.target = target
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.flushed = 0
+        self._buffer = []
+
+    def add(self, (s, p, o), context, quoted=False):
+        assert not quoted
+
+        self._buffer.append((s, p, o, self.target))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered triples to the target graph.
+        """
+        if not self._buffer:
+            return
+
+        self.target.store.addN(self._buffer)
+        self.flushed += len(self._buffer)
+        self._buffer = []
+
+        if self.on_flush is not None:
+            self.on_flush(self.flushed)
+
+    def triples(self, triple_pattern, context=None):
+        return iter(())
+
+    def __len__(self, context=None):
+        return self.flushed + len(self._buffer)
+
+
+def export_statements(stream, identifier=None, quads=False, chunk_size=1000):
+    """
+    Writes statements to a stream as N-Triples, or as N-Quads if quads is True.
+
+    If identifier is given, only the statements in the named graph with that identifier are written.
+    Otherwise, all statements are written; as N-Triples, every distinct triple is written once.
+    The statement tables are read chunk_size rows at a time.
+    """
+    named_graph_id = None
+    if identifier is not None:
+        found = models.NamedGraph.objects.filter(identifier=identifier).values_list('id', flat=True)[:1]
+        if not found:
+            return
+        named_graph_id = found[0]
+
+    for model in (models.URIStatement, models.LiteralStatement):
+        fields = model.row_fields + (('context__identifier',) if quads else ())
+        key = indexes.get_scan_order(False, False, False, named_graph_id is not None, model=model)
+        query_set = model.objects.all()
+        if named_graph_id is not None:
+            query_set = query_set.filter(context_id=named_graph_id)
+        elif not quads:
+            query_set = query_set.distinct()
+            fields = key = model.row_fields
+
+        for row in sql.iterate_rows(query_set, fields, chunk_size, key=key):
+            triple = model.row_to_triple(row)
+            if quads:
+                line = _nq_row(triple, deserialize_uri(row[-1]))
+            else:
+                line = _nt_row(triple)
+            stream.write(line.encode('utf-8'))
+
+
+class SortedTriples(Store):
+    """
+    Write-only store that sorts the triples added to it, without holding more than batch_size triples in memory.
+
+    The triples are sorted by their column values, in runs of batch_size triples that are written to
+    temporary files. Iterating over the store merges the runs, and yields every distinct triple once.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self, batch_size):
+        assert batch_size > 0
+        super(SortedTriples, self).__init__()
+        self.batch_size = batch_size
+        self._runs = []
+        self._buffer = []
+
+    def add(self, (s, p, o), context=None, quoted=False):
+        assert not quoted
+
+        self._buffer.append((get_sort_key((s, p, o)), (s, p, o)))
+        if len(self._buffer) >= self.batch_size:
+            self._write_run()
+
+    def _write_run(self):
+        """
+        Writes the buffered triples to a temporary file, in order.
+        """
+        run = tempfile.TemporaryFile()
+        for item in sorted(self._buffer):
+            cPickle.dump(item, run, cPickle.HIGHEST_PROTOCOL)
+        self._runs.append(run)
+        self._buffer = []
+
+    @staticmethod
+    def _read_run(run):
+        """
+        Yields the triples in a temporary file.
+        """
+        run.seek(0)
+        while True:
+            try:
+                yield cPickle.load(run)
+            except EOFError:
+                return
+
+    def sorted(self):
+        """
+        Yields the distinct triples in the store as (sort key, triple) tuples, ordered by their sort keys.
+        """
+        runs = [self._read_run(run) for run in self._runs] + [iter(sorted(self._buffer))]
+        last = None
+        for key, triple in heapq.merge(*runs):
+            if key != last:
+                yield key, triple
+                last = key
+
+    def triples(self, triple_pattern, context=None):
+        return iter(())
+
+    def __len__(self, context=None):
+        return len(self._runs) * self.batch_size + len(self._buffer)
+
+
+def get_sort_key(triple):
+    """
+    Returns the key by which SortedTriples sorts a triple: the column values of its terms. Triples
+    that are stored as the same statement have equal keys.
+    """
+    return tuple(models.term_to_values(term) for term in triple)
+
+
+def sync_graph(graph, incoming, batch_size=None):
+    """
+    Makes the triples of a named graph equal to the triples in a SortedTriples store, writing only the
+    triples that were added or removed. Returns the number of added, removed and unchanged triples.
+
+    The stored triples are sorted in batch_size runs as well, after which both sides are merged.
+    The writes are buffered by a store transaction, so they are applied in batches, all or nothing.
+    Blank nodes of different parses never match, so triples with blank nodes are always replaced.
+    """
+    batch_size = batch_size or incoming.batch_size
+    existing = SortedTriples(batch_size)
+    for triple, _ in graph.store.triples((None, None, None), graph):
+        existing.add(triple)
+
+    added = removed = unchanged = 0
+    new, old = incoming.sorted(), existing.sorted()
+    new_item, old_item = next(new, None), next(old, None)
+    with graph.store.atomic():
+        while new_item is not None or old_item is not None:
+            if old_item is None or (new_item is not None and new_item[0] < old_item[0]):
+                graph.store.add(new_item[1], graph)
+                added += 1
+                new_item = next(new, None)
+            elif new_item is None or old_item[0] < new_item[0]:
+                graph.store.remove(old_item[1], graph)
+                removed += 1
+                old_item = next(old, None)
+            else:
+                unchanged += 1
+                new_item, old_item = next(new, None), next(old, None)
+
+    return added, removed, unchanged
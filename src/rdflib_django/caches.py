@@ -0,0 +1,458 @@
+"""
+In-process caches used by the store.
+
+The caches in this module are shared by all stores in the process. They are kept coherent with
+the database by listening to the signals of the cached models.
+
+The namespace and named graph caches are also kept coherent across processes, using version stamps
+in the cache named by the DJANGO_RDFLIB_CACHE setting, or the default cache if that setting is absent.
+The result cache stores its entries in that cache as well.
+
+Sites that run more than one process need a cache that is shared by all of them, such as memcached.
+Django's default local-memory cache is private to each process, so other processes would never see
+the version stamps: they would keep reading renamed or removed named graphs, and stale results.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import transaction
+from django.core.signals import request_finished
+from django.db.models.signals import post_save, post_delete
+from rdflib_django import models
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping with a maximum size. When the maximum size is exceeded, the least
+    recently used entries are evicted.
+
+    >>> cache = LRUCache(2)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> sorted(cache.items())
+    [('a', 1), ('c', 3)]
+    """
+
+    def __init__(self, max_size):
+        assert max_size > 0
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value for key, or default if the key is not cached.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return default
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Caches the value for key, evicting the least recently used entry if necessary.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Removes key from the cache and returns its value.
+        """
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def items(self):
+        """
+        Returns a snapshot of the cached entries.
+        """
+        with self._lock:
+            return self._entries.items()
+
+    def clear(self):
+        """
+        Removes all entries from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NamedGraphCache(LRUCache):
+    """
+    LRUCache of the primary keys of named graphs, kept coherent across processes.
+
+    Renaming or deleting a named graph starts a new version stamp in the shared cache. Every process
+    checks the stamp at most once every check_interval seconds, and clears its cache when it has changed.
+    Creating a named graph does not change the stamp, since no process can have cached it before.
+    """
+
+    #: The key of the version stamp in the shared cache.
+    VERSION_KEY = 'rdflib_django.named_graphs.version'
+
+    #: The time in seconds that the shared cache keeps the version stamp.
+    VERSION_TIMEOUT = 30 * 24 * 60 * 60
+
+    def __init__(self, max_size, shared_cache, check_interval):
+        super(NamedGraphCache, self).__init__(max_size)
+        self.shared_cache = shared_cache
+        self.check_interval = check_interval
+        self._version = None
+        self._checked = 0
+
+    def _check(self):
+        """
+        Clears the cache if the version stamp has changed since it was last checked.
+        """
+        now = time.time()
+        if now - self._checked < self.check_interval:
+            return
+
+        version = self.shared_cache.get(self.VERSION_KEY)
+        if version is None:
+            self.shared_cache.add(self.VERSION_KEY, uuid.uuid4().hex, self.VERSION_TIMEOUT)
+            version = self.shared_cache.get(self.VERSION_KEY)
+        if version != self._version:
+            self.clear()
+            self._version = version
+        self._checked = now
+
+    def get(self, key, default=None):
+        self._check()
+        return super(NamedGraphCache, self).get(key, default)
+
+    def invalidate(self):
+        """
+        Discards the cached primary keys in all processes.
+        """
+        self.clear()
+        self.shared_cache.set(self.VERSION_KEY, uuid.uuid4().hex, self.VERSION_TIMEOUT)
+
+
+class NamespaceCache(object):
+    """
+    Thread-safe bidirectional mapping between the prefixes and URIs of the stored namespaces.
+
+    All namespaces are loaded with a single query when they are first needed. The mapping is reloaded
+    when the version stamp in the shared cache changes; the stamp is checked at most once every
+    check_interval seconds. Namespaces that are read while the current transaction has pending
+    changes are not cached.
+    """
+
+    #: The key of the version stamp in the shared cache.
+    VERSION_KEY = 'rdflib_django.namespaces.version'
+
+    #: The time in seconds that the shared cache keeps the version stamp.
+    VERSION_TIMEOUT = 30 * 24 * 60 * 60
+
+    def __init__(self, shared_cache, check_interval):
+        self.shared_cache = shared_cache
+        self.check_interval = check_interval
+        self._uris = None
+        self._prefixes = None
+        self._version = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def _get_version(self):
+        """
+        Returns the version stamp of the namespaces, creating one if the shared cache has none.
+        """
+        version = self.shared_cache.get(self.VERSION_KEY)
+        if version is None:
+            self.shared_cache.add(self.VERSION_KEY, uuid.uuid4().hex, self.VERSION_TIMEOUT)
+            version = self.shared_cache.get(self.VERSION_KEY)
+        return version
+
+    def _load(self):
+        """
+        Returns the mappings from prefixes to URIs and from URIs to prefixes, loading them if necessary.
+        """
+        with self._lock:
+            now = time.time()
+            if self._uris is not None and now - self._checked < self.check_interval:
+                return self._uris, self._prefixes
+
+            version = self._get_version()
+            if self._uris is not None and version == self._version:
+                self._checked = now
+                return self._uris, self._prefixes
+
+            uris = dict(models.NamespaceModel.objects.values_list('prefix', 'uri'))
+            prefixes = dict((uri, prefix) for prefix, uri in uris.items())
+            if not transaction.is_dirty():
+                self._uris, self._prefixes, self._version, self._checked = uris, prefixes, version, now
+            return uris, prefixes
+
+    def get_uri(self, prefix):
+        """
+        Returns the URI of the namespace with a prefix, or None if there is no such namespace.
+        """
+        return self._load()[0].get(prefix)
+
+    def get_prefix(self, uri):
+        """
+        Returns the prefix of the namespace with a URI, or None if there is no such namespace.
+        """
+        return self._load()[1].get(unicode(uri))
+
+    def items(self):
+        """
+        Returns the prefixes and URIs of all namespaces.
+        """
+        return self._load()[0].items()
+
+    def invalidate(self):
+        """
+        Discards the cached namespaces in all processes.
+        """
+        with self._lock:
+            self._uris = self._prefixes = None
+            self.shared_cache.set(self.VERSION_KEY, uuid.uuid4().hex, self.VERSION_TIMEOUT)
+
+
+class ResultCache(object):
+    """
+    Read-through cache of the triples that match a triple pattern, stored in a Django cache.
+
+    Entries are keyed by the pattern and by the generation of the named graph it is read from, or the
+    global generation for patterns over all named graphs. Writing to a named graph moves it and the
+    global generation to a new, random value, which makes all entries of the previous generations
+    unreachable; they are evicted by the cache backend in due time.
+
+    Patterns that match more than max_triples triples are not cached, and neither are patterns read while
+    the current transaction has pending changes. The hit and miss statistics are kept per process.
+
+    Until a write is committed, other processes still read the old triples, and may cache them in the new
+    generations. Writes within a managed transaction therefore start new generations again once the
+    transaction has ended; see invalidate_on_commit().
+    """
+
+    #: The prefix of the keys in the shared cache.
+    KEY_PREFIX = 'rdflib_django.results'
+
+    #: The time in seconds that the shared cache keeps the generations.
+    GENERATION_TIMEOUT = 30 * 24 * 60 * 60
+
+    def __init__(self, shared_cache, max_triples, timeout=None):
+        self.shared_cache = shared_cache
+        self.max_triples = max_triples
+        self.timeout = timeout
+        self._stats = dict.fromkeys(('hits', 'misses', 'sets', 'invalidations'), 0)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _count(self, name):
+        """
+        Increments a statistic.
+        """
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get_generation_key(self, named_graph_id):
+        """
+        Returns the key of the generation of a named graph, or of the global generation if named_graph_id is None.
+        """
+        return "{0}.generation.{1}".format(self.KEY_PREFIX, 'all' if named_graph_id is None else named_graph_id)
+
+    def get_generation(self, named_graph_id):
+        """
+        Returns the current generation of a named graph, or the global generation if named_graph_id is None.
+        """
+        key = self._get_generation_key(named_graph_id)
+        generation = self.shared_cache.get(key)
+        if generation is None:
+            self.shared_cache.add(key, uuid.uuid4().hex, self.GENERATION_TIMEOUT)
+            generation = self.shared_cache.get(key)
+        return generation
+
+    def _get_entry_key(self, generation, pattern, named_graph_id):
+        """
+        Returns the key of the entry for a pattern in a generation.
+        """
+        parts = [generation, unicode(named_graph_id)]
+        parts.extend(term.n3() if hasattr(term, 'n3') else unicode(term) for term in pattern)
+        return "{0}.{1}".format(self.KEY_PREFIX, hashlib.sha1(u"\0".join(parts).encode('utf-8')).hexdigest())
+
+    def read_through(self, pattern, named_graph_id, triples):
+        """
+        Returns the cached triples for a pattern over a named graph, or over all named graphs if
+        named_graph_id is None. If they are not cached, returns an iterator over triples that caches
+        them once it has been exhausted.
+        """
+        if not transaction.is_dirty():
+            self.invalidate_pending()
+        generation = self.get_generation(named_graph_id)
+        key = self._get_entry_key(generation, pattern, named_graph_id)
+        cached = self.shared_cache.get(key)
+        if cached is not None:
+            self._count('hits')
+            return iter(cached)
+
+        self._count('misses')
+        return self._store(key, triples)
+
+    def _store(self, key, triples):
+        """
+        Yields triples, and caches them under key afterwards if there are not too many of them.
+        """
+        collected = []
+        for triple in triples:
+            yield triple
+            if collected is not None:
+                collected.append(triple)
+                if len(collected) > self.max_triples:
+                    collected = None
+
+        if collected is not None and not transaction.is_dirty():
+            self.shared_cache.set(key, collected, self.timeout)
+            self._count('sets')
+
+    def invalidate(self, named_graph_ids):
+        """
+        Starts new generations for named graphs, and a new global generation.
+        """
+        keys = [self._get_generation_key(named_graph_id) for named_graph_id in set(named_graph_ids)]
+        keys.append(self._get_generation_key(None))
+        self.shared_cache.set_many(dict((key, uuid.uuid4().hex) for key in keys), self.GENERATION_TIMEOUT)
+        self._count('invalidations')
+
+    def invalidate_on_commit(self, named_graph_ids):
+        """
+        Starts new generations for named graphs that have been written to, and, if the current transaction
+        is managed, does so again by invalidate_pending() once the transaction has ended.
+        """
+        self.invalidate(named_graph_ids)
+        if transaction.is_managed():
+            if not hasattr(self._local, 'pending'):
+                self._local.pending = set()
+            self._local.pending.update(named_graph_ids)
+
+    def invalidate_pending(self):
+        """
+        Starts new generations for the named graphs written to by the transactions of the current thread
+        that have ended, so that the triples other processes cached before the commit are not used.
+
+        This is called when a store transaction ends, when a request has finished, and when the current
+        thread reads through the cache outside a transaction with pending changes. Callers that commit a
+        managed transaction themselves can call it to make the commit visible at once.
+        """
+        pending = getattr(self._local, 'pending', None)
+        if pending:
+            self._local.pending = set()
+            self.invalidate(pending)
+
+    def stats(self):
+        """
+        Returns the number of hits, misses, cached patterns and invalidations in this process, and the
+        ratio of lookups that were hits.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        """
+        Resets the statistics to zero.
+        """
+        with self._lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+
+
+#: The Django cache that is shared by all processes.
+shared_cache = get_cache(getattr(settings, 'DJANGO_RDFLIB_CACHE', 'default'))
+
+#: Maps the identifiers of named graphs to their primary keys.
+named_graphs = NamedGraphCache(getattr(settings, 'DJANGO_RDFLIB_NAMED_GRAPH_CACHE_SIZE', 1000), shared_cache,
+                               getattr(settings, 'DJANGO_RDFLIB_NAMED_GRAPH_CHECK_INTERVAL', 1.0))
+
+#: Maps the keys of terms in the term dictionary to their primary keys.
+terms = LRUCache(getattr(settings, 'DJANGO_RDFLIB_TERM_CACHE_SIZE', 10000))
+
+#: Maps the prefixes of namespaces to their URIs and back.
+namespaces = NamespaceCache(shared_cache, getattr(settings, 'DJANGO_RDFLIB_NAMESPACE_CHECK_INTERVAL', 1.0))
+
+#: Caches the triples that match triple patterns; used by stores if DJANGO_RDFLIB_RESULT_CACHE is True.
+results = ResultCache(shared_cache,
+                      getattr(settings, 'DJANGO_RDFLIB_RESULT_CACHE_MAX_TRIPLES', 1000),
+                      getattr(settings, 'DJANGO_RDFLIB_RESULT_CACHE_TIMEOUT', None))
+
+
+def _invalidate_named_graph(sender, instance, created=False, **kwargs):  # pylint: disable=W0613
+    """
+    Removes a named graph from the cache after it has been saved or deleted.
+
+    The identifier of a saved graph may have changed, so entries pointing to its primary key are removed as well.
+    Other processes are told to discard their cached primary keys, unless the graph has just been created.
+    """
+    if not created:
+        named_graphs.invalidate()
+        return
+
+    named_graphs.pop(instance.identifier)
+    for identifier, pk in named_graphs.items():
+        if pk == instance.pk:
+            named_graphs.pop(identifier)
+
+
+def _invalidate_named_graph_results(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Starts a new generation of cached results for a named graph that has been deleted, since its
+    primary key may be reused.
+    """
+    results.invalidate_on_commit([instance.pk])
+
+
+post_save.connect(_invalidate_named_graph, sender=models.NamedGraph)
+post_delete.connect(_invalidate_named_graph, sender=models.NamedGraph)
+post_delete.connect(_invalidate_named_graph_results, sender=models.NamedGraph)
+
+
+def _invalidate_pending_results(sender, **kwargs):  # pylint: disable=W0613
+    """
+    Starts new generations of cached results for the named graphs written to during a request.
+    """
+    results.invalidate_pending()
+
+
+request_finished.connect(_invalidate_pending_results, dispatch_uid='rdflib_django.caches.invalidate_pending_results')
+
+
+def _invalidate_term(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Removes a term from the cache after it has been deleted.
+    """
+    terms.pop(instance.key)
+
+
+post_delete.connect(_invalidate_term, sender=models.Term)
+
+
+def _invalidate_namespaces(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Discards the cached namespaces after a namespace has been saved or deleted.
+    """
+    namespaces.invalidate()
+
+
+post_save.connect(_invalidate_namespaces, sender=models.NamespaceModel)
+post_delete.connect(_invalidate_namespaces, sender=models.NamespaceModel)
@@ -0,0 +1,154 @@
+"""
+Maintained statement counts for the DjangoStore.
+
+Counting the statements in a context, or the distinct triples in the store, requires a scan over
+the statement tables. Instead, the DjangoStore keeps a TripleCount per context and one for the
+whole store, and updates them in the same transaction as the statements.
+
+The count of a context is created together with its named graph, and the count of the store is
+created by a post_syncdb handler, so reading a count never writes. When a count is missing, for
+instance because the store was filled before counts were maintained, it is calculated from the
+statement tables on every read until syncdb creates it. Use recount() or the rdf_recount command to
+recalculate all counts if they have drifted, for instance after deleting named graphs directly.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from rdflib_django import models
+
+
+#: The statement models whose statements are counted.
+COUNTED_MODELS = (models.URIStatement, models.LiteralStatement)
+
+
+def count_statements(named_graph_id, using=None):
+    """
+    Counts the statements in a named graph using the statement tables.
+    """
+    return sum(model.objects.using(using).filter(context_id=named_graph_id).count() for model in COUNTED_MODELS)
+
+
+def count_triples(using=None):
+    """
+    Counts the distinct triples in the store using the statement tables.
+    """
+    return sum(model.objects.using(using).values('triple_key').distinct().count() for model in COUNTED_MODELS)
+
+
+def _get_count(named_graph_id, calculate, using=None):
+    """
+    Returns the maintained count for a named graph, or for the whole store if named_graph_id is None.
+
+    A missing count is calculated, but not stored: concurrent readers would store it more than once.
+    """
+    query_set = models.TripleCount.objects.using(using)
+    query_set = query_set.filter(context_id=named_graph_id) if named_graph_id is not None \
+        else query_set.filter(context__isnull=True)
+
+    found = query_set.values_list('count', flat=True)[:1]
+    if found:
+        return found[0]
+
+    return calculate()
+
+
+def get_statement_count(named_graph_id, using=None):
+    """
+    Returns the number of statements in a named graph, read from the database with alias using.
+    """
+    return _get_count(named_graph_id, lambda: count_statements(named_graph_id, using), using)
+
+
+def get_triple_count(using=None):
+    """
+    Returns the number of distinct triples in the store, read from the database with alias using.
+    """
+    return _get_count(None, lambda: count_triples(using), using)
+
+
+def create_count(named_graph_id):
+    """
+    Creates the count of a new, empty named graph.
+    """
+    models.TripleCount.objects.create(context_id=named_graph_id, count=0)
+
+
+def lock_triple_count():
+    """
+    Locks the count of the store until the end of the current transaction.
+
+    Writers take this lock before they determine how many triples they add to or remove from
+    the store, so concurrent writers of the same triple do not both count it.
+    """
+    list(models.TripleCount.objects.select_for_update().filter(context__isnull=True).values_list('id', flat=True))
+
+
+def count_new_triples(model, inserted):
+    """
+    Counts the triples that are new to the store after inserting them in the current transaction.
+
+    Inserted maps the triple keys of statements of a model that were not stored before the insert
+    to the primary keys of the named graphs they were inserted in. A triple is not new if another
+    transaction has stored it in another named graph in the meantime. The count of the store must be
+    locked, so that the statements of concurrent writers are either committed or not counted yet.
+    """
+    stored_elsewhere = set(
+        key for key, named_graph_id in model.objects.select_for_update().filter(
+            triple_key__in=inserted.keys()).values_list('triple_key', 'context_id')
+        if named_graph_id not in inserted[key])
+    return len(inserted) - len(stored_elsewhere)
+
+
+def update_counts(deltas, triple_delta):
+    """
+    Updates the maintained counts.
+
+    The deltas map the primary keys of named graphs to the change in their number of statements;
+    triple_delta is the change in the number of distinct triples. Missing counts are left alone,
+    as they are calculated from scratch when needed.
+    """
+    for named_graph_id, delta in deltas.items():
+        if delta:
+            models.TripleCount.objects.filter(context_id=named_graph_id).update(count=F('count') + delta)
+    if triple_delta:
+        models.TripleCount.objects.filter(context__isnull=True).update(count=F('count') + triple_delta)
+
+
+def get_unique_to_context(query_set):
+    """
+    Restricts a query set of statements to the statements whose triple is not stored in any other context.
+    """
+    qn = connection.ops.quote_name
+    table = qn(query_set.model._meta.db_table)  # pylint: disable=W0212
+    return query_set.extra(where=[
+        "NOT EXISTS (SELECT 1 FROM {0} other WHERE other.{1} = {0}.{1} AND other.{2} <> {0}.{2})".format(
+            table, qn('triple_key'), qn('context_id'))
+    ])
+
+
+def recount():
+    """
+    Recalculates all maintained counts from the statement tables.
+    """
+    models.TripleCount.objects.all().delete()
+    for named_graph_id in models.NamedGraph.objects.values_list('id', flat=True):
+        models.TripleCount.objects.create(context_id=named_graph_id, count=count_statements(named_graph_id))
+    models.TripleCount.objects.create(context=None, count=count_triples())
+
+
+def create_missing_counts(created_models, db, verbosity=1, **kwargs):  # pylint: disable=W0613
+    """
+    Creates the counts that are missing, calculated from the statement tables: the count of the store,
+    and those of the named graphs that were created before counts were maintained.
+
+    This is a post_syncdb handler, so the count of the store is created once, before the store is used.
+    """
+    counted = models.TripleCount.objects.using(db)
+    if not counted.filter(context__isnull=True).exists():
+        if verbosity >= 2:
+            print("Creating the triple count of the store")
+        counted.create(context=None, count=count_triples(using=db))
+
+    missing = models.NamedGraph.objects.using(db).filter(triplecount__isnull=True).values_list('id', flat=True)
+    for named_graph_id in missing:
+        counted.create(context_id=named_graph_id, count=count_statements(named_graph_id, using=db))
+    transaction.commit_unless_managed(using=db)
@@ -0,0 +1,214 @@
+"""
+Non-blocking access to a store, for servers that cannot wait for the database.
+
+A StoreExecutor runs the operations of a store in a pool of worker threads. The a-prefixed
+methods return immediately: aadd_n, alen and acontexts return an AsyncResult of the standard
+multiprocessing.pool module, and atriples returns a TripleStream that yields the matching triples
+in chunks while a worker reads them from the database.
+
+A TripleStream holds at most prefetch chunks that have not been consumed; while the consumer is
+slower than the database, the worker waits instead of buffering the whole result. Consumers that
+cannot block can poll a stream with a timeout. A stream that is abandoned before its end is closed
+when it is garbage collected, which releases its worker.
+
+>>> import rdflib
+>>> from rdflib.term import URIRef
+>>> from rdflib.namespace import RDF
+>>> g = rdflib.Graph('Django')
+>>> executor = StoreExecutor(g.store, workers=1)
+>>> executor.aadd_n([(URIRef('http://zoowizard.org/resource/Artis'), RDF.type, URIRef('http://schema.org/Zoo'), g)]).get()
+>>> executor.alen(g).get()
+1
+>>> [len(chunk) for chunk in executor.atriples((None, None, None), g)]
+[1]
+>>> executor.close()
+
+Every operation uses the database connection of its worker thread, which is closed afterwards.
+With SQLite, the workers can only share a database that is stored in a file.
+"""
+import Queue
+from multiprocessing.pool import ThreadPool
+import sys
+import threading
+from django.db import connections
+from rdflib_django.store import _chunks
+
+
+#: The number of worker threads of an executor, if not specified.
+DEFAULT_WORKERS = 4
+
+#: The number of chunks that a stream reads ahead of its consumer, if not specified.
+DEFAULT_PREFETCH = 2
+
+#: The time in seconds after which a blocked worker checks whether its stream has been closed.
+POLL_INTERVAL = 0.1
+
+#: Marks the end of a stream.
+_END = object()
+
+
+def _call(function, args, kwargs):
+    """
+    Calls a function in a worker thread, and closes the database connections of the thread afterwards.
+    """
+    try:
+        return function(*args, **kwargs)  # pylint: disable=W0142
+    finally:
+        for connection in connections.all():
+            connection.close()
+
+
+class _Failure(object):
+    """
+    The exception that ended a stream.
+    """
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class _Channel(object):
+    """
+    The queue between the worker that produces a stream and its TripleStream.
+
+    The worker only holds the channel, not the TripleStream, so that the consumer can drop the
+    stream at any time and its garbage collection closes the channel.
+    """
+
+    def __init__(self, prefetch):
+        assert prefetch > 0
+        self.queue = Queue.Queue(prefetch)
+        self.closed = threading.Event()
+
+    def produce(self, items, chunk_size):
+        """
+        Puts the items of an iterable into the channel in chunks of chunk_size items. Called by the worker.
+        """
+        try:
+            for chunk in _chunks(items, chunk_size):
+                if not self._put(chunk):
+                    return
+            self._put(_END)
+        except Exception:  # pylint: disable=W0703
+            self._put(_Failure(sys.exc_info()))
+
+    def _put(self, item):
+        """
+        Waits until the item can be put into the channel. Returns False if the channel has been closed.
+        """
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+
+class TripleStream(object):
+    """
+    Iterator over the chunks of a result that is produced by a worker thread.
+
+    The worker blocks while prefetch chunks are waiting to be consumed. Closing the stream, or
+    dropping the last reference to it, makes the worker stop at the next chunk.
+    """
+
+    def __init__(self, channel):
+        self._channel = channel
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def next(self, timeout=None):
+        """
+        Returns the next chunk, waiting at most timeout seconds if it is given. Raises Queue.Empty
+        if no chunk arrives in time, StopIteration at the end of the stream, and the exception of
+        the worker if it failed.
+        """
+        if self._finished:
+            raise StopIteration
+
+        item = self._channel.queue.get(timeout=timeout)
+        if item is _END:
+            self._finished = True
+            raise StopIteration
+        if isinstance(item, _Failure):
+            self._finished = True
+            raise item.exc_info[0], item.exc_info[1], item.exc_info[2]
+        return item
+
+    def close(self):
+        """
+        Stops the stream; the worker stops reading at the next chunk.
+        """
+        self._channel.closed.set()
+        self._finished = True
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StoreExecutor(object):
+    """
+    Runs the operations of a store in a pool of worker threads.
+    """
+
+    def __init__(self, store, workers=DEFAULT_WORKERS, prefetch=DEFAULT_PREFETCH):
+        self.store = store
+        self.prefetch = prefetch
+        self._pool = ThreadPool(workers)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Calls a function in a worker thread, and returns its AsyncResult.
+        """
+        return self._pool.apply_async(_call, (function, args, kwargs))
+
+    def stream(self, function, chunk_size, *args, **kwargs):
+        """
+        Calls a function that returns an iterable in a worker thread, and returns a TripleStream of its items.
+        The stream occupies the worker until it has been consumed, closed or garbage collected.
+        """
+        channel = _Channel(self.prefetch)
+        self.submit(lambda: channel.produce(function(*args, **kwargs), chunk_size))  # pylint: disable=W0142
+        return TripleStream(channel)
+
+    def atriples(self, (s, p, o), context=None, chunk_size=None):
+        """
+        Returns a TripleStream of the triples that match a pattern, in chunks of chunk_size triples,
+        which defaults to the batch size of the store.
+        """
+        triples = lambda: (triple for triple, _ in self.store.triples((s, p, o), context))
+        return self.stream(triples, chunk_size or self.store.batch_size)
+
+    def aadd_n(self, quads):
+        """
+        Adds a sequence of quads to the store.
+        """
+        return self.submit(self.store.addN, list(quads))
+
+    def alen(self, context=None):
+        """
+        Returns the number of statements in a context, or in the store.
+        """
+        return self.submit(self.store.__len__, context)
+
+    def acontexts(self):
+        """
+        Returns a list of the contexts in the store.
+        """
+        return self.submit(lambda: list(self.store.contexts()))
+
+    def close(self):
+        """
+        Waits for the submitted operations to finish, and stops the worker threads.
+        """
+        self._pool.close()
+        self._pool.join()
@@ -3,11 +3,44 @@ Custom fields for storing RDF primitives.
 
 Based on http://blog.elsdoerfer.name/2008/01/08/fuzzydates-or-one-django-model-field-multiple-database-columns/
 """
+import datetime
+from decimal import Decimal
+import hashlib
+import math
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from rdflib.graph import Graph
+from rdflib.namespace import XSD
 from rdflib.term import BNode, URIRef, Literal
 
 
+def deserialize_literal(value):
+    """
+    Deserialize a representation of a Literal.
+    """
+    if not value:
+        return None
+
+    if isinstance(value, Literal):
+        return value
+
+    parts = value.rsplit('^^', 2)
+    if len(parts) != 3:
+        raise ValueError("Wrong value: {0}".format(value))
+    return Literal(parts[0], parts[1] or None, parts[2] or None)
+
+
+def serialize_literal(value):
+    """
+    Serialize a Literal, including its language and datatype.
+    """
+    if not isinstance(value, Literal):
+        raise TypeError("Value {0} has the wrong type: {1}".format(value, value.__class__))
+
+    return unicode(value) + "^^" + (value.language or '') + "^^" + (value.datatype or '')
+
+
 class LiteralField(models.TextField):
     """
     Custom field for storing literals.
@@ -17,26 +50,14 @@ class LiteralField(models.TextField):
     description = "Field for storing Literals, including their type and language"
 
     def to_python(self, value):
-        if not value:
-            return None
-
-        if isinstance(value, Literal):
-            return value
-
-        parts = value.split('^^')
-        if len(parts) != 3:
-            raise ValueError("Wrong value: {0}".format(value))
-        return Literal(parts[0], parts[1] or None, parts[2] or None)
+        return deserialize_literal(value)
 
     def value_to_string(self, obj):
         value = self._get_val_from_obj(obj)
         return self.get_prep_value(value)
 
     def get_prep_value(self, value):
-        if not isinstance(value, Literal):
-            raise TypeError("Value {0} has the wrong type: {1}".format(value, value.__class__))
-
-        return unicode(value) + "^^" + (value.language or '') + "^^" + (value.datatype or '')
+        return serialize_literal(value)
 
 
 def deserialize_uri(value):
@@ -115,3 +136,244 @@ class GraphReferenceField(models.CharField):
             return serialize_uri(value.identifier)
 
         return serialize_uri(value)
+
+
+def serialize_object(value):
+    """
+    Serialize the object of a statement as a tuple of the values that identify it: the serialized
+    URIRef or BNode, or the lexical form, language and datatype of a Literal.
+    """
+    if isinstance(value, Literal):
+        return unicode(value), value.language or u'', value.datatype or u''
+    return serialize_uri(value),
+
+
+def triple_key(subject, predicate, obj):
+    """
+    Calculates the key of a triple from its serialized subject and predicate, and the serialized
+    values of its object as returned by serialize_object.
+
+    The values are hashed separately, so a lexical form that contains a separator such as ``^^``
+    does not collide with a literal with another language or datatype.
+    """
+    return hashlib.sha1(u"\0".join((subject, predicate) + tuple(obj)).encode('utf-8')).hexdigest()
+
+
+def statement_key(key_of_triple, context_id):
+    """
+    Calculates the key of a statement from the key of its triple and the primary key of its context.
+    """
+    return hashlib.sha1(u"{0}\0{1}".format(key_of_triple, context_id).encode('utf-8')).hexdigest()
+
+
+def _get_triple_key(model_instance):
+    """
+    Calculates the key of the triple of a statement.
+    """
+    subject, predicate, obj = model_instance.as_triple()
+    return triple_key(serialize_uri(subject), serialize_uri(predicate), serialize_object(obj))
+
+
+class TripleKeyField(models.CharField):
+    """
+    Field containing the hash of the triple of a statement, which is calculated whenever the statement is saved.
+
+    Statements of the same triple in different contexts have the same triple key.
+    """
+
+    description = "Field for storing the hash of a triple"
+
+    def __init__(self, *args, **kwargs):
+        kwargs['max_length'] = 40
+        kwargs['editable'] = False
+        kwargs['blank'] = True
+        super(TripleKeyField, self).__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = _get_triple_key(model_instance)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class StatementKeyField(models.CharField):
+    """
+    Primary key field for statements, containing the hash of the statement.
+
+    The key is calculated whenever the statement is saved; a statement is therefore identified by its
+    subject, predicate, object and context, and storing the same statement twice yields the same key.
+    The context is included by its primary key rather than its identifier, so the key remains valid
+    when a named graph is renamed.
+    """
+
+    description = "Field for storing the hash of a statement"
+
+    def __init__(self, *args, **kwargs):
+        kwargs['max_length'] = 40
+        kwargs['editable'] = False
+        kwargs['blank'] = True
+        super(StatementKeyField, self).__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = statement_key(_get_triple_key(model_instance), model_instance.context_id)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class TypedValueField(object):
+    """
+    Mixin for the typed shadow columns of a LiteralStatement.
+
+    A typed value field stores the value of the object of the statement as a native database type,
+    if the datatype of the object is one of the datatypes of the field and its lexical form is valid.
+    Otherwise, the field is empty. The value is calculated whenever the statement is saved.
+    """
+
+    #: The datatypes of the literals whose value is stored.
+    datatypes = ()
+
+    #: The Python types of the values that can be compared with the stored values.
+    python_types = ()
+
+    def __init__(self, *args, **kwargs):
+        kwargs['null'] = True
+        kwargs['blank'] = True
+        kwargs['editable'] = False
+        super(TypedValueField, self).__init__(*args, **kwargs)
+
+    def accepts(self, value):
+        """
+        Returns whether a value can be compared with the values of this field.
+        """
+        return isinstance(value, self.python_types)
+
+    def to_value(self, literal):
+        """
+        Converts a Literal to the value stored in this field, or None if it has no such value.
+        """
+        if literal.datatype not in self.datatypes:
+            return None
+        try:
+            value = literal.toPython()
+        except (ValueError, TypeError, ArithmeticError):
+            return None
+        return self.from_python(value) if self.accepts(value) else None
+
+    def from_python(self, value):
+        """
+        Converts a Python value that is accepted by this field to the value stored in this field.
+        """
+        return value
+
+    def to_lookup(self, lookup, value):
+        """
+        Returns the lookup and stored value that compare the values of this field with a Python value
+        that is accepted by this field, for the lookups exact, gt, gte, lt and lte.
+        Raises a ValueError if the comparison cannot be expressed in stored values.
+        """
+        return lookup, self.from_python(value)
+
+    def pre_save(self, model_instance, add):
+        value = self.to_value(model_instance.as_triple()[2])
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def _is_exact_double(value, number):
+    """
+    Returns whether the double precision number converted from a numeric value is that value: a float is
+    a double, and other values must equal the shortest decimal representation of their double.
+    """
+    return isinstance(value, float) or Decimal(repr(number)) == Decimal(value)
+
+
+class NumericValueField(TypedValueField, models.FloatField):
+    """
+    Shadow column storing the value of a numeric literal as a double precision number.
+
+    Only values that a double represents exactly are stored, so that every stored value compares and
+    orders like the value of its literal. Integers beyond 2**53 and decimals with more significant
+    digits than a double holds are left out, like literals with an invalid lexical form.
+    """
+
+    description = "Field for storing the value of numeric literals"
+    datatypes = frozenset(URIRef(XSD + name) for name in (
+        'decimal', 'integer', 'nonPositiveInteger', 'negativeInteger', 'long', 'int', 'short', 'byte',
+        'nonNegativeInteger', 'unsignedLong', 'unsignedInt', 'unsignedShort', 'unsignedByte',
+        'positiveInteger', 'float', 'double'))
+    python_types = (int, long, float, Decimal)
+
+    def accepts(self, value):
+        return super(NumericValueField, self).accepts(value) and not isinstance(value, bool)
+
+    def from_python(self, value):
+        number = float(value)
+        if math.isinf(number) or math.isnan(number) or not _is_exact_double(value, number):
+            return None
+        return number
+
+    def to_lookup(self, lookup, value):
+        """
+        Compares the stored values with a bound that a double may not represent exactly.
+
+        The only stored value that rounds to the same double as such a bound is the shortest decimal
+        representation of that double, so the lookup includes or excludes that double depending on
+        whether its value lies within the range.
+        """
+        number = float(value)
+        if math.isinf(number) or math.isnan(number):
+            raise ValueError("Cannot compare {0} with the values of {1}".format(value, self.name))
+        if _is_exact_double(value, number):
+            return lookup, number
+        if lookup == 'exact':
+            raise ValueError("No value of {0} equals {1}".format(self.name, value))
+
+        rounded_up = Decimal(repr(number)) > Decimal(value)
+        if lookup in ('gt', 'gte'):
+            return ('gte' if rounded_up else 'gt'), number
+        return ('lt' if rounded_up else 'lte'), number
+
+
+class BooleanValueField(TypedValueField, models.NullBooleanField):
+    """
+    Shadow column storing the value of a boolean literal.
+    """
+
+    description = "Field for storing the value of boolean literals"
+    datatypes = frozenset([URIRef(XSD + 'boolean')])
+    python_types = (bool,)
+
+    def to_value(self, literal):
+        if literal.datatype not in self.datatypes:
+            return None
+        return {u'true': True, u'1': True, u'false': False, u'0': False}.get(unicode(literal).strip())
+
+
+class DateValueField(TypedValueField, models.DateField):
+    """
+    Shadow column storing the value of a date literal.
+    """
+
+    description = "Field for storing the value of date literals"
+    datatypes = frozenset([URIRef(XSD + 'date')])
+    python_types = (datetime.date,)
+
+    def accepts(self, value):
+        return super(DateValueField, self).accepts(value) and not isinstance(value, datetime.datetime)
+
+
+class DateTimeValueField(TypedValueField, models.DateTimeField):
+    """
+    Shadow column storing the value of a dateTime literal.
+
+    Values with a timezone are stored in UTC; values without a timezone are taken to be in UTC.
+    """
+
+    description = "Field for storing the value of dateTime literals"
+    datatypes = frozenset([URIRef(XSD + 'dateTime')])
+    python_types = (datetime.datetime,)
+
+    def from_python(self, value):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+            return value if settings.USE_TZ else value.replace(tzinfo=None)
+        return value.replace(tzinfo=timezone.utc) if settings.USE_TZ else value
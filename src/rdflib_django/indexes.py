@@ -0,0 +1,250 @@
+"""
+Composite indexes over the statement tables.
+
+Every statement table is indexed using the standard permutations of a triple store: SPOC,
+POS(C) and OSP(C) for queries over all contexts, and CSPO, CPOS and COSP for queries within
+a single named graph. Each index contains all four columns, so the indexes cover the columns of
+a triple pattern lookup. For statement models without a hash-based primary key, the SPOC index
+is unique and enforces that a triple is only stored once per context.
+
+For every triple pattern, choose_index returns the index with the longest prefix of bound columns.
+This results in the following mapping, where a bound position is marked by its letter and an
+unbound position by a dash. Where several indexes have the same prefix, such as the context-leading
+indexes for ``---C``, they are equally suitable and the database may use either of them.
+
+=========  =========    =========  =========
+Pattern    Index        Pattern    Index
+=========  =========    =========  =========
+``---``    full scan    ``---C``   cspo
+``S--``    spoc         ``S--C``   cspo
+``-P-``    pos          ``-P-C``   cpos
+``--O``    osp          ``--OC``   cosp
+``SP-``    spoc         ``SP-C``   cspo
+``-PO``    pos          ``-POC``   cpos
+``S-O``    osp          ``S-OC``   cosp
+``SPO``    spoc         ``SPOC``   spoc
+=========  =========    =========  =========
+
+>>> choose_index(subject=False, predicate=True, object=True, context=False)
+'pos'
+>>> choose_index(subject=True, predicate=False, object=True, context=True)
+'cosp'
+>>> choose_index(subject=False, predicate=False, object=False, context=False) is None
+True
+
+On the table of LiteralStatements, the object of every index consists of the lexical form, language
+and datatype of the literal. That table has two more indexes, which serve patterns that constrain
+the language or datatype of the literals of a predicate: plso for ``-P-`` and ``SP-`` with a given
+language, and pdos for ``-P-`` with a given datatype. Finally, there is an index on the values of the
+literals of a predicate for every typed shadow column, which serves range queries and ordering by value;
+get_range_index returns the index for a typed value field.
+
+>>> choose_index(subject=False, predicate=True, object=False, context=False, language=True)
+'plso'
+
+The indexes are created by a post_syncdb handler when the statement tables are created.
+"""
+from django.db import connections, transaction
+from django.db.utils import DatabaseError
+from rdflib_django import models
+from rdflib_django.fields import StatementKeyField
+
+
+SUBJECT, PREDICATE, OBJECT, CONTEXT = 'subject', 'predicate', 'object', 'context'
+LANGUAGE, DATATYPE = 'language', 'datatype'
+NUMERIC_VALUE, BOOLEAN_VALUE, DATE_VALUE, DATETIME_VALUE = 'numeric_value', 'boolean_value', 'date_value', 'datetime_value'
+
+#: The composite indexes on every statement table, as tuples of (name, fields, unique).
+#: Uniqueness is only enforced for models that do not use a StatementKeyField as primary key.
+STATEMENT_INDEXES = (
+    ('spoc', (SUBJECT, PREDICATE, OBJECT, CONTEXT), True),
+    ('pos', (PREDICATE, OBJECT, SUBJECT, CONTEXT), False),
+    ('osp', (OBJECT, SUBJECT, PREDICATE, CONTEXT), False),
+    ('cspo', (CONTEXT, SUBJECT, PREDICATE, OBJECT), False),
+    ('cpos', (CONTEXT, PREDICATE, OBJECT, SUBJECT), False),
+    ('cosp', (CONTEXT, OBJECT, SUBJECT, PREDICATE), False),
+)
+
+#: The additional indexes on the table of LiteralStatements.
+LITERAL_INDEXES = (
+    ('plso', (PREDICATE, LANGUAGE, SUBJECT, OBJECT, CONTEXT), False),
+    ('pdos', (PREDICATE, DATATYPE, OBJECT, SUBJECT, CONTEXT), False),
+    ('pnumeric', (PREDICATE, NUMERIC_VALUE, SUBJECT, OBJECT, CONTEXT), False),
+    ('pboolean', (PREDICATE, BOOLEAN_VALUE, SUBJECT, OBJECT, CONTEXT), False),
+    ('pdate', (PREDICATE, DATE_VALUE, SUBJECT, OBJECT, CONTEXT), False),
+    ('pdatetime', (PREDICATE, DATETIME_VALUE, SUBJECT, OBJECT, CONTEXT), False),
+)
+
+#: The database vendors that support CREATE INDEX IF NOT EXISTS.
+IF_NOT_EXISTS_VENDORS = ('sqlite', 'postgresql')
+
+#: The models that are indexed using the STATEMENT_INDEXES.
+STATEMENT_MODELS = (models.URIStatement, models.LiteralStatement, models.TermStatement)
+
+
+def get_indexes(model):
+    """
+    Returns the composite indexes on the table of a statement model.
+    """
+    if model is models.LiteralStatement:
+        return STATEMENT_INDEXES + LITERAL_INDEXES
+    return STATEMENT_INDEXES
+
+
+def get_model_fields(model, fields):
+    """
+    Returns the model fields that store the given fields of a statement model, in order.
+
+    The object of a LiteralStatement is stored as its lexical form, language and datatype.
+    """
+    if model is not models.LiteralStatement:
+        return tuple(fields)
+
+    result = []
+    for field in fields:
+        result.append(field)
+        if field == OBJECT:
+            result.extend(extra for extra in (LANGUAGE, DATATYPE) if extra not in fields)
+    return tuple(result)
+
+
+def choose_index(subject, predicate, object, context, language=False, datatype=False):  # pylint: disable=W0622
+    """
+    Returns the name of the index that serves a triple pattern, given which of its positions are bound.
+    For patterns over literals, the language or datatype of the object may be bound without the object.
+
+    Returns None if no index applies and the pattern requires a full scan.
+    """
+    candidates = STATEMENT_INDEXES + (LITERAL_INDEXES if language or datatype else ())
+
+    best_name, best_prefix = None, 0
+    for name, _, _ in candidates:
+        prefix = get_bound_prefix(name, subject, predicate, object, context, language, datatype)
+        if prefix > best_prefix:
+            best_name, best_prefix = name, prefix
+    return best_name
+
+
+def get_range_index(field):
+    """
+    Returns the name of the index on the values of a typed value field of LiteralStatements.
+
+    >>> get_range_index('date_value')
+    'pdate'
+    """
+    for name, fields, _ in LITERAL_INDEXES:
+        if fields[:2] == (PREDICATE, field):
+            return name
+    raise ValueError("No index on {0}".format(field))
+
+
+def get_index_fields(name):
+    """
+    Returns the fields of the named index, in index order.
+    """
+    return dict((index[0], index[1]) for index in STATEMENT_INDEXES + LITERAL_INDEXES)[name]
+
+
+def _get_bound(subject, predicate, object, context, language, datatype):  # pylint: disable=W0622
+    """
+    Returns which fields are bound by a triple pattern. A bound object also binds its language and datatype.
+    Typed values are never bound by a triple pattern.
+    """
+    bound = dict.fromkeys((NUMERIC_VALUE, BOOLEAN_VALUE, DATE_VALUE, DATETIME_VALUE), False)
+    bound.update({SUBJECT: subject, PREDICATE: predicate, OBJECT: object, CONTEXT: context,
+                  LANGUAGE: language or object, DATATYPE: datatype or object})
+    return bound
+
+
+def get_bound_prefix(name, subject, predicate, object, context,  # pylint: disable=W0622
+                     language=False, datatype=False, model=None):
+    """
+    Returns the number of leading columns of the named index that are bound by a triple pattern.
+    If a statement model is given, the columns of the index on the table of that model are counted.
+    """
+    bound = _get_bound(subject, predicate, object, context, language, datatype)
+    fields = get_model_fields(model, get_index_fields(name))
+
+    prefix = 0
+    while prefix < len(fields) and bound[fields[prefix]]:
+        prefix += 1
+    return prefix
+
+
+def get_scan_order(subject, predicate, object, context,  # pylint: disable=W0622
+                   language=False, datatype=False, model=None):
+    """
+    Returns the unbound fields of a triple pattern, in the order of the index that serves it.
+    If a statement model is given, the fields are expanded into the model fields that store them.
+
+    Ordering the statements that match the pattern by these fields lets the database read them
+    from the index without sorting. Together with the bound fields, they identify a statement.
+
+    >>> get_scan_order(subject=False, predicate=True, object=False, context=False)
+    ('object', 'subject', 'context')
+    >>> get_scan_order(subject=False, predicate=False, object=False, context=False)
+    ('subject', 'predicate', 'object', 'context')
+    >>> get_scan_order(subject=False, predicate=True, object=False, context=False,
+    ...                language=True, model=models.LiteralStatement)
+    ('subject', 'object', 'datatype', 'context')
+    """
+    bound = _get_bound(subject, predicate, object, context, language, datatype)
+    name = choose_index(subject, predicate, object, context, language, datatype) or STATEMENT_INDEXES[0][0]
+    return tuple(field for field in get_model_fields(model, get_index_fields(name)) if not bound[field])
+
+
+def get_index_name(model, name):
+    """
+    Returns the database name of the index with the given name on the table of model.
+    """
+    return "{0}_{1}".format(model._meta.db_table, name)  # pylint: disable=W0212
+
+
+def sql_create_indexes(model, connection):
+    """
+    Returns the SQL statements that create the composite indexes for a statement model.
+
+    If the database supports it, the statements do nothing when the index already exists.
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta  # pylint: disable=W0212
+    if_not_exists = "IF NOT EXISTS " if connection.vendor in IF_NOT_EXISTS_VENDORS else ""
+
+    statements = []
+    for name, fields, unique in get_indexes(model):
+        unique = unique and not isinstance(opts.pk, StatementKeyField)
+        statements.append("CREATE {0}INDEX {1}{2} ON {3} ({4})".format(
+            "UNIQUE " if unique else "",
+            if_not_exists,
+            qn(get_index_name(model, name)),
+            qn(opts.db_table),
+            ", ".join(qn(opts.get_field(field).column) for field in get_model_fields(model, fields))))
+    return statements
+
+
+def create_indexes(created_models, db, verbosity=1, **kwargs):  # pylint: disable=W0613
+    """
+    Creates the composite indexes for all statement models that have just been created.
+
+    The flush command also reports all models as created; indexes that already exist are left alone.
+    """
+    connection = connections[db]
+    cursor = connection.cursor()
+    for model in STATEMENT_MODELS:
+        if model not in created_models:
+            continue
+        if verbosity >= 2:
+            print("Creating composite indexes for {0}".format(model._meta.object_name))  # pylint: disable=W0212
+        for sql in sql_create_indexes(model, connection):
+            if connection.vendor in IF_NOT_EXISTS_VENDORS:
+                cursor.execute(sql)
+                continue
+
+            savepoint = transaction.savepoint(using=db)
+            try:
+                cursor.execute(sql)
+            except DatabaseError:
+                transaction.savepoint_rollback(savepoint, using=db)
+            else:
+                transaction.savepoint_commit(savepoint, using=db)
+    transaction.commit_unless_managed(using=db)
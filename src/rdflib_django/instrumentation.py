@@ -0,0 +1,333 @@
+"""
+Instrumentation of the operations of the stores.
+
+While instrumentation is enabled, every call of a store operation is recorded under its name and
+the shape of its triple pattern: a string in which the bound subject, predicate, object and context
+are marked with s, p, o and c, and the unbound ones with a question mark. For every operation and
+shape, the number of calls, the wall time in seconds, the number of rows yielded and the number of
+SQL queries issued are added up:
+
+>>> import rdflib
+>>> from rdflib.namespace import RDF
+>>> from rdflib.term import URIRef
+>>> artis = URIRef('http://zoowizard.org/resource/Artis')
+>>> g = rdflib.Graph('Django')
+>>> with capture() as captured:
+...     g.add((artis, RDF.type, URIRef('http://schema.org/Zoo')))
+...     len(list(g.triples((artis, None, None))))
+1
+>>> sorted(captured)
+[('add', 'spoc'), ('triples', 's??c')]
+>>> captured[('triples', 's??c')]['calls'], captured[('triples', 's??c')]['rows']
+(1, 1)
+
+The capture context manager records the operations of the current thread within a block. Setting
+DJANGO_RDFLIB_INSTRUMENTATION to True, or calling enable(), records the operations of all threads
+in the process-wide stats(). Operations that are called by another operation, such as the addN of
+an add, are accounted to the outer operation only. While nothing is recorded, an operation costs a
+single extra function call.
+
+Every recorded operation sends the operation_finished signal, and is logged to the
+rdflib_django.instrumentation logger at the DEBUG level. Receivers of the signal that need every
+operation, such as the slow log, call watch() to have them recorded.
+"""
+from contextlib import contextmanager
+import copy
+import functools
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+from django.db.backends.util import CursorDebugWrapper
+from django.dispatch import Signal
+
+
+#: Sent after every recorded operation, by the class of the store.
+operation_finished = Signal(providing_args=['store', 'operation', 'shape', 'arguments', 'keywords', 'seconds', 'rows',
+                                            'queries'])
+
+logger = logging.getLogger(__name__)
+
+_enabled = getattr(settings, 'DJANGO_RDFLIB_INSTRUMENTATION', False)
+_captures = 0
+_watchers = 0
+_active = _enabled
+_lock = threading.Lock()
+_local = threading.local()
+_stats = dict()
+
+
+def get_shape(s, p, o, context):
+    """
+    Returns the shape of a pattern.
+
+    >>> get_shape(None, 'p', 'o', None)
+    '?po?'
+    """
+    return ''.join(name if term is not None else '?' for name, term in zip('spoc', (s, p, o, context)))
+
+
+def pattern_shape((s, p, o), context=None, *args, **kwargs):  # pylint: disable=W0613
+    """
+    Returns the shape of the arguments of an operation on a triple pattern.
+    """
+    return get_shape(s, p, o, context)
+
+
+def context_shape(context=None, *args, **kwargs):  # pylint: disable=W0613
+    """
+    Returns the shape of the arguments of an operation on a context.
+    """
+    return get_shape(None, None, None, context)
+
+
+def range_shape((s, p), context=None, *args, **kwargs):  # pylint: disable=W0613
+    """
+    Returns the shape of the arguments of a range_triples operation.
+    """
+    return get_shape(s, p, None, context)
+
+
+def _update_active():
+    """
+    Recalculates whether any operation may need to be recorded.
+    """
+    global _active  # pylint: disable=W0603
+    _active = _enabled or _captures > 0 or _watchers > 0
+
+
+def enable():
+    """
+    Starts recording the operations of all threads in the process-wide stats.
+    """
+    global _enabled  # pylint: disable=W0603
+    with _lock:
+        _enabled = True
+        _update_active()
+
+
+def disable():
+    """
+    Stops recording the operations of all threads in the process-wide stats.
+    """
+    global _enabled  # pylint: disable=W0603
+    with _lock:
+        _enabled = False
+        _update_active()
+
+
+def watch():
+    """
+    Starts recording the operations of all threads for the receivers of operation_finished,
+    until unwatch() is called as many times.
+    """
+    global _watchers  # pylint: disable=W0603
+    with _lock:
+        _watchers += 1
+        _update_active()
+
+
+def unwatch():
+    """
+    Undoes one watch().
+    """
+    global _watchers  # pylint: disable=W0603
+    with _lock:
+        assert _watchers > 0, "operations are not watched"
+        _watchers -= 1
+        _update_active()
+
+
+def is_enabled():
+    """
+    Checks whether the operations of all threads are recorded.
+    """
+    return _enabled
+
+
+def stats():
+    """
+    Returns the process-wide stats, which map (operation, shape) tuples to dictionaries with the
+    number of calls, seconds, rows and queries.
+    """
+    with _lock:
+        return copy.deepcopy(_stats)
+
+
+def reset():
+    """
+    Clears the process-wide stats.
+    """
+    with _lock:
+        _stats.clear()
+
+
+@contextmanager
+def capture():
+    """
+    Records the operations of the current thread within a block, in the dictionary that it yields.
+    The dictionary has the same form as stats().
+    """
+    global _captures  # pylint: disable=W0603
+    captured = dict()
+    if not hasattr(_local, 'captures'):
+        _local.captures = []
+    _local.captures.append(captured)
+    with _lock:
+        _captures += 1
+        _update_active()
+    try:
+        yield captured
+    finally:
+        _local.captures.remove(captured)
+        with _lock:
+            _captures -= 1
+            _update_active()
+
+
+def _add(totals, key, operation):
+    """
+    Adds an operation to a dictionary of stats.
+    """
+    entry = totals.setdefault(key, dict(calls=0, seconds=0.0, rows=0, queries=0))
+    entry['calls'] += 1
+    entry['seconds'] += operation.seconds
+    entry['rows'] += operation.rows
+    entry['queries'] += len(operation.queries)
+
+
+class _RecordingCursor(CursorDebugWrapper):
+    """
+    Debug cursor that also keeps the statement, parameters and database alias of every query,
+    so that the query can be explained afterwards.
+    """
+
+    def execute(self, sql, params=()):
+        try:
+            return super(_RecordingCursor, self).execute(sql, params)
+        finally:
+            self.db.queries[-1].update(statement=sql, params=params, alias=self.db.alias)
+
+    def executemany(self, sql, param_list):
+        try:
+            return super(_RecordingCursor, self).executemany(sql, param_list)
+        finally:
+            self.db.queries[-1].update(statement=sql, params=None, alias=self.db.alias)
+
+
+class Operation(object):
+    """
+    A call of a store operation that is being recorded.
+
+    The operation is timed and its queries are captured while it is entered; an operation that
+    yields rows is entered for every row it produces. The queries are the dictionaries that Django
+    records while its debug cursor is used, with the rendered sql and the time of every query, and
+    in addition its statement, params and database alias.
+    """
+
+    def __init__(self, store, name, shape, arguments, keywords):  # pylint: disable=R0913
+        self.store = store
+        self.name = name
+        self.shape = shape
+        self.arguments = arguments
+        self.keywords = keywords
+        self.seconds = 0.0
+        self.rows = 0
+        self.queries = []
+        self._marks = None
+        self._start = None
+
+    def __enter__(self):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        self._marks = []
+        for connection in connections.all():
+            self._marks.append((connection, connection.use_debug_cursor, len(connection.queries)))
+            connection.use_debug_cursor = True
+            connection.make_debug_cursor = functools.partial(_RecordingCursor, db=connection)
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.time() - self._start
+        for connection, use_debug_cursor, mark in self._marks:
+            self.queries.extend(connection.queries[mark:])
+            if not (use_debug_cursor or (use_debug_cursor is None and settings.DEBUG)):
+                del connection.queries[mark:]
+            connection.use_debug_cursor = use_debug_cursor
+            del connection.make_debug_cursor
+        self._marks = None
+        _local.depth -= 1
+
+    def finish(self):
+        """
+        Adds the operation to the stats, and reports it.
+        """
+        key = (self.name, self.shape)
+        for captured in getattr(_local, 'captures', ()):
+            _add(captured, key, self)
+        if _enabled:
+            with _lock:
+                _add(_stats, key, self)
+
+        operation_finished.send(sender=type(self.store), store=self.store, operation=self.name, shape=self.shape,
+                                arguments=self.arguments, keywords=self.keywords, seconds=self.seconds,
+                                rows=self.rows, queries=self.queries)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s %s: %.6f s, %d rows, %d queries", self.name, self.shape or '-', self.seconds,
+                         self.rows, len(self.queries))
+
+
+def _iterate(operation, iterator):
+    """
+    Yields the items of an iterator, recording the time spent in producing them as part of an operation.
+    """
+    try:
+        while True:
+            with operation:
+                item = next(iterator)
+            operation.rows += 1
+            yield item
+    finally:
+        operation.finish()
+
+
+def _is_recording():
+    """
+    Checks whether the current thread records operations that are not called by another operation.
+    """
+    return not getattr(_local, 'depth', 0) and (_enabled or _watchers or getattr(_local, 'captures', None))
+
+
+def instrumented(shape=None, iterator=False):
+    """
+    Decorates a store method to be recorded as an operation. The shape function is called with the
+    arguments of the method to get the shape of the operation. If iterator is True, the method
+    returns an iterator whose rows are counted, and the operation ends when it is exhausted or closed.
+    """
+    def decorator(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not _active or not _is_recording():
+                return method(self, *args, **kwargs)  # pylint: disable=W0142
+
+            operation = Operation(self, name, shape(*args, **kwargs) if shape is not None else None,  # pylint: disable=W0142
+                                  args, kwargs)
+            if iterator:
+                try:
+                    with operation:
+                        result = iter(method(self, *args, **kwargs))  # pylint: disable=W0142
+                except Exception:
+                    operation.finish()
+                    raise
+                return _iterate(operation, result)
+
+            try:
+                with operation:
+                    return method(self, *args, **kwargs)  # pylint: disable=W0142
+            finally:
+                operation.finish()
+        return wrapper
+    return decorator
@@ -1 +1,7 @@
 """Management commands"""
+from django.db.models.signals import post_syncdb
+from rdflib_django import counts, indexes, models
+
+
+post_syncdb.connect(indexes.create_indexes, sender=models, dispatch_uid='rdflib_django.indexes.create_indexes')
+post_syncdb.connect(counts.create_missing_counts, sender=models, dispatch_uid='rdflib_django.counts.create_missing_counts')
@@ -0,0 +1,74 @@
+"""
+Management command for benchmarking the store.
+"""
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+import datetime
+import json
+import sys
+from rdflib_django import benchmarks, utils
+
+
+class Command(BaseCommand):
+    """
+    Command object for benchmarking the store.
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--size', '-n', type='int', dest='size', default=10000,
+            help='The number of statements of the synthetic dataset. Defaults to 10000.'),
+
+        make_option('--contexts', '-c', type='int', dest='contexts', default=10,
+            help='The number of contexts the dataset is spread over. Defaults to 10.'),
+
+        make_option('--repeat', '-r', type='int', dest='repeat', default=3,
+            help='Time every read this number of times, and keep the best time. Defaults to 3.'),
+
+        make_option('--samples', type='int', dest='samples', default=100,
+            help='The number of triples that are added, removed and matched by every pattern shape. Defaults to 100.'),
+
+        make_option('--seed', type='int', dest='seed', default=0,
+            help='The seed of the synthetic dataset. Defaults to 0.'),
+
+        make_option('--label', '-l', type='string', dest='label',
+            help='A label for the results, such as the release that is benchmarked.'),
+    )
+
+    help = """Benchmarks the store on a synthetic dataset, and writes the results as JSON.
+
+The benchmark writes to the configured database, so run it against a scratch database.
+
+Examples:
+    {0} rdf_benchmark
+    {0} rdf_benchmark --size 100000 --contexts 100 --label 0.3 results.json
+    """.format(sys.argv[0])
+    args = '[file]'
+
+    def handle(self, *args, **options):
+        parameters = dict((name, options.get(name)) for name in ('size', 'contexts', 'repeat', 'samples', 'seed'))
+        if any(value <= 0 for name, value in parameters.items() if name != 'seed'):
+            raise CommandError("The size, contexts, repeat and samples should be positive numbers.")
+
+        def log(name):
+            if options.get('verbosity') >= 2:
+                sys.stderr.write("Timing {0}\n".format(name))
+
+        store = utils.get_store_class()()
+        results = benchmarks.run_benchmarks(store, log=log, **parameters)  # pylint: disable=W0142
+
+        report = {
+            'label': options.get('label'),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'store': type(store).__name__,
+            'environment': benchmarks.get_environment(),
+            'parameters': parameters,
+            'results': results,
+        }
+
+        stream = open(args[0], 'w') if args else sys.stdout
+        try:
+            json.dump(report, stream, indent=2, sort_keys=True)
+            stream.write("\n")
+        finally:
+            if args:
+                stream.close()
@@ -6,6 +6,8 @@ from django.core.management.base import BaseCommand
 import sys
 from rdflib.term import URIRef
 from rdflib_django import utils
+from rdflib_django.bulk import export_statements, EXPORT_FORMATS
+from rdflib_django.store import DjangoStore
 
 
 class Command(BaseCommand):
@@ -23,7 +25,8 @@ class Command(BaseCommand):
                  'is used.'),
 
         make_option('--format', '-f', type='string', dest='format', default='xml',
-            help='Format of the RDF data. This option accepts all formats allowed by rdflib. Defaults to xml.')
+            help='Format of the RDF data. This option accepts all formats allowed by rdflib. Defaults to xml. ' +
+                 'The formats nt and nquads are streamed directly from the database.')
     )
 
     help = """Exports an RDF resource.
@@ -32,6 +35,7 @@ Examples:
     {0} rdf_export my_file.rdf
     {0} rdf_export --format n3 my_file.n3
     {0} rdf_export --context http://example.com/context
+    {0} rdf_export --format nquads my_file.nq
     """.format(sys.argv[0])
     args = 'file'
 
@@ -39,6 +43,17 @@ Examples:
         store_id = options.get('store')
         context_id = options.get('context')
         target = args[0] if args else sys.stdout
+        rdf_format = options.get('format')
+
+        if rdf_format in EXPORT_FORMATS and utils.get_store_class() is DjangoStore:
+            stream = open(target, 'wb') if args else target
+            try:
+                export_statements(stream, URIRef(context_id) if context_id else None, quads=(rdf_format == 'nquads'),
+                                  chunk_size=DjangoStore().batch_size)
+            finally:
+                if args:
+                    stream.close()
+            return
 
         if context_id:
             graph = utils.get_named_graph(URIRef(context_id), store_id=store_id)
@@ -46,4 +61,4 @@ Examples:
             graph = utils.get_conjunctive_graph(store_id)
 
         #noinspection PyUnresolvedReferences
-        graph.serialize(target, format=options.get('format'))
+        graph.serialize(target, format=rdf_format)
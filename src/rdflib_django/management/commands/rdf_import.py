@@ -3,11 +3,14 @@ Management command for parsing RDF into the store.
 """
 from optparse import make_option
 from django.core.management.base import BaseCommand, CommandError
+import os
 import sys
+import urllib
 from django.db import transaction
 from rdflib.graph import Graph
 from rdflib.term import URIRef, BNode
-from rdflib_django import utils
+from rdflib_django import caches, parallel, utils
+from rdflib_django.bulk import BufferedStore, SortedTriples, sync_graph
 
 
 class Command(BaseCommand):
@@ -15,6 +18,10 @@ class Command(BaseCommand):
     Command object for importing RDF.
     """
 
+    processes = 1
+    writers = 1
+    chunk_size = parallel.DEFAULT_CHUNK_SIZE
+
     option_list = BaseCommand.option_list + (
         make_option('--store', '-s', type='string', dest='store',
             help='RDF data will be imported into the store with this identifier. If not specified, the default store ' +
@@ -24,8 +31,36 @@ class Command(BaseCommand):
             help='RDF data will be imported into a context with this identifier. If not specified, a new blank ' +
                  'context is created.'),
 
+        make_option('--context-per-file', action='store_true', dest='context_per_file', default=False,
+            help='Import every file into its own context, identified by the URI of the file.'),
+
         make_option('--format', '-f', type='string', dest='format', default='xml',
-            help='Format of the RDF data. This option accepts all formats allowed by rdflib. Defaults to xml.')
+            help='Format of the RDF data. This option accepts all formats allowed by rdflib. Defaults to xml.'),
+
+        make_option('--batch-size', '-b', type='int', dest='batch_size',
+            help='Commit the imported data every time this number of triples has been stored. If not specified, ' +
+                 'all data is imported in a single transaction.'),
+
+        make_option('--processes', '-p', type='int', dest='processes', default=1,
+            help='Parse the files in this number of processes. Files in N-Triples or N-Quads format are split into ' +
+                 'chunks of --chunk-size bytes, which are parsed in parallel. Defaults to 1.'),
+
+        make_option('--writers', '-w', type='int', dest='writers', default=1,
+            help='Write the parsed triples from this number of threads, in batches of --batch-size triples that ' +
+                 'are committed separately, so more than one writer requires --batch-size. Defaults to 1.'),
+
+        make_option('--chunk-size', type='int', dest='chunk_size', default=parallel.DEFAULT_CHUNK_SIZE,
+            help='The approximate number of bytes in the chunks of N-Triples and N-Quads files that are parsed by ' +
+                 'multiple processes. Defaults to {0}.'.format(parallel.DEFAULT_CHUNK_SIZE)),
+
+        make_option('--replace', '-r', action='store_true', dest='replace', default=False,
+            help='Replace the statements of the context. The data is imported into a staging graph, which then ' +
+                 'takes the place of the context at once. Requires --context.'),
+
+        make_option('--sync', action='store_true', dest='sync', default=False,
+            help='Synchronize the context with the data: only add the triples that are not stored yet, and remove ' +
+                 'the stored triples that are not in the data. The data is compared in sorted runs of --batch-size ' +
+                 'triples, and the changes are applied in a single transaction. Requires --context.'),
     )
 
     help = """Imports an RDF resource.
@@ -34,10 +69,13 @@ Examples:
     {0} rdf_import my_file.rdf
     {0} rdf_import --format n3 my_file.n3
     {0} rdf_import --context http://zoowizard.eu http://zoowizard.eu/datasource/zoochat/294
+    {0} rdf_import --format nt --batch-size 10000 my_file.nt
+    {0} rdf_import --replace --context http://zoowizard.eu --format nt my_file.nt
+    {0} rdf_import --sync --context http://zoowizard.eu --format nt my_file.nt
+    {0} rdf_import --context-per-file --processes 8 --writers 2 --format nt dumps/
     """.format(sys.argv[0])
-    args = 'file-or-resource'
+    args = 'file-or-resource [file-or-resource ...]'
 
-    @transaction.commit_on_success
     def handle(self, *args, **options):
         if not args:
             raise CommandError("No file or resource specified.")
@@ -45,26 +83,165 @@ Examples:
         info = options.get('verbosity') >= 2
         store_id = options.get('store')
         context_id = options.get('context')
-        source = args[0]
+        batch_size = options.get('batch_size')
+        replace = options.get('replace')
+        sync = options.get('sync')
+        per_file = options.get('context_per_file')
+        format = options.get('format')  # pylint: disable=W0622
+        self.processes = options.get('processes', 1)
+        self.writers = options.get('writers', 1)
+        self.chunk_size = options.get('chunk_size', parallel.DEFAULT_CHUNK_SIZE)
+        sources = parallel.find_sources(args)
 
+        if batch_size is not None and batch_size <= 0:
+            raise CommandError("The batch size should be a positive number.")
+        if self.processes <= 0 or self.writers <= 0 or self.chunk_size <= 0:
+            raise CommandError("The number of processes and writers and the chunk size should be positive numbers.")
+        if self.writers > 1 and batch_size is None:
+            raise CommandError("Multiple writers commit their own batches, so they require a batch size.")
+        if not sources:
+            raise CommandError("No files found.")
+        if replace and sync:
+            raise CommandError("Cannot both replace and synchronize a context.")
+        if (replace or sync) and not context_id:
+            raise CommandError("Replacing or synchronizing requires a context.")
+        if per_file and context_id:
+            raise CommandError("Cannot import into both a context and a context per file.")
+
+        identifier = URIRef(context_id) if context_id else BNode()
+        graph = utils.get_named_graph(identifier, store_id=store_id)
+        if sync:
+            added, removed, unchanged = self.sync(sources, graph, format, batch_size or graph.store.batch_size, info)
+            if int(options.get('verbosity', 1)) >= 1:
+                print("Added {0}, removed {1} and kept {2} triples".format(added, removed, unchanged))
+        elif per_file:
+            graphs = dict((source, utils.get_named_graph(get_source_uri(source), store_id=store_id))
+                          for source in sources)
+            self.import_sources(sources, graphs.get, format, batch_size, info)
+        elif not replace:
+            self.import_sources(sources, lambda source: graph, format, batch_size, info)
+        else:
+            staging = graph.store.create_staging_graph()
+            try:
+                self.import_sources(sources, lambda source: staging, format, batch_size, info)
+            except CommandError:
+                graph.store.remove_context(staging)
+                raise
+
+            if info:
+                print("Replacing {0}".format(identifier))
+            graph.store.replace_context(graph, staging)
+
+        caches.results.invalidate_pending()
         if info:
-            print("Parsing {0}".format(source))
+            print("Done")
 
-        intermediate = Graph()
+    @transaction.commit_on_success
+    def sync(self, sources, graph, format, batch_size, info):  # pylint: disable=R0913,W0622
+        """
+        Synchronizes a graph with the triples parsed from a list of sources.
+        Returns the number of added, removed and unchanged triples.
+        """
+        incoming = SortedTriples(batch_size)
         try:
-            intermediate.parse(source, format=options.get('format'))
+            if self.processes == 1:
+                for source in sources:
+                    if info:
+                        print("Parsing {0}".format(source))
+                    Graph(incoming).parse(source, format=format)
+            else:
+                for source, quads in parallel.parse_files(sources, format, self.processes, self.chunk_size):
+                    if info:
+                        print("Parsed {0} triples from {1}".format(len(quads), source))
+                    for s, p, o, _ in quads:
+                        incoming.add((s, p, o), None)
         except Exception as e:
             raise CommandError(e)
 
-        if info:
-            print("Parsed {0} triples".format(len(intermediate)))
+        return sync_graph(graph, incoming, batch_size)
 
-        identifier = URIRef(context_id) if context_id else BNode()
-        graph = utils.get_named_graph(identifier, store_id=store_id)
+    def import_sources(self, sources, get_graph, format, batch_size, info):  # pylint: disable=R0913,W0622
+        """
+        Imports a list of sources into the graphs returned by get_graph for each source.
+        """
+        if self.processes == 1 and self.writers == 1:
+            for source in sources:
+                self.load(source, get_graph(source), format, batch_size, info)
+        else:
+            self.load_parallel(sources, get_graph, format, batch_size, info)
+
+    @transaction.commit_manually
+    def load_parallel(self, sources, get_graph, format, batch_size, info):  # pylint: disable=R0913,W0622
+        """
+        Parses a list of sources in processes, and writes the triples with one or more writers.
+        N-Quads are written into their own context; other triples into the graph of their source.
+        """
+        store = get_graph(sources[0]).store
+
+        def on_flush(count):
+            if batch_size:
+                commit()
+            if info:
+                print("Stored {0} triples".format(count))
+
+        writer = parallel.PartitionedWriter(store, self.writers, batch_size or store.batch_size, on_flush)
+        contexts = dict()
+        try:
+            for source, quads in parallel.parse_files(sources, format, self.processes, self.chunk_size):
+                if info:
+                    print("Parsed {0} triples from {1}".format(len(quads), source))
+                graph = get_graph(source)
+                for s, p, o, context in quads:
+                    if context is not None and context not in contexts:
+                        contexts[context] = Graph(store, identifier=context)
+                    writer.add((s, p, o, graph if context is None else contexts[context]))
+            writer.flush()
+        except Exception as e:
+            transaction.rollback()
+            raise CommandError(e)
+        finally:
+            writer.close()
+
+        commit()
+
+    @transaction.commit_manually
+    def load(self, source, graph, format, batch_size, info):  # pylint: disable=R0913,W0622
+        """
+        Parses a source into a graph, committing every batch_size triples if batch_size is given.
+        """
+        def on_flush(count):
+            if batch_size:
+                commit()
+            if info:
+                print("Stored {0} triples".format(count))
+
+        buffered = BufferedStore(graph, batch_size or graph.store.batch_size, on_flush)
 
         if info:
-            print("Storing {0} triples".format(len(intermediate)))
-        for triple in intermediate:
-            graph.add(triple)
-        if info:
-            print("Done")
+            print("Parsing {0}".format(source))
+
+        try:
+            Graph(buffered).parse(source, format=format)
+            buffered.flush()
+        except Exception as e:
+            transaction.rollback()
+            raise CommandError(e)
+
+        commit()
+
+
+def commit():
+    """
+    Commits the current transaction, and invalidates the results that were cached before the commit.
+    """
+    transaction.commit()
+    caches.results.invalidate_pending()
+
+
+def get_source_uri(source):
+    """
+    Returns the URI of a source: the file URI of a local file, or the source itself.
+    """
+    if os.path.exists(source):
+        return URIRef('file://' + urllib.pathname2url(os.path.abspath(source)))
+    return URIRef(source)
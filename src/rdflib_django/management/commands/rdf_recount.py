@@ -0,0 +1,27 @@
+"""
+Management command for recalculating the maintained statement counts.
+"""
+from django.core.management.base import NoArgsCommand
+import sys
+from django.db import transaction
+from rdflib_django import counts
+
+
+class Command(NoArgsCommand):
+    """
+    Command object for recalculating statement counts.
+    """
+
+    help = """Recalculates the number of statements per context and the number of distinct triples in the store.
+
+Use this command when the counts have drifted, for instance after deleting named graphs outside of the store.
+
+Examples:
+    {0} rdf_recount
+    """.format(sys.argv[0])
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        counts.recount()
+        if options.get('verbosity') >= 2:
+            print("Done")
@@ -0,0 +1,48 @@
+"""
+Management command for showing the slow operations of the stores.
+"""
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+import json
+import sys
+from rdflib_django import slowlog
+
+
+class Command(NoArgsCommand):
+    """
+    Command object for showing the slow log.
+    """
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--json', action='store_true', dest='json', default=False,
+            help='Write the entries as a JSON list.'),
+
+        make_option('--clear', action='store_true', dest='clear', default=False,
+            help='Remove the entries from the slow log after showing them.'),
+    )
+
+    help = """Shows the store operations that took longer than DJANGO_RDFLIB_SLOW_THRESHOLD seconds, oldest first,
+with the SQL and query plan of their queries.
+
+Examples:
+    {0} rdf_slowlog
+    {0} rdf_slowlog --json --clear > slow.json
+    """.format(sys.argv[0])
+
+    def handle_noargs(self, **options):
+        entries = slowlog.get_entries()
+        if options.get('json'):
+            json.dump(entries, sys.stdout, indent=2, sort_keys=True)
+            sys.stdout.write("\n")
+        else:
+            for entry in entries:
+                sys.stdout.write(u"{date} {store}.{operation} {shape}: {seconds:.3f} s, {rows} rows\n".format(
+                    **dict(entry, shape=entry['shape'] or '-')).encode('utf-8'))  # pylint: disable=W0142
+                sys.stdout.write(u"  pattern: {0}\n".format(entry['pattern']).encode('utf-8'))
+                for query in entry['queries']:
+                    sys.stdout.write(u"  ({0} s) {1}\n".format(query['time'], query['sql']).encode('utf-8'))
+                    for line in query['plan'] or ():
+                        sys.stdout.write(u"    {0}\n".format(line).encode('utf-8'))
+
+        if options.get('clear'):
+            slowlog.clear()
@@ -3,10 +3,19 @@ The rdflib_django implementation uses Django models to store its triples.
 
 The underlying models are Resource centric, because rdflib-django is intended
 to be used for publishing resources.
+
+The statement models are not indexed per column; instead, the composite indexes defined in
+rdflib_django.indexes are created for them. URIStatements and LiteralStatements are identified
+by a hash of their contents, so their primary key also keeps them unique. They also store a
+hash of just their triple, which identifies the same triple across contexts.
+
+LiteralStatements store the lexical form, language and datatype of their object in separate
+columns, so literals can be filtered by language or datatype and are read without parsing.
 """
+import hashlib
 from django.db import models
 from django.utils.translation import ugettext as _
-from django_extensions.db.fields import UUIDField
+from rdflib.term import Literal
 from rdflib_django import fields
 
 
@@ -51,14 +60,15 @@ class URIStatement(models.Model):
     Statement where the object is a URI.
     """
 
-    id = UUIDField("ID", primary_key=True)
-    subject = fields.URIField(verbose_name=_("Subject"), db_index=True)
-    predicate = fields.URIField(_("Predicate"), db_index=True)
-    object = fields.URIField(_("Object"), db_index=True)
-    context = models.ForeignKey(NamedGraph, verbose_name=_("Context"))
+    id = fields.StatementKeyField("ID", primary_key=True)
+    subject = fields.URIField(verbose_name=_("Subject"), db_index=False)
+    predicate = fields.URIField(_("Predicate"), db_index=False)
+    object = fields.URIField(_("Object"), db_index=False)
+    context = models.ForeignKey(NamedGraph, verbose_name=_("Context"), db_index=False)
+    triple_key = fields.TripleKeyField(_("Triple key"), db_index=True)
 
-    class Meta:
-        unique_together = ('subject', 'predicate', 'object', 'context')
+    #: The fields that are read to reconstruct the triple of a statement.
+    row_fields = ('subject', 'predicate', 'object')
 
     def __unicode__(self):
         return u"{0}, {1}".format(self.as_triple(), self.context.identifier)    # pylint: disable=E1101
@@ -69,20 +79,50 @@ class URIStatement(models.Model):
         """
         return self.subject, self.predicate, self.object
 
+    @staticmethod
+    def object_values(obj):
+        """
+        Returns the field values that store the object of a statement.
+        """
+        return {'object': obj}
+
+    @staticmethod
+    def row_to_triple(row):
+        """
+        Converts the stored values of the row_fields of a statement to a triple.
+        """
+        return fields.deserialize_uri(row[0]), fields.deserialize_uri(row[1]), fields.deserialize_uri(row[2])
+
 
 class LiteralStatement(models.Model):
     """
     Statement where the object is a literal.
+
+    The object is stored as its lexical form, language and datatype. A literal without a language or
+    datatype has an empty language or datatype.
+
+    Numeric, boolean, date and dateTime literals also have their value stored in a typed shadow column,
+    so their values can be compared and ordered by the database.
     """
 
-    id = UUIDField("ID", primary_key=True)
-    subject = fields.URIField(verbose_name=_("Subject"), db_index=True)
-    predicate = fields.URIField(_("Predicate"), db_index=True)
-    object = fields.LiteralField(_("Object"), db_index=True)
-    context = models.ForeignKey(NamedGraph, verbose_name=_("Context"))
+    id = fields.StatementKeyField("ID", primary_key=True)
+    subject = fields.URIField(verbose_name=_("Subject"), db_index=False)
+    predicate = fields.URIField(_("Predicate"), db_index=False)
+    object = models.TextField(_("Object"))
+    language = models.CharField(max_length=50, verbose_name=_("Language"), blank=True)
+    datatype = models.CharField(max_length=500, verbose_name=_("Datatype"), blank=True)
+    context = models.ForeignKey(NamedGraph, verbose_name=_("Context"), db_index=False)
+    triple_key = fields.TripleKeyField(_("Triple key"), db_index=True)
+    numeric_value = fields.NumericValueField(_("Numeric value"))
+    boolean_value = fields.BooleanValueField(_("Boolean value"))
+    date_value = fields.DateValueField(_("Date value"))
+    datetime_value = fields.DateTimeValueField(_("Date and time value"))
 
-    class Meta:
-        unique_together = ('subject', 'predicate', 'object', 'context')
+    #: The fields that are read to reconstruct the triple of a statement.
+    row_fields = ('subject', 'predicate', 'object', 'language', 'datatype')
+
+    #: The typed value fields, in the order in which they are matched against Python values.
+    typed_value_fields = ('boolean_value', 'datetime_value', 'date_value', 'numeric_value')
 
     def __unicode__(self):
         return u"{0}, {1}".format(self.as_triple(), self.context.identifier)    # pylint: disable=E1101
@@ -91,4 +131,143 @@ class LiteralStatement(models.Model):
         """
         Converts this predicate to a triple.
         """
-        return self.subject, self.predicate, self.object
+        return self.subject, self.predicate, values_to_literal(self.object, self.language, self.datatype)
+
+    @staticmethod
+    def object_values(obj):
+        """
+        Returns the field values that store the object of a statement.
+        """
+        return dict(zip(('object', 'language', 'datatype'), literal_to_values(obj)))
+
+    @staticmethod
+    def row_to_triple(row):
+        """
+        Converts the stored values of the row_fields of a statement to a triple.
+        """
+        return fields.deserialize_uri(row[0]), fields.deserialize_uri(row[1]), values_to_literal(row[2], row[3], row[4])
+
+
+def literal_to_values(literal):
+    """
+    Converts a Literal to its lexical form, language and datatype.
+    """
+    return unicode(literal), literal.language or u'', literal.datatype or u''
+
+
+def values_to_literal(lexical, language, datatype):
+    """
+    Converts a lexical form, language and datatype to a Literal.
+    """
+    return Literal(lexical, language or None, datatype or None)
+
+
+class Term(models.Model):
+    """
+    A term in the term dictionary.
+
+    The term dictionary stores every distinct URIRef, BNode and Literal once, so statements
+    can refer to their terms using integer keys. URIRefs and BNodes are stored in the same
+    format as a URIField; Literals are stored as their lexical form, language and datatype.
+    The key is a hash over the kind and the full value of the term, and is used to look up terms.
+    """
+
+    URI = 'U'
+    LITERAL = 'L'
+    KIND_CHOICES = (
+        (URI, _("URI or blank node")),
+        (LITERAL, _("Literal")),
+    )
+
+    key = models.CharField(max_length=40, verbose_name=_("Key"), unique=True)
+    kind = models.CharField(max_length=1, verbose_name=_("Kind"), choices=KIND_CHOICES)
+    value = models.TextField(verbose_name=_("Value"))
+    language = models.CharField(max_length=50, verbose_name=_("Language"), blank=True)
+    datatype = models.CharField(max_length=500, verbose_name=_("Datatype"), blank=True)
+
+    class Meta:
+        verbose_name = _("term")
+        verbose_name_plural = _("terms")
+
+    def __unicode__(self):
+        return self.as_term().n3()
+
+    @classmethod
+    def from_term(cls, term):
+        """
+        Creates an unsaved Term for an rdflib term.
+        """
+        kind, value, language, datatype = term_to_values(term)
+        return cls(key=term_key(kind, value, language, datatype),
+                   kind=kind, value=value, language=language, datatype=datatype)
+
+    def as_term(self):
+        """
+        Converts this Term to an rdflib term.
+        """
+        return values_to_term(self.kind, self.value, self.language, self.datatype)
+
+
+def term_to_values(term):
+    """
+    Converts an rdflib term to the column values of a Term: its kind, value, language and datatype.
+    """
+    if isinstance(term, Literal):
+        return (Term.LITERAL,) + literal_to_values(term)
+    return Term.URI, fields.serialize_uri(term), u'', u''
+
+
+def term_key(kind, value, language, datatype):
+    """
+    Calculates the key of a term.
+    """
+    return hashlib.sha1(u"\0".join((kind, value, language, datatype)).encode('utf-8')).hexdigest()
+
+
+def values_to_term(kind, value, language, datatype):
+    """
+    Converts the column values of a Term to an rdflib term.
+    """
+    if kind == Term.LITERAL:
+        return values_to_literal(value, language, datatype)
+    return fields.deserialize_uri(value)
+
+
+class TermStatement(models.Model):
+    """
+    Statement that refers to its subject, predicate and object in the term dictionary.
+    """
+
+    subject = models.ForeignKey(Term, verbose_name=_("Subject"), related_name='+', db_index=False)
+    predicate = models.ForeignKey(Term, verbose_name=_("Predicate"), related_name='+', db_index=False)
+    object = models.ForeignKey(Term, verbose_name=_("Object"), related_name='+', db_index=False)
+    context = models.ForeignKey(NamedGraph, verbose_name=_("Context"), db_index=False)
+
+    def __unicode__(self):
+        return u"{0}, {1}".format(self.as_triple(), self.context.identifier)    # pylint: disable=E1101
+
+    def as_triple(self):
+        """
+        Converts this statement to a triple.
+        """
+        return self.subject.as_term(), self.predicate.as_term(), self.object.as_term()    # pylint: disable=E1101
+
+
+class TripleCount(models.Model):
+    """
+    The number of statements in a named graph, or the number of distinct triples in the
+    store if the context is empty.
+
+    The counts are maintained by the DjangoStore for URIStatements and LiteralStatements. A count
+    that is missing is recalculated when it is needed; the rdf_recount command recalculates all counts.
+    """
+
+    context = models.OneToOneField(NamedGraph, verbose_name=_("Context"), null=True, blank=True)
+    count = models.BigIntegerField(verbose_name=_("Count"), default=0)
+
+    class Meta:
+        verbose_name = _("triple count")
+        verbose_name_plural = _("triple counts")
+
+    def __unicode__(self):
+        return u"{0}: {1}".format(self.context.identifier if self.context else _("all contexts"), self.count)  # pylint: disable=E1101
@@ -0,0 +1,270 @@
+"""
+Parallel parsing and writing of RDF files.
+
+Files are parsed in a pool of processes, which send the parsed statements back to the importing
+process. Files in a line-based format (N-Triples and N-Quads) are split into chunks of whole lines,
+so a single large file is parsed by all processes:
+
+>>> import tempfile
+>>> path = tempfile.mkstemp(suffix='.nt')[1]
+>>> with open(path, 'w') as f:
+...     f.write('<http://example.com/s> <http://example.com/p> _:b1 .\\n' * 3)
+>>> split_lines(path, 50)
+[(0, 53), (53, 106), (106, 159)]
+
+Blank node labels are scoped by file, so a label that occurs in several chunks is still one node:
+
+>>> chunks = list(parse_files([path], 'nt', chunk_size=50))
+>>> len(chunks), len(set(o for source, quads in chunks for (s, p, o, c) in quads))
+(3, 1)
+>>> import os
+>>> os.remove(path)
+
+The parsed statements are written by a PartitionedWriter, in one or more threads.
+"""
+from collections import deque
+from cStringIO import StringIO
+from multiprocessing import Pool
+import os
+import urllib2
+import uuid
+from rdflib.graph import Graph
+from rdflib.plugins.parsers.nquads import NQuadsParser
+from rdflib.plugins.parsers.ntriples import NTriplesParser
+from rdflib_django.executor import StoreExecutor
+
+
+#: The formats that have one statement per line, and the parsers of these formats.
+LINE_FORMATS = {
+    'nt': NTriplesParser,
+    'nquads': NQuadsParser,
+}
+
+#: The approximate number of bytes in a chunk of a line-based file, if not specified.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def find_sources(paths):
+    """
+    Returns the sources to import for a list of paths: directories are replaced by the files
+    they contain, recursively and in alphabetical order. Other paths, such as URLs, are kept.
+    """
+    sources = []
+    for path in paths:
+        if not os.path.isdir(path):
+            sources.append(path)
+            continue
+
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories[:] = sorted(name for name in subdirectories if not name.startswith('.'))
+            sources.extend(os.path.join(directory, name) for name in sorted(files) if not name.startswith('.'))
+    return sources
+
+
+def split_lines(path, chunk_size):
+    """
+    Splits a file into ranges of about chunk_size bytes that end at a line break.
+    Returns a list of (start, end) offsets.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(start + chunk_size)
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+class _ScopedBNodeIds(object):
+    """
+    Maps the blank node labels of a file to the same identifiers in every process.
+    Replaces the label mapping of the N-Triples parser, which is local to a process.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def get(self, label, default=None):  # pylint: disable=W0613
+        """
+        Returns the identifier of a label.
+        """
+        return self.prefix + label
+
+
+class _Sink(object):
+    """
+    Collects the statements of the N-Triples and N-Quads parsers.
+    """
+
+    context_aware = True
+
+    def __init__(self):
+        self.store = self
+        self.quads = []
+
+    def triple(self, s, p, o):
+        """
+        Called by the N-Triples parser.
+        """
+        self.quads.append((s, p, o, None))
+
+    def add(self, (s, p, o), context):
+        """
+        Called by the N-Quads parser.
+        """
+        self.quads.append((s, p, o, context))
+
+
+def parse_task((source, format, byte_range, bnode_prefix)):  # pylint: disable=W0622
+    """
+    Parses a source, or a range of bytes of a file in a line-based format.
+    Returns the source and a list of (s, p, o, context) quads, in which context is the
+    identifier of the context of an N-Quad and None otherwise.
+    """
+    if format not in LINE_FORMATS:
+        graph = Graph()
+        graph.parse(source, format=format)
+        return source, [(s, p, o, None) for (s, p, o) in graph]
+
+    if byte_range is None:
+        stream = urllib2.urlopen(source)
+    else:
+        with open(source, 'rb') as f:
+            f.seek(byte_range[0])
+            stream = StringIO(f.read(byte_range[1] - byte_range[0]))
+
+    sink = _Sink()
+    parser = LINE_FORMATS[format](sink)
+    parser._bnode_ids = _ScopedBNodeIds(bnode_prefix)  # pylint: disable=W0212
+    try:
+        NTriplesParser.parse(parser, stream)
+    finally:
+        stream.close()
+    return source, sink.quads
+
+
+def _get_tasks(sources, format, chunk_size):  # pylint: disable=W0622
+    """
+    Returns the parse tasks for a list of sources.
+    """
+    for source in sources:
+        if format not in LINE_FORMATS:
+            yield source, format, None, None
+        elif not os.path.isfile(source):
+            yield source, format, None, uuid.uuid4().hex
+        else:
+            bnode_prefix = uuid.uuid4().hex
+            for byte_range in split_lines(source, chunk_size):
+                yield source, format, byte_range, bnode_prefix
+
+
+def parse_files(sources, format, processes=1, chunk_size=DEFAULT_CHUNK_SIZE):  # pylint: disable=W0622
+    """
+    Parses a list of sources in a pool of processes. Yields a (source, quads) tuple for every parsed
+    file or chunk, in the order of the sources; see parse_task.
+
+    With a single process, the sources are parsed in the current process. Otherwise, at most twice
+    as many files or chunks as there are processes are parsed ahead of the consumer.
+    """
+    tasks = _get_tasks(sources, format, chunk_size)
+    if processes == 1:
+        for task in tasks:
+            yield parse_task(task)
+        return
+
+    pool = Pool(processes)
+    try:
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(parse_task, (task,)))
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class PartitionedWriter(object):
+    """
+    Writes quads to a store in batches of batch_size quads, using writers threads.
+
+    The quads are partitioned on their triple, and every partition has at most one batch in flight,
+    so a triple is never written by two threads at once and the maintained counts stay exact.
+    With a single writer, the batches are written in the current thread and transaction.
+
+    After every batch, the optional on_flush callback is called with the total number of quads written.
+    """
+
+    def __init__(self, store, writers, batch_size, on_flush=None):
+        assert writers > 0 and batch_size > 0
+        self.store = store
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.written = 0
+        self._buffers = [[] for _ in range(writers)]
+        self._pending = [None] * writers
+        self._executor = StoreExecutor(store, workers=writers) if writers > 1 else None
+
+    def add(self, quad):
+        """
+        Buffers a quad, and writes its partition if it contains batch_size quads.
+        """
+        partition = hash(quad[:3]) % len(self._buffers)
+        self._buffers[partition].append(quad)
+        if len(self._buffers[partition]) >= self.batch_size:
+            self._write(partition)
+
+    def _write(self, partition):
+        """
+        Writes the buffered quads of a partition, after its previous batch.
+        """
+        batch = self._buffers[partition]
+        self._buffers[partition] = []
+        if self._executor is None:
+            self.store.addN(batch)
+            self._written(len(batch))
+        else:
+            self._wait(partition)
+            self._pending[partition] = len(batch), self._executor.submit(self.store.addN, batch)
+
+    def _wait(self, partition):
+        """
+        Waits until the batch in flight of a partition has been written.
+        """
+        if self._pending[partition] is not None:
+            size, result = self._pending[partition]
+            self._pending[partition] = None
+            result.get()
+            self._written(size)
+
+    def _written(self, size):
+        """
+        Counts a written batch.
+        """
+        self.written += size
+        if self.on_flush is not None:
+            self.on_flush(self.written)
+
+    def flush(self):
+        """
+        Writes all buffered quads, and waits until they have been written.
+        """
+        for partition, buffered in enumerate(self._buffers):
+            if buffered:
+                self._write(partition)
+        for partition in range(len(self._pending)):
+            self._wait(partition)
+
+    def close(self):
+        """
+        Stops the writer threads, after the batches in flight.
+        """
+        if self._executor is not None:
+            self._executor.close()
@@ -0,0 +1,107 @@
+"""
+Routing of the reads of the stores to replica databases.
+
+By default, the stores read from and write to the databases that Django's routers select. If the
+DJANGO_RDFLIB_READ_DATABASES setting lists the aliases of one or more replica databases, the read
+paths of the stores (triples, len, contexts and SPARQL queries) use a random one of them instead.
+Writes, and reads while the primary database is in a managed transaction or a store transaction,
+always use the primary database.
+
+Replicas may lag behind the primary database. A thread that needs to read its own writes can be
+pinned to the primary database:
+
+>>> with pinned():
+...     get_read_alias(['replica']) is None
+True
+
+The PinningMiddleware pins requests that may write, that is, requests that do not use a safe method.
+"""
+from contextlib import contextmanager
+import random
+import threading
+from django.conf import settings
+from django.db import router, transaction
+from rdflib_django import models
+
+
+#: The request methods that do not pin a request to the primary database.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_local = threading.local()
+
+
+def get_read_databases():
+    """
+    Returns the aliases of the databases to read from, as configured by DJANGO_RDFLIB_READ_DATABASES.
+    """
+    return tuple(getattr(settings, 'DJANGO_RDFLIB_READ_DATABASES', ()))
+
+
+def pin():
+    """
+    Pins the current thread to the primary database, until it is unpinned as many times as it was pinned.
+    """
+    _local.pins = getattr(_local, 'pins', 0) + 1
+
+
+def unpin():
+    """
+    Undoes one pin() of the current thread.
+    """
+    assert is_pinned(), "the current thread is not pinned"
+    _local.pins -= 1
+
+
+def is_pinned():
+    """
+    Checks whether the current thread is pinned to the primary database.
+    """
+    return getattr(_local, 'pins', 0) > 0
+
+
+@contextmanager
+def pinned():
+    """
+    Pins the current thread to the primary database within a block.
+    """
+    pin()
+    try:
+        yield
+    finally:
+        unpin()
+
+
+def get_read_alias(databases):
+    """
+    Returns the alias of a random database to read from, or None to read from the primary database
+    because there are no read databases, the thread is pinned or the primary database is in a
+    managed transaction.
+    """
+    if not databases or is_pinned():
+        return None
+    if transaction.is_managed(using=router.db_for_write(models.URIStatement)):
+        return None
+    return random.choice(databases)
+
+
+class PinningMiddleware(object):
+    """
+    Pins requests that do not use a safe method to the primary database, so that they read their own writes.
+    """
+
+    def process_request(self, request):  # pylint: disable=R0201
+        """
+        Pins the request if its method is not safe.
+        """
+        if request.method not in SAFE_METHODS:
+            pin()
+            request.rdflib_django_pinned = True
+
+    def process_response(self, request, response):  # pylint: disable=R0201
+        """
+        Unpins a pinned request.
+        """
+        if getattr(request, 'rdflib_django_pinned', False):
+            request.rdflib_django_pinned = False
+            unpin()
+        return response
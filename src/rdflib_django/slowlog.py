@@ -0,0 +1,216 @@
+"""
+Log of the slow operations of the stores.
+
+If DJANGO_RDFLIB_SLOW_THRESHOLD is set to a number of seconds, every store operation that takes
+longer, such as matching a triple pattern or evaluating a SPARQL query, is logged with its pattern,
+the number of rows it yielded, and the rendered SQL and query plan of every query it issued. The
+plans are read with EXPLAIN QUERY PLAN on SQLite, and with EXPLAIN on PostgreSQL and MySQL.
+
+>>> import rdflib
+>>> from rdflib.namespace import RDF
+>>> from rdflib.term import URIRef
+>>> artis = URIRef('http://zoowizard.org/resource/Artis')
+>>> g = rdflib.Graph('Django', identifier=URIRef('http://zoowizard.org/graph'))
+>>> g.add((artis, RDF.type, URIRef('http://schema.org/Zoo')))
+>>> start(0)
+>>> len(list(g.triples((artis, None, None))))
+1
+>>> stop()
+>>> entry = get_entries()[-1]
+>>> entry['operation'], entry['shape'], entry['pattern'], entry['rows']
+('triples', 's??c', u'(<http://zoowizard.org/resource/Artis>, ?, ?) in <http://zoowizard.org/graph>', 1)
+>>> all(query['sql'] and query['plan'] for query in entry['queries'])
+True
+>>> clear()
+
+The log is a ring buffer of the last DJANGO_RDFLIB_SLOW_LOG_SIZE (100) entries, kept in the cache
+named by DJANGO_RDFLIB_CACHE. With a cache that is shared by all processes, the rdf_slowlog
+command shows the slow operations of the whole site.
+"""
+import datetime
+import logging
+from django.conf import settings
+from django.db import connections, DatabaseError
+from rdflib.graph import Graph
+from rdflib.term import Node
+from rdflib_django import caches, instrumentation
+
+
+logger = logging.getLogger(__name__)
+
+#: The EXPLAIN statements of the database vendors, and whether they explain statements other than SELECT.
+EXPLAIN_STATEMENTS = {
+    'sqlite': ('EXPLAIN QUERY PLAN ', True),
+    'postgresql': ('EXPLAIN ', True),
+    'mysql': ('EXPLAIN ', False),
+}
+
+
+class SlowLog(object):
+    """
+    Ring buffer of log entries in a cache.
+
+    Every entry is stored under its sequence number modulo the size of the log. The sequence
+    numbers are handed out by incrementing a counter in the cache, which is atomic in caches
+    that are shared between processes.
+    """
+
+    COUNTER_KEY = 'rdflib_django.slowlog.counter'
+    ENTRY_KEY = 'rdflib_django.slowlog.{0}'
+
+    def __init__(self, shared_cache, size):
+        assert size > 0
+        self.shared_cache = shared_cache
+        self.size = size
+
+    def append(self, entry):
+        """
+        Adds an entry to the log, replacing the oldest entry if the log is full.
+        """
+        self.shared_cache.add(self.COUNTER_KEY, 0)
+        try:
+            sequence = self.shared_cache.incr(self.COUNTER_KEY)
+        except ValueError:
+            # the counter was evicted in the meantime
+            self.shared_cache.add(self.COUNTER_KEY, 0)
+            sequence = self.shared_cache.incr(self.COUNTER_KEY)
+
+        entry = dict(entry, sequence=sequence)
+        self.shared_cache.set(self.ENTRY_KEY.format(sequence % self.size), entry)
+
+    def get_entries(self):
+        """
+        Returns the entries in the log, oldest first.
+        """
+        last = self.shared_cache.get(self.COUNTER_KEY) or 0
+        sequences = range(max(1, last - self.size + 1), last + 1)
+        found = self.shared_cache.get_many([self.ENTRY_KEY.format(sequence % self.size) for sequence in sequences])
+        entries = (found.get(self.ENTRY_KEY.format(sequence % self.size)) for sequence in sequences)
+        return [entry for entry, sequence in zip(entries, sequences) if entry and entry['sequence'] == sequence]
+
+    def clear(self):
+        """
+        Removes all entries from the log.
+        """
+        self.shared_cache.delete_many([self.ENTRY_KEY.format(i) for i in range(self.size)] + [self.COUNTER_KEY])
+
+
+log = SlowLog(caches.shared_cache, getattr(settings, 'DJANGO_RDFLIB_SLOW_LOG_SIZE', 100))
+
+_threshold = None
+
+
+def start(threshold):
+    """
+    Starts logging the operations that take longer than threshold seconds.
+    """
+    global _threshold  # pylint: disable=W0603
+    if _threshold is None:
+        instrumentation.watch()
+    _threshold = threshold
+
+
+def stop():
+    """
+    Stops logging slow operations.
+    """
+    global _threshold  # pylint: disable=W0603
+    if _threshold is not None:
+        instrumentation.unwatch()
+    _threshold = None
+
+
+def get_entries():
+    """
+    Returns the entries of the slow log, oldest first.
+    """
+    return log.get_entries()
+
+
+def clear():
+    """
+    Removes all entries from the slow log.
+    """
+    log.clear()
+
+
+def describe(arguments, keywords=None):
+    """
+    Returns a readable description of the arguments of an operation, in which a graph is the context.
+
+    >>> from rdflib.term import URIRef, Literal
+    >>> describe([(URIRef('http://example.com/s'), None, Literal('o'))], {'context': None})
+    u'(<http://example.com/s>, ?, "o")'
+    >>> describe([], {'context': Graph(identifier=URIRef('http://example.com/g'))})
+    u'in <http://example.com/g>'
+    """
+    def term(value):
+        if value is None:
+            return u'?'
+        if isinstance(value, Graph):
+            return value.identifier.n3()
+        if isinstance(value, Node):
+            return value.n3()
+        if isinstance(value, (tuple, list)):
+            return u'({0})'.format(u', '.join(term(item) for item in value))
+        return unicode(value)
+
+    keywords = dict(keywords or {})
+    context = keywords.pop('context', None)
+    if context is None:
+        context = next((argument for argument in arguments if isinstance(argument, Graph)), None)
+    parts = [term(argument) for argument in arguments if argument is not context and argument is not None]
+    parts.extend(u'{0}={1}'.format(name, term(value)) for name, value in sorted(keywords.items()) if value is not None)
+    if context is not None:
+        parts.append(u'in {0}'.format(term(context)))
+    return u' '.join(parts)
+
+
+def explain(query):
+    """
+    Returns the query plan of a query that was recorded by the instrumentation, as a list of lines,
+    or None if the database cannot explain it.
+    """
+    connection = connections[query['alias']]
+    prefix, any_statement = EXPLAIN_STATEMENTS.get(connection.vendor, (None, False))
+    statement = query.get('statement')
+    if prefix is None or query.get('params') is None:
+        return None
+    if not any_statement and not statement.lstrip().upper().startswith('SELECT'):
+        return None
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute(prefix + statement, query['params'])
+        return [u' '.join(unicode(column) for column in row) for row in cursor.fetchall()]
+    except DatabaseError as e:
+        logger.warning("Cannot explain %s: %s", statement, e)
+        return None
+
+
+def _log_operation(sender, store, operation, shape, arguments, keywords, seconds, rows, queries, **kwargs):  # pylint: disable=R0913,W0613
+    """
+    Logs an operation that took longer than the threshold.
+    """
+    threshold = _threshold
+    if threshold is None or seconds <= threshold:
+        return
+
+    log.append({
+        'date': datetime.datetime.now().isoformat(),
+        'store': type(store).__name__,
+        'operation': operation,
+        'shape': shape,
+        'pattern': describe(arguments, keywords),
+        'seconds': seconds,
+        'rows': rows,
+        'queries': [dict(sql=query['sql'], time=query['time'], plan=explain(query)) for query in queries],
+    })
+    logger.warning("Slow %s %s: %.3f s, %d rows, %d queries", operation, describe(arguments, keywords) or '-', seconds,
+                   rows, len(queries))
+
+
+instrumentation.operation_finished.connect(_log_operation, dispatch_uid='rdflib_django.slowlog')
+
+if getattr(settings, 'DJANGO_RDFLIB_SLOW_THRESHOLD', None) is not None:
+    start(settings.DJANGO_RDFLIB_SLOW_THRESHOLD)
@@ -0,0 +1,647 @@
+"""
+Evaluation of SPARQL basic graph patterns in the database.
+
+The SPARQL processor of rdfextras matches the triple patterns of a basic graph pattern (BGP) one
+at a time, calling triples() once for every pattern and every solution found so far. Instead, the
+DjangoStore translates a BGP into a single SQL query that joins the statement tables once for every
+triple pattern:
+
+- rdfextras passes every BGP of a query to the batch_unify method of the store in a single call;
+- for SELECT queries whose WHERE clause is a single BGP, evaluate_select also translates the FILTERs
+  that compare variables with constants, ORDER BY, DISTINCT, LIMIT and OFFSET, so the database
+  returns the final solutions;
+- OPTIONAL BGPs that follow the BGP, and BGPs that cannot be translated as a whole, are matched by a
+  bind join: a single SQL query matches the pattern for a whole block of solutions.
+
+A query that cannot be translated is evaluated by rdfextras, which still uses batch_unify for its BGPs.
+
+Variables and blank nodes in a pattern are variables. Objects that are only matched against other
+objects may be URIs or literals; such BGPs are translated into a UNION of queries, one for every
+combination of statement tables, up to MAX_OBJECT_VARIABLES variables.
+"""
+import itertools
+from django.db import connections, router
+from rdflib.term import BNode, Literal, Variable
+from rdflib_django import caches, models
+from rdflib_django.fields import serialize_uri, deserialize_uri
+
+
+#: The maximum number of variables that may be bound to either a URI or a literal in a translated BGP.
+MAX_OBJECT_VARIABLES = 3
+
+URI, LITERAL = 'U', 'L'
+
+#: The SQL operators for the relational operators of SPARQL, by the name rdfextras gives them.
+OPERATORS = {'=': '=', '!=': '<>', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+#: The lookups of typed value fields for the relational operators of SPARQL, and the SQL operators of these lookups.
+LOOKUPS = {'=': 'exact', '!=': 'exact', '<': 'lt', '<=': 'lte', '>': 'gt', '>=': 'gte'}
+LOOKUP_OPERATORS = {'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>='}
+
+#: The number of solutions for which a pattern is matched by a single query in a bind join.
+DEFAULT_BLOCK_SIZE = 500
+
+#: The columns by which literals are ordered: literals of the same kind are ordered by their value.
+LITERAL_ORDER_COLUMNS = ('numeric_value', 'datetime_value', 'date_value', 'boolean_value', 'object')
+
+
+class Untranslatable(Exception):
+    """
+    Raised when (part of) a query cannot be translated into SQL.
+    """
+
+
+def _is_variable(term):
+    """
+    Returns whether a term of a triple pattern is a variable.
+    """
+    if isinstance(term, Variable):
+        return True
+    # blank nodes in queries are variables; told blank nodes of rdfextras are SessionBNodes
+    return isinstance(term, BNode) and type(term).__name__ != 'SessionBNode'
+
+
+class _Value(object):
+    """
+    The SQL expressions for the value of a variable in a translated BGP.
+    """
+
+    def __init__(self, kind, alias, column):
+        self.kind = kind
+        self.alias = alias
+        self.column = column
+
+    def column_sql(self, qn, column=None):
+        """
+        Returns the SQL for a column of the statement that binds the variable.
+        """
+        return "{0}.{1}".format(qn(self.alias), qn(column or self.column))
+
+    def select_sql(self, qn):
+        """
+        Returns the SQL expressions for the value, language, datatype and kind of the variable.
+        """
+        if self.kind == LITERAL:
+            return [self.column_sql(qn), self.column_sql(qn, 'language'), self.column_sql(qn, 'datatype'), "'L'"]
+        return [self.column_sql(qn), "''", "''", "'U'"]
+
+    def order_sql(self, qn):
+        """
+        Returns the SQL expressions by which the variable is ordered: URIs before literals, and
+        literals of the same kind by their value.
+        """
+        if self.kind == LITERAL:
+            return ["2"] + [self.column_sql(qn, column) for column in LITERAL_ORDER_COLUMNS]
+        return ["1"] + ["NULL"] * (len(LITERAL_ORDER_COLUMNS) - 1) + [self.column_sql(qn)]
+
+
+def _row_to_term(value, language, datatype, kind):
+    """
+    Converts the selected columns of a variable to an rdflib term.
+    """
+    if value is None:
+        return None
+    if kind == LITERAL:
+        return models.values_to_literal(value, language, datatype)
+    return deserialize_uri(value)
+
+
+class BGPQuery(object):
+    """
+    Translates a basic graph pattern into a SQL query.
+
+    The patterns are tuples of subject, predicate, object and graph. The graph is None to match
+    statements in any named graph, a variable, or the identifier of a named graph.
+    """
+
+    def __init__(self, patterns, using=None, named_graph_ids=None):
+        self.patterns = [tuple(pattern) for pattern in patterns]
+        self.using = using or router.db_for_read(models.URIStatement)
+        self.connection = connections[self.using]
+        self.qn = self.connection.ops.quote_name
+        self.named_graph_ids = {} if named_graph_ids is None else named_graph_ids
+
+        self.variables = self.get_variables(self.patterns)
+
+        resource_variables = set(term for s, p, o, g in self.patterns for term in (s, p, g) if _is_variable(term))
+        self.object_variables = [
+            variable for variable in self.variables if variable not in resource_variables
+        ]
+        if len(self.object_variables) > MAX_OBJECT_VARIABLES:
+            raise Untranslatable("too many variables that may be bound to literals")
+
+        self.branches = [
+            self._translate_branch(dict(zip(self.object_variables, kinds)))
+            for kinds in itertools.product((URI, LITERAL), repeat=len(self.object_variables))
+        ]
+        self.branches = [branch for branch in self.branches if branch is not None]
+
+    @staticmethod
+    def get_variables(patterns):
+        """
+        Returns the variables of the patterns, in order of appearance.
+        """
+        variables = []
+        for s, p, o, g in patterns:
+            for term in (s, p, o) if not isinstance(g, Variable) else (s, p, o, g):
+                if _is_variable(term) and term not in variables:
+                    variables.append(term)
+        return variables
+
+    def _get_named_graph_id(self, identifier):
+        """
+        Returns the primary key of the named graph with an identifier, or None if it does not exist.
+        """
+        if identifier not in self.named_graph_ids:
+            named_graph_id = caches.named_graphs.get(identifier)
+            if named_graph_id is None:
+                found = models.NamedGraph.objects.using(self.using).filter(identifier=identifier).values_list('id', flat=True)[:1]
+                named_graph_id = found[0] if found else None
+            self.named_graph_ids[identifier] = named_graph_id
+        return self.named_graph_ids[identifier]
+
+    def _translate_branch(self, kinds):
+        """
+        Translates the patterns for a combination of kinds of the object variables.
+
+        Returns the tables, conditions, parameters and values of the variables of the branch, or None if
+        the patterns cannot match.
+        """
+        qn = self.qn
+        tables, conditions, params, values = [], [], [], {}
+
+        for i, (s, p, o, g) in enumerate(self.patterns):
+            alias = "t{0}".format(i)
+            if isinstance(s, Literal) or isinstance(p, Literal):
+                return None
+
+            if isinstance(o, Literal) or (_is_variable(o) and kinds.get(o) == LITERAL):
+                model = models.LiteralStatement
+            else:
+                model = models.URIStatement
+            tables.append("{0} {1}".format(qn(model._meta.db_table), qn(alias)))  # pylint: disable=W0212
+
+            for term, column in ((s, 'subject'), (p, 'predicate')):
+                if _is_variable(term):
+                    self._bind(values, conditions, term, _Value(URI, alias, column))
+                elif term is not None:
+                    conditions.append("{0}.{1} = %s".format(qn(alias), qn(column)))
+                    params.append(serialize_uri(term))
+
+            if _is_variable(o):
+                self._bind(values, conditions, o, _Value(URI if model is models.URIStatement else LITERAL,
+                                                         alias, 'object'))
+            elif o is not None:
+                for column, value in model.object_values(o).items():
+                    conditions.append("{0}.{1} = %s".format(qn(alias), qn(column)))
+                    params.append(serialize_uri(value) if column == 'object' and model is models.URIStatement
+                                  else value)
+
+            if isinstance(g, Variable):
+                graph_alias = "g{0}".format(i)
+                tables.append("{0} {1}".format(qn(models.NamedGraph._meta.db_table), qn(graph_alias)))  # pylint: disable=W0212
+                conditions.append("{0}.{1} = {2}.{3}".format(qn(graph_alias), qn('id'), qn(alias), qn('context_id')))
+                self._bind(values, conditions, g, _Value(URI, graph_alias, 'identifier'))
+            elif g is not None:
+                named_graph_id = self._get_named_graph_id(g)
+                if named_graph_id is None:
+                    return None
+                conditions.append("{0}.{1} = %s".format(qn(alias), qn('context_id')))
+                params.append(named_graph_id)
+
+        return tables, conditions, params, values
+
+    def _bind(self, values, conditions, variable, value):
+        """
+        Binds a variable to a value, or joins the value with the earlier binding of the variable.
+        """
+        bound = values.get(variable)
+        if bound is None:
+            values[variable] = value
+            return
+
+        qn = self.qn
+        conditions.append("{0} = {1}".format(bound.column_sql(qn), value.column_sql(qn)))
+        if bound.kind == LITERAL and value.kind == LITERAL:
+            for column in ('language', 'datatype'):
+                conditions.append("{0} = {1}".format(bound.column_sql(qn, column), value.column_sql(qn, column)))
+
+    def sql(self, variables=None, filters=(), order_by=(), distinct=False, limit=None, offset=None):
+        """
+        Returns the SQL and parameters of the query that selects the value, language, datatype and
+        kind of each of the variables.
+
+        The filters are functions that translate a condition on the values of a branch to SQL and
+        parameters. The order_by is a sequence of (variable, descending) tuples; the expressions by which
+        the variables are ordered are selected after their values.
+        """
+        variables = self.variables if variables is None else variables
+        if distinct and any(variable not in variables for variable, _ in order_by):
+            raise Untranslatable("ordering distinct solutions by a variable that is not selected")
+
+        queries, params = [], []
+        for tables, conditions, branch_params, values in self.branches:
+            conditions, branch_params = list(conditions), list(branch_params)
+            for translate in filters:
+                condition, condition_params = translate(values)
+                conditions.append(condition)
+                branch_params.extend(condition_params)
+
+            columns = []
+            for variable in variables:
+                if variable not in values:
+                    raise Untranslatable("{0} is not bound by the pattern".format(variable))
+                columns.extend(values[variable].select_sql(self.qn))
+            for variable, _ in order_by:
+                columns.extend(values[variable].order_sql(self.qn))
+            query = "SELECT {0}{1} FROM {2}".format(
+                "DISTINCT " if distinct else "", ", ".join(columns) or "1", ", ".join(tables))
+            if conditions:
+                query += " WHERE " + " AND ".join("({0})".format(condition) for condition in conditions)
+
+            queries.append(query)
+            params.extend(branch_params)
+
+        if not queries:
+            return None, []
+        if len(queries) > 1:
+            query = " UNION ALL ".join(queries) if not distinct else " UNION ".join(queries)
+        else:
+            query = queries[0]
+
+        if order_by:
+            # the order columns follow the columns of the variables; they are referred to by position so
+            # that a union of queries can be ordered as well
+            width = len(LITERAL_ORDER_COLUMNS) + 1
+            query += " ORDER BY " + ", ".join(
+                "{0:d}{1}".format(4 * len(variables) + i * width + j + 1, " DESC" if descending else " ASC")
+                for i, (_, descending) in enumerate(order_by)
+                for j in range(width))
+
+        if limit is not None or offset:
+            if limit is None:
+                limit = self.connection.ops.no_limit_value()
+            if limit is not None:
+                query += " LIMIT {0:d}".format(limit)
+            if offset:
+                query += " OFFSET {0:d}".format(offset)
+        return query, params
+
+    def execute(self, variables=None, **kwargs):
+        """
+        Yields the solutions of the query, as tuples of the values of the variables.
+        """
+        variables = self.variables if variables is None else variables
+        query, params = self.sql(variables, **kwargs)
+        if query is None:
+            return
+
+        cursor = self.connection.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(self.connection.features.can_use_chunked_reads and 1000 or 100)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(_row_to_term(*row[i * 4:i * 4 + 4]) for i in range(len(variables)))
+
+
+def batch_unify(patterns, block_size=DEFAULT_BLOCK_SIZE, using=None):
+    """
+    Returns the bindings of the variables of a basic graph pattern, for every solution.
+
+    The patterns are the (subject, predicate, object, graph) tuples that rdfextras passes to
+    the batch_unify method of a store. Patterns that cannot be translated at once are matched
+    by a bind join: the first pattern is matched on its own, and the others for blocks of its solutions.
+    """
+    try:
+        query = BGPQuery(patterns, using=using)
+    except Untranslatable:
+        if len(patterns) < 2:
+            raise
+        return bind_join(patterns[1:], batch_unify(patterns[:1], block_size, using), block_size=block_size,
+                         using=using)
+    return (dict(zip(query.variables, solution)) for solution in query.execute())
+
+
+def _term_key(term):
+    """
+    Returns a key that identifies a term exactly, unlike the equality of literals.
+    """
+    return None if term is None else models.term_to_values(term)
+
+
+def _translate_choices(variable, terms, qn):
+    """
+    Returns a function that translates the condition that a variable is bound to one of a set of terms to SQL.
+
+    Literals are only matched on their lexical form; their language and datatype are matched by the caller.
+    """
+    uris = sorted(set(serialize_uri(term) for term in terms if not isinstance(term, Literal)))
+    lexical_forms = sorted(set(unicode(term) for term in terms if isinstance(term, Literal)))
+
+    def translate(values):
+        value = values[variable]
+        choices = lexical_forms if value.kind == LITERAL else uris
+        if not choices:
+            return "1 = 0", []
+        return "{0} IN ({1})".format(value.column_sql(qn), ", ".join(["%s"] * len(choices))), choices
+
+    return translate
+
+
+def bind_join(patterns, solutions, optional=False, block_size=DEFAULT_BLOCK_SIZE, named_graph_ids=None,  # pylint: disable=R0913
+              using=None):
+    """
+    Yields the solutions of a sequence of solutions joined with a basic graph pattern, in order.
+
+    The pattern is matched for a block of solutions at a time, by a single SQL query that selects the
+    statements for all the values the block binds to the variables of the pattern. If optional is True,
+    solutions that do not match the pattern are kept, as in an OPTIONAL graph pattern.
+    """
+    try:
+        query = BGPQuery(patterns, using=using, named_graph_ids=named_graph_ids)
+    except Untranslatable:
+        if len(patterns) < 2 or optional:
+            raise
+        joined = bind_join(patterns[:1], solutions, block_size=block_size, named_graph_ids=named_graph_ids,
+                           using=using)
+        for solution in bind_join(patterns[1:], joined, block_size=block_size, named_graph_ids=named_graph_ids,
+                                  using=using):
+            yield solution
+        return
+
+    solutions = iter(solutions)
+    while True:
+        first = list(itertools.islice(solutions, 1))
+        if not first:
+            return
+        # the number of terms in the IN conditions of a query is bounded by the block size
+        bound_variables = [variable for variable in query.variables if first[0].get(variable) is not None]
+        size = max(1, block_size // max(1, len(bound_variables) * len(query.branches)))
+        block = first + list(itertools.islice(solutions, size - 1))
+
+        # solutions that bind different variables of the pattern are matched by different queries
+        groups = {}
+        for solution in block:
+            key = tuple(variable for variable in query.variables if solution.get(variable) is not None)
+            groups.setdefault(key, []).append(solution)
+
+        matches = {}
+        for variables, group in groups.items():
+            filters = [_translate_choices(variable, [solution[variable] for solution in group], query.qn)
+                       for variable in variables]
+            for result in query.execute(filters=filters):
+                values = dict(zip(query.variables, result))
+                key = (variables, tuple(_term_key(values.pop(variable)) for variable in variables))
+                matches.setdefault(key, []).append(values)
+
+        for solution in block:
+            variables = tuple(variable for variable in query.variables if solution.get(variable) is not None)
+            extensions = matches.get((variables, tuple(_term_key(solution[variable]) for variable in variables)))
+            if not extensions and optional:
+                yield solution
+            for extension in extensions or ():
+                joined = dict(solution)
+                joined.update(extension)
+                yield joined
+
+
+def _reduce(expression):
+    """
+    Normalizes a parsed expression of rdfextras.
+    """
+    return expression.reduce() if hasattr(expression, 'reduce') else expression
+
+
+def _translate_constant(term, prolog):
+    """
+    Converts a parsed constant of rdfextras to an rdflib term.
+    """
+    from rdfextras.sparql.evaluate import convertTerm
+    term = convertTerm(_reduce(term), prolog)
+    if isinstance(term, bool) or not isinstance(term, (Literal, BNode)) and not hasattr(term, 'n3'):
+        raise Untranslatable("unsupported constant {0!r}".format(term))
+    if _is_variable(term):
+        raise Untranslatable("blank node in a filter")
+    return term
+
+
+def _translate_comparison(variable, operator, constant, qn):
+    """
+    Returns a function that translates the comparison of a variable with a constant to SQL.
+    """
+    from rdflib_django.store import _get_typed_value_field
+    sql_operator = OPERATORS[operator]
+    ordering = operator not in ('=', '!=')
+
+    typed = None
+    python_value = constant.toPython() if isinstance(constant, Literal) else None
+    if python_value is not None and not isinstance(python_value, Literal):
+        try:
+            field = models.LiteralStatement._meta.get_field(  # pylint: disable=W0212
+                _get_typed_value_field(None, [python_value]))
+        except ValueError:
+            field = None
+        if field is not None:
+            try:
+                lookup, stored = field.to_lookup(LOOKUPS[operator], python_value)
+            except ValueError:
+                raise Untranslatable("comparison with {0!r}".format(constant))
+            typed = field.name, LOOKUP_OPERATORS.get(lookup, sql_operator), stored
+
+    def translate(values):
+        value = values[variable]
+        if not isinstance(constant, Literal):
+            if value.kind == LITERAL or ordering:
+                # a literal never equals a URI, and URIs cannot be ordered
+                return ("1 = 1" if operator == '!=' and not ordering else "1 = 0"), []
+            return "{0} {1} %s".format(value.column_sql(qn), sql_operator), [serialize_uri(constant)]
+
+        if value.kind == URI:
+            return ("1 = 1" if operator == '!=' else "1 = 0"), []
+
+        if typed is not None:
+            name, typed_operator, stored = typed
+            return "{0} {1} %s".format(value.column_sql(qn, name), typed_operator), [stored]
+
+        lexical, language, datatype = models.literal_to_values(constant)
+        if ordering:
+            if language or datatype:
+                raise Untranslatable("ordering literals other than simple literals")
+            return "{0} {1} %s AND {2} = '' AND {3} = ''".format(
+                value.column_sql(qn), sql_operator, value.column_sql(qn, 'language'),
+                value.column_sql(qn, 'datatype')), [lexical]
+
+        condition = "{0} = %s AND {1} = %s AND {2} = %s".format(
+            value.column_sql(qn), value.column_sql(qn, 'language'), value.column_sql(qn, 'datatype'))
+        return (condition if operator == '=' else "NOT ({0})".format(condition)), [lexical, language, datatype]
+
+    return translate
+
+
+def _translate_filter(expression, prolog, qn, variables):
+    """
+    Returns a function that translates a parsed FILTER expression to SQL for the values of a branch.
+    """
+    from rdfextras.sparql import components
+
+    expression = _reduce(expression)
+    if isinstance(expression, (components.ParsedConditionalAndExpressionList,
+                               components.ParsedRelationalExpressionList)):
+        # despite its name, a ParsedConditionalAndExpressionList is a disjunction
+        connective = " OR " if isinstance(expression, components.ParsedConditionalAndExpressionList) else " AND "
+        parts = [_translate_filter(part, prolog, qn, variables) for part in expression]
+
+        def translate(values):
+            conditions, params = [], []
+            for part in parts:
+                condition, condition_params = part(values)
+                conditions.append("({0})".format(condition))
+                params.extend(condition_params)
+            return connective.join(conditions), params
+
+        return translate
+
+    if isinstance(expression, components.BinaryOperator) and expression.NAME in OPERATORS:
+        left, right = _reduce(expression.left), _reduce(expression.right)
+        operator = expression.NAME
+        if isinstance(right, Variable) and not isinstance(left, Variable):
+            left, right = right, left
+            operator = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}.get(operator, operator)
+        if not isinstance(left, Variable) or isinstance(right, Variable):
+            raise Untranslatable("only comparisons of a variable with a constant are supported")
+        if left not in variables:
+            raise Untranslatable("{0} is not bound by the pattern".format(left))
+        return _translate_comparison(left, operator, _translate_constant(right, prolog), qn)
+
+    raise Untranslatable("unsupported filter {0!r}".format(expression))
+
+
+def evaluate_select(graph, query, initNs=None, initBindings=None, block_size=DEFAULT_BLOCK_SIZE,  # pylint: disable=R0913
+                    using=None):
+    """
+    Evaluates a parsed SPARQL SELECT query in the database, and returns its result.
+
+    The query must be a SELECT query over a basic graph pattern, optionally followed by OPTIONAL basic
+    graph patterns. The basic graph pattern and its filters are evaluated by a single SQL query; the
+    OPTIONAL patterns are matched by a bind join, for blocks of block_size solutions at a time.
+
+    The queries are executed on the database with alias using, or the database that Django's routers
+    select for reading statements if it is None.
+
+    Raises Untranslatable if the query has another form, or if any of its filters or solution
+    modifiers cannot be translated.
+    """
+    from rdflib import ConjunctiveGraph
+    from rdflib.namespace import RDF, RDFS, OWL
+    from rdfextras.sparql import algebra, components
+    from rdfextras.sparql.query import SPARQLQueryResult
+
+    select = query.query
+    if not isinstance(select, components.SelectQuery) or select.dataSets or select.recurClause is not None:
+        raise Untranslatable("only SELECT queries over the queried graph are translated")
+
+    prolog = query.prolog or components.Prolog(None, [])
+    query.prolog = prolog
+    for prefix, namespace in dict(initNs or {}, rdfs=RDFS.uri, owl=str(OWL), rdf=RDF.uri).items():
+        prolog.prefixBindings.setdefault(prefix, namespace)
+    prolog.DEBUG = False
+    prolog.answerList = []
+    prolog.eagerLimit = None
+    prolog.rightMostBGPs = set()
+    algebra.ReduceToAlgebra.prolog = prolog
+
+    # the triples of a group graph pattern follow its OPTIONAL pattern, if any
+    required, optionals = [], []
+    graph_patterns = select.whereClause.parsedGraphPattern.graphPatterns
+    for pattern in graph_patterns:
+        optional = pattern.nonTripleGraphPattern
+        if optional is not None:
+            if not isinstance(optional, components.ParsedOptionalGraphPattern) or any(
+                    part.filter is not None or part.nonTripleGraphPattern is not None for part in optional.graphPatterns):
+                raise Untranslatable("only OPTIONAL basic graph patterns are translated")
+            expression = reduce(algebra.ReduceToAlgebra, optional.graphPatterns, None)
+            if not isinstance(expression, algebra.BasicGraphPattern) or not expression.patterns:
+                raise Untranslatable("only OPTIONAL basic graph patterns are translated")
+            optionals.append(expression.patterns)
+        if pattern.triples:
+            if optionals:
+                raise Untranslatable("only basic graph patterns before OPTIONAL patterns are translated")
+            required.extend(algebra.ReduceGraphPattern(pattern, prolog).patterns)
+    if not required:
+        raise Untranslatable("only basic graph patterns are translated")
+
+    bindings = dict(initBindings or {})
+    substitute = lambda term: bindings.get(term, term)
+    if isinstance(graph, ConjunctiveGraph):
+        graph_name = None
+    else:
+        graph_name = graph.identifier
+    named_graph_ids = {}
+    patterns = [(substitute(s), substitute(p), substitute(o), graph_name) for s, p, o, _ in required]
+    optionals = [[(substitute(s), substitute(p), substitute(o), graph_name) for s, p, o, _ in optional]
+                 for optional in optionals]
+    bgp = BGPQuery(patterns, using=using, named_graph_ids=named_graph_ids)
+    qn = bgp.qn
+
+    filters = [_translate_filter(pattern.filter.filter, prolog, qn, bgp.variables)
+               for pattern in graph_patterns if pattern.filter is not None]
+
+    order_by = []
+    modifier = select.solutionModifier
+    for condition in modifier.orderClause or ():
+        if isinstance(condition, Variable):
+            order_by.append((condition, False))
+        else:
+            variable = _reduce(condition.expression)
+            if not isinstance(variable, Variable):
+                raise Untranslatable("ordering by expressions")
+            order_by.append((variable, condition.order == components.DESCENDING_ORDER))
+    if any(variable not in bgp.variables for variable, _ in order_by):
+        raise Untranslatable("ordering by a variable that is not bound by the pattern")
+    limit = int(modifier.limitClause) if modifier.limitClause is not None else None
+    offset = int(modifier.offsetClause) if modifier.offsetClause is not None else None
+
+    all_variables = []
+    for pattern in [patterns] + optionals:
+        all_variables.extend(variable for variable in BGPQuery.get_variables(pattern)
+                             if isinstance(variable, Variable) and variable not in all_variables)
+    selection = list(select.variables)
+    selected = selection or all_variables
+
+    if not optionals:
+        # the whole query is evaluated by the database
+        projected = [variable for variable in selected if variable in bgp.variables]
+        results = bgp.execute(projected, filters=filters, order_by=order_by, distinct=select.distinct,
+                              limit=limit, offset=offset)
+        solutions = (dict(zip(projected, result)) for result in results)
+    else:
+        # DISTINCT, LIMIT and OFFSET apply to the solutions of the OPTIONAL patterns
+        results = bgp.execute(filters=filters, order_by=order_by)
+        solutions = (dict(zip(bgp.variables, result)) for result in results)
+        for optional in optionals:
+            solutions = bind_join(optional, solutions, optional=True, block_size=block_size,
+                                  named_graph_ids=named_graph_ids, using=using)
+        if select.distinct:
+            solutions = _distinct(solutions, selected)
+        solutions = itertools.islice(solutions, offset or 0, None if limit is None else (offset or 0) + limit)
+
+    rows = []
+    for solution in solutions:
+        row = tuple(solution.get(variable, bindings.get(variable)) for variable in selected)
+        rows.append(row[0] if len(selected) == 1 else row)
+
+    return SPARQLQueryResult((rows, selection, all_variables, modifier.orderClause, select.distinct, []))
+
+
+def _distinct(solutions, variables):
+    """
+    Yields the solutions that differ in the values of the variables, in order.
+    """
+    seen = set()
+    for solution in solutions:
+        key = tuple(_term_key(solution.get(variable)) for variable in variables)
+        if key not in seen:
+            seen.add(key)
+            yield solution
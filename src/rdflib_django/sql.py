@@ -0,0 +1,188 @@
+"""
+Database-specific SQL for operations that the Django ORM does not provide.
+"""
+import time
+import uuid
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import signals
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.dispatch.dispatcher import _make_id
+
+
+#: The INSERT statements that ignore rows with an existing primary key, per database vendor.
+INSERT_IGNORE_SQL = {
+    'sqlite': "INSERT OR IGNORE INTO {table} ({columns}) VALUES {values}",
+    'postgresql': "INSERT INTO {table} ({columns}) VALUES {values} ON CONFLICT DO NOTHING",
+    'mysql': "INSERT IGNORE INTO {table} ({columns}) VALUES {values}",
+}
+
+
+def insert_ignore(model, objs, using=None):
+    """
+    Inserts the model instances, ignoring the instances whose primary key is already stored.
+    Returns the number of inserted instances.
+
+    Like bulk_create, this does not call save() on the instances and does not send any signals.
+    The model must not have an auto-incremented primary key.
+
+    On databases that support it, the instances are inserted using multi-row INSERT statements
+    that ignore conflicts. On other databases, the stored primary keys are looked up first and
+    the remaining instances are inserted using bulk_create.
+    """
+    if not objs:
+        return 0
+
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    sql = INSERT_IGNORE_SQL.get(connection.vendor)
+    if sql is None:
+        pk_name = model._meta.pk.name  # pylint: disable=W0212
+        for obj in objs:
+            model._meta.pk.pre_save(obj, True)  # pylint: disable=W0212
+        stored = set(model.objects.using(using)
+                     .filter(pk__in=[obj.pk for obj in objs])
+                     .values_list(pk_name, flat=True))
+        inserted = [obj for obj in objs if obj.pk not in stored]
+        model.objects.using(using).bulk_create(inserted)
+        return len(inserted)
+
+    qn = connection.ops.quote_name
+    fields = model._meta.local_fields  # pylint: disable=W0212
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    row = "({0})".format(", ".join(["%s"] * len(fields)))
+
+    inserted = 0
+    cursor = connection.cursor()
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        params = [
+            f.get_db_prep_save(f.pre_save(obj, True), connection=connection)
+            for obj in batch
+            for f in fields
+        ]
+        cursor.execute(sql.format(
+            table=qn(model._meta.db_table),  # pylint: disable=W0212
+            columns=", ".join(qn(f.column) for f in fields),
+            values=", ".join([row] * len(batch))), params)
+        inserted += cursor.rowcount
+
+    transaction.commit_unless_managed(using=using)
+    return inserted
+
+
+def _has_delete_receivers(model):
+    """
+    Checks whether any receivers are connected to the delete signals of a model.
+    """
+    sender = _make_id(model)
+    return any(signal._live_receivers(sender) for signal in (signals.pre_delete, signals.post_delete))  # pylint: disable=W0212
+
+
+def delete(query_set):
+    """
+    Deletes the rows of a query set, and returns the number of deleted rows.
+
+    QuerySet.delete() first fetches every row to collect related objects and send the delete signals.
+    When the model has no related objects and no receivers are connected to its delete signals, and the
+    query set only refers to the table of the model, the rows are deleted by a single DELETE ... WHERE
+    statement instead.
+    """
+    model = query_set.model
+    query = query_set.query.clone()
+    tables = [alias for alias in query.tables if query.alias_refcount[alias]] or [query.get_initial_alias()]
+    if _has_delete_receivers(model) or model._meta.get_all_related_objects() or len(tables) != 1:  # pylint: disable=W0212
+        count = query_set.count()
+        query_set.delete()
+        return count
+
+    connection = connections[query_set.db]
+    compiler = query.get_compiler(connection=connection)
+    try:
+        where, params = query.where.as_sql(qn=compiler.quote_name_unless_alias, connection=connection)
+    except EmptyResultSet:
+        return 0
+
+    sql = "DELETE FROM {0}".format(connection.ops.quote_name(tables[0]))
+    if where:
+        sql += " WHERE {0}".format(where)
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    transaction.commit_unless_managed(using=query_set.db)
+    return cursor.rowcount
+
+
+def _record_query(connection, cursor, query, params, seconds):  # pylint: disable=R0913
+    """
+    Records a query that was executed on a raw cursor in connection.queries, as Django's debug cursor
+    would, together with the statement, params and database alias that instrumentation keeps.
+    """
+    if not (connection.use_debug_cursor or (connection.use_debug_cursor is None and settings.DEBUG)):
+        return
+    connection.queries.append({
+        'sql': connection.ops.last_executed_query(cursor, query, params),
+        'time': "%.3f" % seconds,
+        'statement': query,
+        'params': params,
+        'alias': connection.alias,
+    })
+
+
+def iterate_rows(query_set, fields, chunk_size, key=('pk',), descending=False):
+    """
+    Yields the values of fields for the rows of a query set, without holding more than chunk_size rows in memory.
+
+    The values are yielded as they are stored in the database, without any conversion by the model fields.
+    The rows are ordered by the fields in key, which should uniquely identify the rows of the query set.
+
+    On PostgreSQL, the rows are fetched from a server-side cursor that is held open across commits.
+    That cursor bypasses Django's debug cursor, so its query is recorded in connection.queries here.
+    On other databases, no cursor is kept open between chunks: SQLite, for instance, resets its cursors
+    on every commit. Instead, the rows are fetched in chunks, and every chunk continues after the key of
+    the last row of the previous one. When an index starts with the key fields, the rows are read from
+    the index without sorting.
+
+    If descending is True, the rows are fetched in descending order of key instead.
+    """
+    connection = connections[query_set.db]
+    fields = list(fields)
+    query_set = query_set.order_by(*(['-' + name for name in key] if descending else key))  # pylint: disable=W0142
+
+    if connection.vendor == 'postgresql':
+        query, params = query_set.values_list(*fields).query.sql_with_params()  # pylint: disable=W0142
+        connection.cursor()
+        cursor = connection.connection.cursor(name="rdflib_django_{0}".format(uuid.uuid4().hex), withhold=True)
+        cursor.itersize = chunk_size
+        try:
+            start = time.time()
+            try:
+                cursor.execute(query, params)
+            finally:
+                _record_query(connection, cursor, query, params, time.time() - start)
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close()
+        return
+
+    opts = query_set.model._meta  # pylint: disable=W0212
+    qn = connection.ops.quote_name
+    columns = ", ".join(
+        "{0}.{1}".format(qn(opts.db_table), qn(opts.pk.column if name == 'pk' else opts.get_field(name).column))
+        for name in key)
+    selected = fields + [name for name in key if name not in fields]
+    positions = [selected.index(name) for name in key]
+    query_set = query_set.values_list(*selected)  # pylint: disable=W0142
+
+    last = None
+    while True:
+        chunk = query_set
+        if last is not None:
+            chunk = chunk.extra(where=["({0}) {1} ({2})".format(
+                columns, "<" if descending else ">", ", ".join(["%s"] * len(last)))], params=last)
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield row[:len(fields)]
+        if len(rows) < chunk_size:
+            break
+        last = [rows[-1][position] for position in positions]
@@ -1,16 +1,33 @@
 """
 Essential implementation of the Store interface defined by RDF lib.
 """
+from contextlib import contextmanager
+import itertools
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
 from django.db.utils import IntegrityError
 import rdflib
 from rdflib.store import VALID_STORE
-from rdflib.term import Literal, Identifier
-from rdflib_django import models
+from rdflib.term import Literal, Identifier, URIRef
+from rdflib_django import models, caches, counts, indexes, instrumentation, routing, slowlog, sparql, sql  # pylint: disable=W0611
+from rdflib_django.fields import serialize_uri, serialize_object, triple_key
 from rdflib_django.models import NamespaceModel
 
 
 DEFAULT_STORE = "Default Store"
 
+DEFAULT_BATCH_SIZE = 500
+
+#: The prefix of the identifiers of the named graphs into which new versions of contexts are loaded.
+STAGING_PREFIX = u"urn:x-rdflib-django:staging:"
+
+#: The prefix of the identifiers of the replaced versions of contexts, until they have been removed.
+RETIRED_PREFIX = u"urn:x-rdflib-django:retired:"
+
 DEFAULT_NAMESPACES = (
     ("xml", u"http://www.w3.org/XML/1998/namespace"),
     ("rdf", u"http://www.w3.org/1999/02/22-rdf-syntax-ns#"),
@@ -38,14 +55,139 @@ def _get_query_sets_for_object(o):
     return query_sets
 
 
-def _get_named_graph(context):
+def _get_named_graph_id(context, create=False, using=None):
+    """
+    Returns the primary key of the named graph for this context.
+
+    Primary keys are looked up in a process-wide cache first. If the named graph does not
+    exist, it is only created if create is True; otherwise None is returned. Named graphs
+    that are not created are looked up in the database with alias using, if given.
+
+    Primary keys are only cached when the current transaction has no pending changes, so a
+    rolled back transaction never leaves the primary key of a discarded graph in the cache.
+    A named graph is created in the same transaction as its statement count.
+    """
+    identifier = context.identifier
+    named_graph_id = caches.named_graphs.get(identifier)
+    if named_graph_id is not None:
+        return named_graph_id
+
+    if create:
+        named_graph_id = _create_named_graph(identifier).id
+    else:
+        found = models.NamedGraph.objects.using(using).filter(identifier=identifier).values_list('id', flat=True)[:1]
+        if not found:
+            return None
+        named_graph_id = found[0]
+
+    if not transaction.is_dirty():
+        caches.named_graphs.set(identifier, named_graph_id)
+    return named_graph_id
+
+
+def _create_named_graph(identifier):
+    """
+    Returns the named graph with an identifier, which is created with its statement count if it does not exist.
+    """
+    with _write_transaction():
+        named_graph, created = models.NamedGraph.objects.get_or_create(identifier=identifier)
+        if created:
+            counts.create_count(named_graph.id)
+    return named_graph
+
+
+def _get_filter_parameters(s, p, o, named_graph_id):
+    """
+    Returns the query set filter parameters for a triple pattern.
+    """
+    filter_parameters = dict()
+    if named_graph_id is not None:
+        filter_parameters['context_id'] = named_graph_id
+    if s:
+        filter_parameters['subject'] = s
+    if p:
+        filter_parameters['predicate'] = p
+    if o:
+        filter_parameters.update(_get_model_for_object(o).object_values(o))
+    return filter_parameters
+
+
+def _get_model_for_object(o):
+    """
+    Returns the statement model for storing the object.
+    """
+    if isinstance(o, Literal):
+        return models.LiteralStatement
+    return models.URIStatement
+
+
+def _get_typed_value_field(kind, values):
+    """
+    Returns the name of the typed value field of LiteralStatements for a kind of values, or for
+    the field that accepts all values if kind is None.
+    """
+    if kind is not None:
+        name = kind + '_value'
+        if name not in models.LiteralStatement.typed_value_fields:
+            raise ValueError("Unknown kind of values: {0}".format(kind))
+        return name
+
+    opts = models.LiteralStatement._meta  # pylint: disable=W0212
+    for name in models.LiteralStatement.typed_value_fields:
+        if values and all(opts.get_field(name).accepts(value) for value in values):
+            return name
+    raise ValueError("Cannot determine the kind of values to compare with {0}".format(values))
+
+
+def _unique(iterable, key=None):
     """
-    Returns the named graph for this context.
+    Yields the distinct items of an iterable, in order. If a key function is given, items are
+    compared by their keys.
     """
-    if context is None:
-        return None
+    seen = set()
+    for item in iterable:
+        item_key = key(item) if key else item
+        if item_key not in seen:
+            seen.add(item_key)
+            yield item
+
 
-    return models.NamedGraph.objects.get_or_create(identifier=context.identifier)[0]
+@contextmanager
+def _write_transaction():
+    """
+    Runs a block of writes in a transaction, unless the caller already manages the transaction.
+    """
+    if transaction.is_managed():
+        yield
+    else:
+        with transaction.commit_on_success():
+            yield
+
+
+def _chunks(iterable, size):
+    """
+    Splits an iterable into lists of at most size elements, without consuming more
+    than one chunk at a time.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _StoreTransaction(object):
+    """
+    The state of a store transaction: the writes that have not been flushed yet, and the savepoint
+    that the transaction rolls back to, or None if the store manages the Django transaction itself.
+    """
+
+    def __init__(self, savepoint=None):
+        self.savepoint = savepoint
+        self.pending = []
 
 
 class DjangoStore(rdflib.store.Store):
@@ -59,7 +201,10 @@ class DjangoStore(rdflib.store.Store):
     >>> g.store.context_aware
     True
     >>> g.store.transaction_aware
-    False
+    True
+
+    Outside a store transaction, every write is committed immediately. Within a transaction begun by
+    begin() or atomic(), writes are buffered and written in batches; see begin().
 
     The implementation does not support formula's.
 
@@ -79,18 +224,39 @@ class DjangoStore(rdflib.store.Store):
         ...
     ValueError: multiple stores are not allowed
 
+    Bulk operations such as addN work in batches. The size of these batches defaults to the
+    DJANGO_RDFLIB_BATCH_SIZE setting, or DEFAULT_BATCH_SIZE if that setting is absent.
+
+    >>> g.store.batch_size == DEFAULT_BATCH_SIZE
+    True
+
+    The triples that match a pattern can be cached in a Django cache, by setting DJANGO_RDFLIB_RESULT_CACHE
+    to True; see rdflib_django.caches.ResultCache. The cache is disabled by default.
+
+    >>> g.store.result_cache is None
+    True
+
+    SPARQL queries are evaluated in the database where possible; see rdflib_django.sparql.
+
+    >>> g.store.batch_unification
+    True
 
     """
 
     context_aware = True
     formula_aware = False
-    transaction_aware = False
+    transaction_aware = True
+    batch_unification = True
 
     def __init__(self, configuration=None, identifier=DEFAULT_STORE):
         if identifier and identifier != DEFAULT_STORE:
             raise ValueError("multiple stores are not allowed")
 
         self.identifier = DEFAULT_STORE
+        self.batch_size = getattr(settings, 'DJANGO_RDFLIB_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.result_cache = caches.results if getattr(settings, 'DJANGO_RDFLIB_RESULT_CACHE', False) else None
+        self.read_databases = routing.get_read_databases()
+        self._local = threading.local()
         super(DjangoStore, self).__init__(configuration, identifier)
         self.open()
 
@@ -119,10 +285,15 @@ class DjangoStore(rdflib.store.Store):
         >>> g.open(configuration=None, create=False) == rdflib.store.VALID_STORE
         True
         """
+        self._flush()
         models.NamedGraph.objects.all().delete()
         models.URIStatement.objects.all().delete()
         models.LiteralStatement.objects.all().delete()
+        models.TripleCount.objects.all().delete()
+        models.TripleCount.objects.create(context=None, count=0)
+        caches.named_graphs.clear()
 
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape)
     def add(self, (s, p, o), context, quoted=False):
         """
         Adds a triple to the store.
@@ -138,94 +309,674 @@ class DjangoStore(rdflib.store.Store):
         1
 
         """
-        assert isinstance(s, Identifier)
-        assert isinstance(p, Identifier)
-        assert isinstance(o, Identifier)
         assert not quoted
+        self.addN([(s, p, o, context)])
+
+    @instrumentation.instrumented()
+    def addN(self, quads):
+        """
+        Adds a sequence of quads to the store.
+
+        The quads are processed in batches of batch_size. Within a batch, the quads are grouped
+        by context and by kind of object; every named graph is resolved once, and the statements of
+        each group are inserted at once, ignoring the statements that are already stored.
 
-        named_graph = _get_named_graph(context)
+        The statement counts are updated in the same transaction as the statements.
 
-        query_set = _get_query_sets_for_object(o)[0]
-        query_set.get_or_create(
-            subject=s,
-            predicate=p,
-            object=o,
-            context=named_graph,
-            )
+        >>> from rdflib.term import URIRef, Literal
+        >>> from rdflib.namespace import RDF, RDFS
 
+        >>> artis = URIRef('http://zoowizard.org/resource/Artis')
+        >>> g = rdflib.Graph('Django')
+        >>> g.addN([(artis, RDF.type, URIRef('http://schema.org/Zoo'), g),
+        ...         (artis, RDFS.label, Literal('Artis'), g),
+        ...         (artis, RDFS.label, Literal('Artis'), g)])
+        >>> len(g)
+        2
+        """
+        current = self._get_transaction()
+        if current is None:
+            self._add_quads(quads)
+            return
+
+        current.pending.extend(('add', quad) for quad in quads)
+        if len(current.pending) >= self.batch_size:
+            self._flush()
+
+    def _add_quads(self, quads):
+        """
+        Writes quads to the database, batch_size quads at a time.
+        """
+        for batch in _chunks(quads, self.batch_size):
+            groups = dict()
+            contexts = dict()
+            for s, p, o, c in batch:
+                assert isinstance(s, Identifier)
+                assert isinstance(p, Identifier)
+                assert isinstance(o, Identifier)
+                assert c is not None, "Context associated with {0} {1} {2} is None!".format(s, p, o)
+
+                model = _get_model_for_object(o)
+                key = (serialize_uri(s), serialize_uri(p), serialize_object(o))
+                groups.setdefault((c.identifier, model), dict())[key] = (s, p, o)
+                contexts.setdefault(c.identifier, c)
+
+            named_graph_ids = dict(
+                (identifier, _get_named_graph_id(context, create=True)) for identifier, context in contexts.items())
+
+            with _write_transaction():
+                deltas = dict()
+                inserted = dict()
+                for (identifier, model), statements in groups.items():
+                    named_graph_id = named_graph_ids[identifier]
+
+                    # triples that are not stored in any context yet may be new to the store
+                    keys = set(triple_key(*key) for key in statements)  # pylint: disable=W0142
+                    keys.difference_update(model.objects.filter(triple_key__in=keys).values_list('triple_key', flat=True))
+                    for key in keys:
+                        inserted.setdefault(model, dict()).setdefault(key, set()).add(named_graph_id)
+
+                    deltas[named_graph_id] = deltas.get(named_graph_id, 0) + sql.insert_ignore(model, [
+                        model(subject=s, predicate=p, context_id=named_graph_id, **model.object_values(o))
+                        for (s, p, o) in statements.values()
+                    ])
+
+                counts.lock_triple_count()
+                triple_delta = sum(counts.count_new_triples(model, keys) for model, keys in inserted.items())
+                counts.update_counts(deltas, triple_delta)
+            self._invalidate_results(deltas)
+
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape)
     def remove(self, (s, p, o), context=None):
         """
-        Removes a triple from the store.
+        Removes the triples that match a pattern from the store.
+
+        The statement counts are updated in the same transaction as the statements.
         """
-        named_graph = _get_named_graph(context)
-        query_sets = _get_query_sets_for_object(o)
+        current = self._get_transaction()
+        if current is None:
+            self._remove_patterns([((s, p, o), context)])
+            return
 
-        filter_parameters = dict()
-        if named_graph is not None:
-            filter_parameters['context_id'] = named_graph.id
-        if s:
-            filter_parameters['subject'] = s
-        if p:
-            filter_parameters['predicate'] = p
-        if o:
-            filter_parameters['object'] = o
+        current.pending.append(('remove', ((s, p, o), context)))
+        if len(current.pending) >= self.batch_size:
+            self._flush()
 
-        query_sets = [qs.filter(**filter_parameters) for qs in query_sets]  # pylint: disable=W0142
+    def _remove_patterns(self, patterns):
+        """
+        Removes the triples that match a sequence of (triple pattern, context) tuples from the database.
 
-        for qs in query_sets:
-            qs.delete()
+        Fully bound triples are removed batch_size at a time for every context and kind of object,
+        by their triple keys; other patterns are removed one at a time.
+        """
+        triples = dict()
+        for (s, p, o), context in patterns:
+            named_graph_id = None
+            if context is not None:
+                named_graph_id = _get_named_graph_id(context)
+                if named_graph_id is None:
+                    continue
+
+            if s and p and o:
+                model = _get_model_for_object(o)
+                key = triple_key(serialize_uri(s), serialize_uri(p), serialize_object(o))
+                triples.setdefault((named_graph_id, model), set()).add(key)
+            else:
+                query_sets = _get_query_sets_for_object(o)
+                filter_parameters = _get_filter_parameters(s, p, o, named_graph_id)
+                self._delete([qs.filter(**filter_parameters) for qs in query_sets], named_graph_id)  # pylint: disable=W0142
+
+        for (named_graph_id, model), keys in triples.items():
+            for chunk in _chunks(keys, self.batch_size):
+                query_set = model.objects.filter(triple_key__in=chunk)
+                if named_graph_id is not None:
+                    query_set = query_set.filter(context_id=named_graph_id)
+                self._delete([query_set], named_graph_id)
+
+    def _delete(self, query_sets, named_graph_id):
+        """
+        Deletes the statements of query sets over a named graph, or over all named graphs if
+        named_graph_id is None, and updates the statement counts.
+
+        Every query set is deleted by a single DELETE statement, unless receivers are connected
+        to the delete signals of the statement models; see sql.delete().
+        """
+        with _write_transaction():
+            counts.lock_triple_count()
+            deltas = dict()
+            triple_delta = 0
+            for qs in query_sets:
+                if named_graph_id is None:
+                    triple_delta -= qs.values('triple_key').distinct().count()
+                    for statement_context_id, count in qs.values_list('context').annotate(Count('pk')):
+                        deltas[statement_context_id] = deltas.get(statement_context_id, 0) - count
+                else:
+                    deltas[named_graph_id] = deltas.get(named_graph_id, 0) - qs.count()
+                    triple_delta -= counts.get_unique_to_context(qs).count()
+                sql.delete(qs)
+
+            counts.update_counts(deltas, triple_delta)
+        self._invalidate_results(deltas)
+
+    @instrumentation.instrumented(shape=instrumentation.context_shape)
+    def remove_context(self, context):
+        """
+        Removes a named graph from the store: its statements, its statement count and the named graph itself.
+
+        Unlike removing the triples of the context one pattern at a time, the statements of every table
+        are deleted by a single DELETE statement, and only the count of the store needs to be updated.
+
+        >>> from rdflib.term import URIRef
+        >>> from rdflib.namespace import RDF
+        >>> g = rdflib.Graph('Django', identifier=URIRef('http://example.com/zoos'))
+        >>> g.add((URIRef('http://zoowizard.org/resource/Artis'), RDF.type, URIRef('http://schema.org/Zoo')))
+        >>> g.store.remove_context(g)
+        >>> len(g), g.identifier in set(g.store.contexts())
+        (0, False)
+        """
+        self._flush()
+        named_graph_id = _get_named_graph_id(context)
+        if named_graph_id is None:
+            return
+
+        with _write_transaction():
+            counts.lock_triple_count()
+            triple_delta = 0
+            for model in counts.COUNTED_MODELS:
+                statements = model.objects.filter(context_id=named_graph_id)
+                triple_delta -= counts.get_unique_to_context(statements).count()
+                sql.delete(statements)
+            counts.update_counts({}, triple_delta)
+            sql.delete(models.TripleCount.objects.filter(context_id=named_graph_id))
+
+            # the related objects of the named graph are gone, so deleting it only sends the signals that invalidate caches
+            models.NamedGraph.objects.filter(pk=named_graph_id).delete()
+
+    def create_staging_graph(self):
+        """
+        Returns a new, empty named graph into which a new version of a context can be loaded
+        before it replaces the current version; see replace_context().
+        """
+        return rdflib.Graph(self, identifier=URIRef(STAGING_PREFIX + uuid.uuid4().hex))
+
+    def replace_context(self, context, staging, background=False):
+        """
+        Replaces the statements of a context with the statements of a staging graph, and removes the staging graph.
+
+        The staging graph takes over the identifier of the context by renaming two named graphs in a
+        single transaction, regardless of their sizes: readers of the context see either the old version
+        or the new one. The old version is renamed to a retired identifier and then removed with
+        remove_context().
+
+        Other processes may keep the primary key of the old version in their named graph cache for up to
+        check_interval seconds after the renaming is committed, so the old version is only removed once
+        that time has passed; this relies on a cache that is shared by all processes, see caches. This
+        method waits that long before it removes the old version, unless background is True: it then
+        returns at once, and the old version is removed in a separate thread, which is returned.
+
+        The renaming must be committed by this method before the old version is removed, so it cannot be
+        called within a transaction managed by the caller.
+
+        >>> from rdflib.term import URIRef, Literal
+        >>> from rdflib.namespace import RDFS
+        >>> artis = URIRef('http://zoowizard.org/resource/Artis')
+        >>> g = rdflib.Graph('Django', identifier=URIRef('http://example.com/zoos'))
+        >>> g.add((artis, RDFS.label, Literal('Artis')))
+        >>> staging = g.store.create_staging_graph()
+        >>> staging.add((artis, RDFS.label, Literal('Natura Artis Magistra')))
+        >>> g.store.replace_context(g, staging)
+        >>> list(g.objects(artis, RDFS.label))
+        [rdflib.term.Literal(u'Natura Artis Magistra')]
+        >>> staging.identifier in set(g.store.contexts())
+        False
+        """
+        if transaction.is_managed():
+            raise transaction.TransactionManagementError(
+                "The old version can only be removed once the replacement is committed")
+
+        self._flush()
+        retired = rdflib.Graph(self, identifier=URIRef(RETIRED_PREFIX + uuid.uuid4().hex))
+        with transaction.commit_on_success():
+            new = _create_named_graph(staging.identifier)
+            for old in models.NamedGraph.objects.filter(identifier=context.identifier):
+                old.identifier = retired.identifier
+                old.save()
+            new.identifier = context.identifier
+            new.save()
+
+        # processes that read the new version stamp before the commit may have cached the old primary key again
+        caches.named_graphs.invalidate()
+        if not background:
+            time.sleep(caches.named_graphs.check_interval)
+            self.remove_context(retired)
+            return None
+
+        def remove():
+            try:
+                self.remove_context(retired)
+            finally:
+                connection.close()
+
+        thread = threading.Timer(caches.named_graphs.check_interval, remove)
+        thread.start()
+        return thread
+
+    ##############
+    # TRANSACTIONS
+
+    def _get_transaction(self):
+        """
+        Returns the store transaction of the current thread, or None.
+        """
+        return getattr(self._local, 'transaction', None)
 
-    def triples(self, (s, p, o), context=None):
+    def _get_read_alias(self):
+        """
+        Returns the alias of the database to read from: one of the read_databases of the store, or None
+        for the primary database if the current thread is pinned to it or is in a transaction.
+
+        The read databases default to the DJANGO_RDFLIB_READ_DATABASES setting; see rdflib_django.routing.
+        """
+        if self._get_transaction() is not None:
+            return None
+        return routing.get_read_alias(self.read_databases)
+
+    def begin(self):
+        """
+        Begins a store transaction in the current thread, which ends with commit() or rollback().
+
+        Within the transaction, added and removed triples are buffered, and written in batches of
+        batch_size writes: consecutive additions as in addN, and fully bound removals by their triple keys.
+        The buffer is flushed when it is full, before the store is read, and when the transaction is
+        committed. If the caller already manages a Django transaction, the store transaction is a
+        savepoint within it; otherwise, the store manages a Django transaction of its own.
+
+        >>> from rdflib.term import URIRef
+        >>> from rdflib.namespace import RDF
+        >>> artis = URIRef('http://zoowizard.org/resource/Artis')
+        >>> g = rdflib.Graph('Django')
+        >>> g.store.begin()
+        >>> g.add((artis, RDF.type, URIRef('http://schema.org/Zoo')))
+        >>> g.rollback()
+        >>> len(g)
+        0
+        """
+        if self._get_transaction() is not None:
+            raise ValueError("a store transaction is already in progress")
+
+        if transaction.is_managed():
+            self._local.transaction = _StoreTransaction(transaction.savepoint())
+        else:
+            transaction.enter_transaction_management()
+            transaction.managed(True)
+            self._local.transaction = _StoreTransaction()
+
+    def _flush(self):
+        """
+        Writes the buffered writes of the store transaction of the current thread, in order.
+        """
+        current = self._get_transaction()
+        if current is None or not current.pending:
+            return
+
+        pending, current.pending = current.pending, []
+        for kind, writes in itertools.groupby(pending, key=lambda write: write[0]):
+            if kind == 'add':
+                self._add_quads(quad for _, quad in writes)
+            else:
+                self._remove_patterns(pattern for _, pattern in writes)
+
+    def commit(self):
+        """
+        Writes the buffered writes and commits the store transaction of the current thread.
+        Without a store transaction, writes are committed immediately, so this does nothing.
+        """
+        current = self._get_transaction()
+        if current is None:
+            return
+
+        try:
+            self._flush()
+        except:
+            self.rollback()
+            raise
+
+        self._local.transaction = None
+        if current.savepoint is None:
+            try:
+                transaction.commit()
+            finally:
+                transaction.leave_transaction_management()
+                self._invalidate_pending_results()
+        else:
+            transaction.savepoint_commit(current.savepoint)
+
+    def rollback(self):
+        """
+        Discards the buffered writes and rolls back the store transaction of the current thread.
+        Without a store transaction, writes are committed immediately, so this does nothing.
+        """
+        current = self._get_transaction()
+        if current is None:
+            return
+
+        self._local.transaction = None
+        if current.savepoint is None:
+            try:
+                transaction.rollback()
+            finally:
+                transaction.leave_transaction_management()
+                self._invalidate_pending_results()
+        else:
+            transaction.savepoint_rollback(current.savepoint)
+
+    @contextmanager
+    def atomic(self):
+        """
+        Runs a block in a store transaction, which is committed if the block succeeds and rolled back otherwise.
+
+        >>> from rdflib.term import URIRef
+        >>> from rdflib.namespace import RDF
+        >>> g = rdflib.Graph('Django')
+        >>> with g.store.atomic():
+        ...     for i in range(10):
+        ...         g.add((URIRef('http://example.com/{0}'.format(i)), RDF.type, URIRef('http://schema.org/Zoo')))
+        >>> len(g)
+        10
+        """
+        self.begin()
+        try:
+            yield
+        except:
+            self.rollback()
+            raise
+        self.commit()
+
+    def _invalidate_pending_results(self):
+        """
+        Invalidates the cached results of the named graphs written to by the transaction that has just ended.
+        """
+        if self.result_cache is not None:
+            self.result_cache.invalidate_pending()
+
+    def _invalidate_results(self, deltas):
+        """
+        Invalidates the cached results of the named graphs whose statement counts changed by a write,
+        now and, within a managed transaction, once the transaction has ended.
+        """
+        changed = [named_graph_id for named_graph_id, delta in deltas.items() if delta]
+        if self.result_cache is not None and changed:
+            self.result_cache.invalidate_on_commit(changed)
+
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape, iterator=True)
+    def triples(self, (s, p, o), context=None, language=None, datatype=None):
         """
         Returns all triples in the current store.
+
+        If a language or datatype is given, only the triples whose object is a literal with that
+        language or datatype are returned. These constraints are applied by the database:
+
+        >>> from rdflib.term import URIRef, Literal
+        >>> from rdflib.namespace import RDFS
+        >>> artis = URIRef('http://zoowizard.org/resource/Artis')
+        >>> g = rdflib.Graph('Django')
+        >>> g.add((artis, RDFS.label, Literal('Artis', lang='nl')))
+        >>> g.add((artis, RDFS.label, Literal('Artis Zoo', lang='en')))
+        >>> [o for (_, _, o), _ in g.store.triples((artis, RDFS.label, None), g, language='en')]
+        [rdflib.term.Literal(u'Artis Zoo', lang=u'en')]
+
+        The statements are read batch_size rows at a time, as plain tuples of column values that
+        are converted into rdflib terms directly, without instantiating any models. Every chunk is
+        read from the index that serves the triple pattern.
+
+        If the store has a result cache, the triples read from the primary database are read through it;
+        replicas may lag behind the invalidations of the cache. Like every read, this first writes the
+        buffered writes of the store transaction of the current thread.
         """
-        named_graph = _get_named_graph(context)
-        query_sets = _get_query_sets_for_object(o)
+        self._flush()
+        using = self._get_read_alias()
+        named_graph_id = None
+        if context is not None:
+            named_graph_id = _get_named_graph_id(context, using=using)
+            if named_graph_id is None:
+                return
 
-        filter_parameters = dict()
-        if named_graph is not None:
-            filter_parameters['context_id'] = named_graph.id
-        if s:
-            filter_parameters['subject'] = s
-        if p:
-            filter_parameters['predicate'] = p
-        if o:
-            filter_parameters['object'] = o
+        triples = self._read_triples((s, p, o), named_graph_id, language, datatype, using)
+        if self.result_cache is not None and using is None:
+            triples = self.result_cache.read_through((s, p, o, language, datatype), named_graph_id, triples)
+        for triple in triples:
+            yield triple, context
 
-        query_sets = [qs.filter(**filter_parameters) for qs in query_sets]  # pylint: disable=W0142
+    def _read_triples(self, (s, p, o), named_graph_id, language, datatype, using=None):  # pylint: disable=R0913
+        """
+        Yields the triples that match a pattern in a named graph, or in all named graphs if
+        named_graph_id is None, from the database with alias using.
+        """
+        filter_parameters = _get_filter_parameters(s, p, o, named_graph_id)
+        query_sets = _get_query_sets_for_object(o)
+        if language is not None or datatype is not None:
+            if o and not isinstance(o, Literal):
+                return
+            query_sets = [models.LiteralStatement.objects]
+            if language is not None:
+                filter_parameters['language'] = language
+            if datatype is not None:
+                filter_parameters['datatype'] = datatype
 
         for qs in query_sets:
-            for statement in qs:
-                triple = statement.as_triple()
-                yield triple, context
+            model = qs.model
+            key = indexes.get_scan_order(bool(s), bool(p), bool(o), named_graph_id is not None,
+                                         language is not None, datatype is not None, model=model)
+            rows = sql.iterate_rows(qs.using(using).filter(**filter_parameters),  # pylint: disable=W0142
+                                    model.row_fields, self.batch_size, key=key)
+            for row in rows:
+                yield model.row_to_triple(row)
+
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape, iterator=True)
+    def triples_choices(self, (s, p, o), context=None):
+        """
+        Returns the triples in the store that match a pattern in which either the subject, the predicate
+        or the object is a list of terms, matching any of them. An empty list matches every term.
 
+        The terms are looked up batch_size at a time, with an IN condition per statement table:
+
+        >>> from rdflib.term import URIRef, Literal
+        >>> from rdflib.namespace import RDFS
+        >>> zoos = [URIRef('http://zoowizard.org/resource/Artis'), URIRef('http://zoowizard.org/resource/Berlin_Zoo')]
+        >>> g = rdflib.Graph('Django')
+        >>> g.add((zoos[0], RDFS.label, Literal('Artis')))
+        >>> g.add((zoos[1], RDFS.label, Literal('Zoologischer Garten Berlin', lang='de')))
+        >>> sorted(unicode(o) for (_, _, o), _ in g.store.triples_choices((zoos, RDFS.label, None), g))
+        [u'Artis', u'Zoologischer Garten Berlin']
+        """
+        pattern = [s, p, o]
+        lists = [position for position, term in enumerate(pattern) if isinstance(term, list)]
+        assert len(lists) == 1, "exactly one position of the pattern must be a list"
+        position = lists[0]
+
+        choices = list(_unique(pattern[position], key=models.term_to_values))
+        pattern[position] = None
+        if not choices:
+            for triple in self.triples(tuple(pattern), context):
+                yield triple
+            return
+
+        self._flush()
+        using = self._get_read_alias()
+        named_graph_id = None
+        if context is not None:
+            named_graph_id = _get_named_graph_id(context, using=using)
+            if named_graph_id is None:
+                return
+
+        field = (indexes.SUBJECT, indexes.PREDICATE, indexes.OBJECT)[position]
+        bound = [bool(term) for term in pattern] + [named_graph_id is not None]
+        bound[position] = True
+
+        for chunk in _chunks(choices, self.batch_size):
+            if position == 2:
+                groups = [(models.URIStatement, [term for term in chunk if not isinstance(term, Literal)]),
+                          (models.LiteralStatement, [term for term in chunk if isinstance(term, Literal)])]
+            else:
+                groups = [(qs.model, chunk) for qs in _get_query_sets_for_object(pattern[2])]
+
+            for model, terms in groups:
+                if not terms:
+                    continue
+                filter_parameters = _get_filter_parameters(pattern[0], pattern[1], pattern[2], named_graph_id)
+                filter_parameters[field + '__in'] = [model.object_values(term)['object'] if position == 2 else term
+                                                     for term in terms]
+                # the statements are read per choice, in the order of the index that serves the pattern
+                choice_fields = indexes.get_model_fields(model, (field,))
+                key = choice_fields + indexes.get_scan_order(*bound, model=model)  # pylint: disable=W0142
+                literals = None
+                if position == 2 and model is models.LiteralStatement:
+                    literals = set(tuple(unicode(value) for value in models.literal_to_values(term)) for term in terms)
+
+                rows = sql.iterate_rows(model.objects.using(using).filter(**filter_parameters),  # pylint: disable=W0142
+                                        model.row_fields, self.batch_size, key=key)
+                for row in rows:
+                    if literals is not None and tuple(row[2:5]) not in literals:
+                        continue
+                    yield model.row_to_triple(row), context
+
+    @instrumentation.instrumented(shape=instrumentation.range_shape, iterator=True)
+    def range_triples(self, (s, p), context=None, gt=None, gte=None, lt=None, lte=None,  # pylint: disable=R0913
+                      kind=None, descending=False, limit=None):
+        """
+        Returns the triples of predicate p whose object is a literal with a value within a range,
+        ordered by that value. If s is given, only the triples with subject s are returned.
+
+        The bounds gt, gte, lt and lte are compared with the values of the numeric, boolean, date or
+        dateTime literals of the predicate, depending on the Python type of the bounds; Literal bounds are
+        compared using their Python value. Without bounds, the kind of values to return must be given
+        as 'numeric', 'boolean', 'date' or 'datetime'. At most limit triples are returned.
+
+        The comparisons and the ordering are performed by the database, using the typed shadow columns
+        of LiteralStatements and the index on the values of every predicate. Numbers that a double
+        cannot represent exactly have no typed value, and are never returned; see fields.NumericValueField.
+
+        >>> import datetime
+        >>> from rdflib.term import URIRef, Literal
+        >>> founded = URIRef('http://example.com/founded')
+        >>> g = rdflib.Graph('Django')
+        >>> for i, year in enumerate([1838, 1844, 1931]):
+        ...     g.add((URIRef('http://example.com/zoo/{0}'.format(i)), founded, Literal(datetime.date(year, 1, 1))))
+        >>> [o.toPython().year for (_, _, o), _ in g.store.range_triples((None, founded), g, gt=datetime.date(1840, 1, 1))]
+        [1844, 1931]
+        >>> [o.toPython().year for (_, _, o), _ in g.store.range_triples((None, founded), g, kind='date', descending=True, limit=1)]
+        [1931]
+        """
+        if not p:
+            raise ValueError("range queries require a predicate")
+
+        self._flush()
+        using = self._get_read_alias()
+        named_graph_id = None
+        if context is not None:
+            named_graph_id = _get_named_graph_id(context, using=using)
+            if named_graph_id is None:
+                return
+
+        bounds = dict((lookup, value.toPython() if isinstance(value, Literal) else value)
+                      for lookup, value in (('gt', gt), ('gte', gte), ('lt', lt), ('lte', lte))
+                      if value is not None)
+        model = models.LiteralStatement
+        field = model._meta.get_field(_get_typed_value_field(kind, bounds.values()))  # pylint: disable=W0212
+
+        filter_parameters = _get_filter_parameters(s, p, None, named_graph_id)
+        filter_parameters[field.name + '__isnull'] = False
+        query_set = model.objects.using(using).filter(**filter_parameters)  # pylint: disable=W0142
+        for lookup, value in bounds.items():
+            if not field.accepts(value):
+                raise TypeError("Cannot compare {0} with the values of {1}".format(value, field.name))
+            lookup, value = field.to_lookup(lookup, value)
+            query_set = query_set.filter(**{'{0}__{1}'.format(field.name, lookup): value})  # pylint: disable=W0142
+
+        bound = {indexes.PREDICATE: True, indexes.SUBJECT: bool(s), indexes.CONTEXT: named_graph_id is not None}
+        index_fields = indexes.get_index_fields(indexes.get_range_index(field.name))
+        key = tuple(name for name in indexes.get_model_fields(model, index_fields) if not bound.get(name))
+
+        chunk_size = min(self.batch_size, limit) if limit else self.batch_size
+        rows = sql.iterate_rows(query_set, model.row_fields, chunk_size, key=key, descending=descending)
+        for row in itertools.islice(rows, limit):
+            yield model.row_to_triple(row), context
+
+    @instrumentation.instrumented(iterator=True)
+    def batch_unify(self, patterns):
+        """
+        Yields the solutions of a basic graph pattern as dictionaries of variable bindings.
+
+        This is called by the SPARQL processor of rdfextras, with (subject, predicate, object, graph)
+        patterns. The whole pattern is matched by a single SQL query.
+        """
+        self._flush()
+        return sparql.batch_unify(patterns, block_size=self.batch_size, using=self._get_read_alias())
+
+    @instrumentation.instrumented()
+    def query(self, graph, query_object, initNs, initBindings, **kwargs):  # pylint: disable=W0221,R0913
+        """
+        Evaluates a SPARQL query on a graph of this store.
+
+        SELECT queries over a single basic graph pattern, with FILTERs that compare variables with
+        constants, ORDER BY, DISTINCT, LIMIT and OFFSET, are evaluated by a single SQL query. OPTIONAL
+        basic graph patterns that follow it are matched for batch_size solutions at a time. Other
+        queries are evaluated by rdfextras, which matches their basic graph patterns using batch_unify.
+        """
+        from rdfextras.sparql import parser
+        self._flush()
+        parsed = parser.parse(query_object) if isinstance(query_object, basestring) else query_object
+        try:
+            return sparql.evaluate_select(graph, parsed, initNs, initBindings, block_size=self.batch_size,
+                                          using=self._get_read_alias())
+        except sparql.Untranslatable:
+            return graph.query(query_object, initNs=initNs, initBindings=initBindings,
+                               use_store_provided=False, **kwargs)
+
+    @instrumentation.instrumented(shape=instrumentation.context_shape)
     def __len__(self, context=None):
         """
         Returns the number of statements in this Graph.
+
+        The number is read from the maintained statement counts.
         """
-        named_graph = _get_named_graph(context)
-        if named_graph is not None:
-            return (models.LiteralStatement.objects.filter(context_id=named_graph.id).count()
-                    + models.URIStatement.objects.filter(context_id=named_graph.id).count())
+        self._flush()
+        using = self._get_read_alias()
+        if context is not None:
+            named_graph_id = _get_named_graph_id(context, using=using)
+            if named_graph_id is None:
+                return 0
+            return counts.get_statement_count(named_graph_id, using=using)
         else:
-            return (models.URIStatement.objects.values('subject', 'predicate', 'object').distinct().count()
-                    + models.LiteralStatement.objects.values('subject', 'predicate', 'object').distinct().count())
+            return counts.get_triple_count(using=using)
 
     ####################
     # CONTEXT MANAGEMENT
 
+    @instrumentation.instrumented(iterator=True)
     def contexts(self, triple=None):
-        for c in models.NamedGraph.objects.all():
+        self._flush()
+        for c in models.NamedGraph.objects.using(self._get_read_alias()).all():
             yield c.identifier
 
     ######################
     # NAMESPACE MANAGEMENT
 
     def bind(self, prefix, namespace):
+        """
+        Binds a prefix to a namespace, replacing the namespaces that use the prefix or the namespace.
+        Binding a prefix to the namespace it is already bound to does not write to the database.
+        """
         for ns in DEFAULT_NAMESPACES:
             if ns[0] == prefix or unicode(ns[1]) == unicode(namespace):
                 return
 
+        if caches.namespaces.get_uri(prefix) == unicode(namespace):
+            return
+        if caches.namespaces.get_uri(prefix) is not None or caches.namespaces.get_prefix(namespace) is not None:
+            NamespaceModel.objects.filter(prefix=prefix).delete()
+            NamespaceModel.objects.filter(uri=namespace).delete()
+
         try:
             ns = NamespaceModel(prefix=prefix, uri=namespace)
             ns.save()
@@ -235,19 +986,16 @@ class DjangoStore(rdflib.store.Store):
             NamespaceModel(prefix=prefix, uri=namespace).save()
 
     def prefix(self, namespace):
-        try:
-            ns = NamespaceModel.objects.get(uri=namespace)
-            return ns.prefix
-        except NamespaceModel.DoesNotExist:
-            return None
+        """
+        Returns the prefix of a namespace. Namespaces are read from the process-wide namespace cache.
+        """
+        return caches.namespaces.get_prefix(namespace)
 
     def namespace(self, prefix):
-        try:
-            ns = NamespaceModel.objects.get(prefix=prefix)
-            return ns.uri
-        except NamespaceModel.DoesNotExist:
-            return None
+        """
+        Returns the namespace of a prefix. Namespaces are read from the process-wide namespace cache.
+        """
+        return caches.namespaces.get_uri(prefix)
 
     def namespaces(self):
-        for ns in NamespaceModel.objects.all():
-            yield ns.prefix, ns.uri
+        return iter(caches.namespaces.items())
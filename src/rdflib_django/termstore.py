@@ -0,0 +1,263 @@
+"""
+Store implementation that uses a term dictionary.
+
+Instead of storing the full text of every subject, predicate and object in every statement,
+the TermStore stores each distinct term once in the Term table and lets its statements refer
+to their terms using integer keys. This keeps the statement table and its indexes small,
+at the cost of resolving terms to their keys before every operation.
+
+The TermStore shares its named graphs and namespaces with the DjangoStore, but uses its own
+statement table. Use it by opening a graph with the 'DjangoTermDictionary' plugin, or by setting
+DJANGO_RDFLIB_TERM_DICTIONARY to True so that the functions in rdflib_django.utils (and thereby
+the management commands) use it.
+
+>>> import rdflib
+>>> g = rdflib.Graph('DjangoTermDictionary')
+>>> g.add((rdflib.URIRef('http://example.com/a'), rdflib.RDFS.label, rdflib.Literal('a', lang='en')))
+>>> for s, p, o in g:
+...     print s, p, o, o.language
+http://example.com/a http://www.w3.org/2000/01/rdf-schema#label a en
+"""
+from django.db import transaction
+from rdflib.term import Identifier
+from rdflib_django import models, caches, instrumentation, sql
+from rdflib_django.store import DjangoStore, _chunks, _get_named_graph_id, _unique, _write_transaction
+
+
+def _get_term_key(term):
+    """
+    Returns the key of a term in the term dictionary.
+    """
+    return models.term_key(*models.term_to_values(term))    # pylint: disable=W0142
+
+
+def _get_term_ids(terms, create=False, using=None):
+    """
+    Returns a dictionary that maps the keys of the given terms to the primary keys of their Terms.
+
+    Terms that are not in the term dictionary are created if create is True, and left out of the result otherwise.
+    Terms that are not cached are looked up in the database with alias using, if given.
+    """
+    term_ids = dict()
+    unresolved = dict()
+    for term in terms:
+        key = _get_term_key(term)
+        term_id = caches.terms.get(key)
+        if term_id is None:
+            unresolved[key] = term
+        else:
+            term_ids[key] = term_id
+
+    if not unresolved:
+        return term_ids
+
+    found = dict(models.Term.objects.using(using).filter(key__in=unresolved.keys()).values_list('key', 'id'))
+    if create:
+        missing = [models.Term.from_term(term) for key, term in unresolved.items() if key not in found]
+        if missing:
+            models.Term.objects.bulk_create(missing)
+            found.update(models.Term.objects.filter(key__in=[t.key for t in missing]).values_list('key', 'id'))
+
+    cacheable = not transaction.is_dirty()
+    for key, term_id in found.items():
+        term_ids[key] = term_id
+        if cacheable:
+            caches.terms.set(key, term_id)
+    return term_ids
+
+
+class TermStore(DjangoStore):
+    """
+    DjangoStore that stores its statements using a term dictionary.
+
+    The term dictionary has no typed value columns, so range_triples() raises a TypeError.
+    """
+
+    batch_unification = False
+
+    def destroy(self, configuration=None):
+        """
+        Completely destroys a store and all the contexts, triples and terms in the store.
+        """
+        super(TermStore, self).destroy(configuration)
+        models.TermStatement.objects.all().delete()
+        models.Term.objects.all().delete()
+        caches.terms.clear()
+
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape)
+    def add(self, (s, p, o), context, quoted=False):
+        """
+        Adds a triple to the store.
+        """
+        assert not quoted
+        self.addN([(s, p, o, context)])
+
+    @instrumentation.instrumented()
+    def addN(self, quads):
+        """
+        Adds a sequence of quads to the store.
+
+        The quads are processed in batches of batch_size. Within a batch, all terms are resolved
+        at once, statements that are already stored are filtered out with a single query per context,
+        and the remaining statements are inserted using bulk_create.
+        """
+        for batch in _chunks(quads, self.batch_size):
+            terms = set()
+            contexts = dict()
+            for s, p, o, c in batch:
+                assert isinstance(s, Identifier)
+                assert isinstance(p, Identifier)
+                assert isinstance(o, Identifier)
+                assert c is not None, "Context associated with {0} {1} {2} is None!".format(s, p, o)
+                terms.update((s, p, o))
+                contexts.setdefault(c.identifier, c)
+
+            term_ids = _get_term_ids(terms, create=True)
+            ids = lambda term: term_ids[_get_term_key(term)]
+
+            groups = dict()
+            for s, p, o, c in batch:
+                groups.setdefault(c.identifier, set()).add((ids(s), ids(p), ids(o)))
+
+            for identifier, statements in groups.items():
+                named_graph_id = _get_named_graph_id(contexts[identifier], create=True)
+                existing = models.TermStatement.objects \
+                    .filter(context_id=named_graph_id, subject_id__in=set(s for (s, _, _) in statements)) \
+                    .values_list('subject_id', 'predicate_id', 'object_id')
+                statements.difference_update(existing)
+
+                models.TermStatement.objects.bulk_create([
+                    models.TermStatement(subject_id=s, predicate_id=p, object_id=o, context_id=named_graph_id)
+                    for (s, p, o) in statements
+                ])
+
+    def _filter(self, (s, p, o), context, using=None):
+        """
+        Returns the query set of TermStatements matching a triple pattern in the database with alias using,
+        or None if the pattern cannot match any statement.
+        """
+        filter_parameters = dict()
+        if context is not None:
+            named_graph_id = _get_named_graph_id(context, using=using)
+            if named_graph_id is None:
+                return None
+            filter_parameters['context_id'] = named_graph_id
+
+        bound = [(name, term) for name, term in (('subject', s), ('predicate', p), ('object', o)) if term]
+        term_ids = _get_term_ids((term for (_, term) in bound), using=using)
+        for name, term in bound:
+            term_id = term_ids.get(_get_term_key(term))
+            if term_id is None:
+                return None
+            filter_parameters[name + '_id'] = term_id
+
+        return models.TermStatement.objects.using(using).filter(**filter_parameters)  # pylint: disable=W0142
+
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape)
+    def remove(self, (s, p, o), context=None):
+        """
+        Removes a triple from the store.
+        """
+        query_set = self._filter((s, p, o), context)
+        if query_set is not None:
+            sql.delete(query_set)
+
+    @instrumentation.instrumented(shape=instrumentation.context_shape)
+    def remove_context(self, context):
+        """
+        Removes a named graph from the store: its statements and the named graph itself.
+        """
+        named_graph_id = _get_named_graph_id(context)
+        if named_graph_id is None:
+            return
+
+        with _write_transaction():
+            sql.delete(models.TermStatement.objects.filter(context_id=named_graph_id))
+            models.NamedGraph.objects.filter(pk=named_graph_id).delete()
+
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape, iterator=True)
+    def triples(self, (s, p, o), context=None):
+        """
+        Returns all triples in the current store.
+        """
+        query_set = self._filter((s, p, o), context, self._get_read_alias())
+        if query_set is None:
+            return
+
+        for triple in self._read_triples(query_set):
+            yield triple, context
+
+    @staticmethod
+    def _read_triples(query_set):
+        """
+        Yields the triples of a query set of TermStatements.
+        """
+        rows = query_set.values_list(
+            'subject__kind', 'subject__value',
+            'predicate__kind', 'predicate__value',
+            'object__kind', 'object__value', 'object__language', 'object__datatype')
+        for s_kind, s_value, p_kind, p_value, o_kind, o_value, o_language, o_datatype in rows:
+            yield (models.values_to_term(s_kind, s_value, u'', u''),
+                   models.values_to_term(p_kind, p_value, u'', u''),
+                   models.values_to_term(o_kind, o_value, o_language, o_datatype))
+
+    @instrumentation.instrumented(shape=instrumentation.pattern_shape, iterator=True)
+    def triples_choices(self, (s, p, o), context=None):
+        """
+        Returns the triples in the store that match a pattern in which either the subject, the predicate
+        or the object is a list of terms, matching any of them. An empty list matches every term.
+
+        The terms are resolved batch_size at a time, and matched with an IN condition on their keys.
+        """
+        pattern = [s, p, o]
+        lists = [position for position, term in enumerate(pattern) if isinstance(term, list)]
+        assert len(lists) == 1, "exactly one position of the pattern must be a list"
+        position = lists[0]
+
+        choices = pattern[position]
+        pattern[position] = None
+        if not choices:
+            for triple in self.triples(tuple(pattern), context):
+                yield triple
+            return
+
+        using = self._get_read_alias()
+        query_set = self._filter(tuple(pattern), context, using)
+        if query_set is None:
+            return
+
+        field = ('subject_id', 'predicate_id', 'object_id')[position]
+        for chunk in _chunks(_unique(choices, key=_get_term_key), self.batch_size):
+            term_ids = _get_term_ids(chunk, using=using)
+            if not term_ids:
+                continue
+            for triple in self._read_triples(query_set.filter(**{field + '__in': term_ids.values()})):  # pylint: disable=W0142
+                yield triple, context
+
+    def range_triples(self, (s, p), context=None, **kwargs):  # pylint: disable=W0613
+        """
+        Raises a TypeError: the term dictionary has no typed value columns to compare.
+        """
+        raise TypeError("Range queries require the typed value columns of the DjangoStore")
+
+    @instrumentation.instrumented()
+    def query(self, graph, query_object, initNs, initBindings, **kwargs):  # pylint: disable=W0221,R0913
+        """
+        Evaluates a SPARQL query on a graph of this store.
+
+        The SQL translation of the DjangoStore reads its own statement tables, so queries are evaluated
+        by rdfextras, which matches every triple pattern using triples().
+        """
+        return graph.query(query_object, initNs=initNs, initBindings=initBindings, use_store_provided=False, **kwargs)
+
+    @instrumentation.instrumented(shape=instrumentation.context_shape)
+    def __len__(self, context=None):
+        """
+        Returns the number of statements in this Graph.
+        """
+        using = self._get_read_alias()
+        if context is not None:
+            query_set = self._filter((None, None, None), context, using)
+            return query_set.count() if query_set is not None else 0
+
+        return models.TermStatement.objects.using(using).values('subject', 'predicate', 'object').distinct().count()
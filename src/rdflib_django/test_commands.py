@@ -0,0 +1,265 @@
+"""
+Unittests for the management commands.
+"""
+import json
+import os
+import shutil
+import tempfile
+from django import test
+from django.core.management import call_command, CommandError
+from rdflib.graph import ConjunctiveGraph, Graph
+from rdflib.term import URIRef, Literal
+from rdflib_django import caches, utils, models
+from rdflib_django.management.commands import rdf_benchmark, rdf_import
+
+
+CONTEXT = URIRef("http://example.com/context")
+
+NT_DOCUMENT = "".join(
+    "<http://example.com/s{0}> <http://example.com/p> <http://example.com/o{1}> .\n".format(i, i % 3) for i in range(10)
+)
+
+
+class ImportTest(test.TestCase):
+    """
+    Tests for the rdf_import command.
+    """
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.nt')
+        with os.fdopen(fd, 'w') as f:
+            f.write(NT_DOCUMENT)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def testImport(self):
+        call_command('rdf_import', self.path, format='nt', context=str(CONTEXT), verbosity=0)
+        self.assertEquals(len(utils.get_named_graph(CONTEXT)), 10)
+
+    def testImportInBatches(self):
+        call_command('rdf_import', self.path, format='nt', context=str(CONTEXT), batch_size=3, verbosity=0)
+        self.assertEquals(len(utils.get_named_graph(CONTEXT)), 10)
+
+    def testInvalidBatchSize(self):
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.path, format='nt', batch_size=0, verbosity=0)
+
+    def testSync(self):
+        graph = utils.get_named_graph(CONTEXT)
+        graph.parse(data=NT_DOCUMENT, format='nt')
+        graph.remove((URIRef("http://example.com/s0"), None, None))
+        graph.add((CONTEXT, CONTEXT, CONTEXT))
+        graph.add((CONTEXT, CONTEXT, Literal("removed")))
+
+        command = rdf_import.Command()
+        self.assertEquals(command.sync([self.path], graph, 'nt', 3, False), (1, 2, 9))
+        self.assertEquals(set(graph), set(Graph().parse(self.path, format='nt')))
+        self.assertEquals(len(graph), 10)
+        self.assertEquals(command.sync([self.path], graph, 'nt', 3, False), (0, 0, 10))
+
+        call_command('rdf_import', self.path, format='nt', context=str(CONTEXT), sync=True, verbosity=0)
+        self.assertEquals(len(graph), 10)
+
+    def testReplaceRequiresContext(self):
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.path, format='nt', replace=True, verbosity=0)
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.path, format='nt', sync=True, verbosity=0)
+
+
+class ReplaceImportTest(test.TransactionTestCase):
+    """
+    Tests for replacing a context with the rdf_import command, which commits the replacement itself.
+    """
+
+    def setUp(self):
+        caches.named_graphs.clear()
+        fd, self.path = tempfile.mkstemp(suffix='.nt')
+        with os.fdopen(fd, 'w') as f:
+            f.write(NT_DOCUMENT)
+
+    def tearDown(self):
+        os.remove(self.path)
+        caches.named_graphs.clear()
+
+    def testReplace(self):
+        graph = utils.get_named_graph(CONTEXT)
+        graph.add((CONTEXT, CONTEXT, CONTEXT))
+        call_command('rdf_import', self.path, format='nt', context=str(CONTEXT), replace=True, batch_size=3,
+                     verbosity=0)
+
+        self.assertEquals(len(graph), 10)
+        self.assertNotIn((CONTEXT, CONTEXT, CONTEXT), graph)
+        self.assertEquals(list(models.NamedGraph.objects.values_list('identifier', flat=True)), [unicode(CONTEXT)])
+        self.assertEquals(len(utils.get_conjunctive_graph()), 10)
+
+    def testFailedReplace(self):
+        graph = utils.get_named_graph(CONTEXT)
+        graph.add((CONTEXT, CONTEXT, CONTEXT))
+        with open(self.path, 'a') as f:
+            f.write("not N-Triples\n")
+
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.path, format='nt', context=str(CONTEXT),
+                          replace=True, batch_size=3, verbosity=0)
+        self.assertEquals(list(graph), [(CONTEXT, CONTEXT, CONTEXT)])
+        self.assertEquals(list(models.NamedGraph.objects.values_list('identifier', flat=True)), [unicode(CONTEXT)])
+
+
+class ParallelImportTest(test.TransactionTestCase):
+    """
+    Tests for importing many files with the rdf_import command.
+    """
+
+    def setUp(self):
+        caches.named_graphs.clear()
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'more'))
+        self.paths = [os.path.join(self.directory, name) for name in ('a.nt', os.path.join('more', 'b.nt'))]
+        for i, path in enumerate(self.paths):
+            with open(path, 'w') as f:
+                f.write(NT_DOCUMENT.replace('/s', '/s{0}-'.format(i)))
+                f.write("_:node <http://example.com/p> _:node .\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        caches.named_graphs.clear()
+
+    def testImportDirectory(self):
+        call_command('rdf_import', self.directory, format='nt', context=str(CONTEXT), processes=2, chunk_size=100,
+                     verbosity=0)
+        graph = utils.get_named_graph(CONTEXT)
+        self.assertEquals(len(graph), 22)
+        self.assertEquals(len(set(graph.subjects(object=URIRef("http://example.com/o1")))), 6)
+        self.assertEquals(len(set(s for s, o in graph.subject_objects() if s == o)), 2)
+
+    def testContextPerFile(self):
+        call_command('rdf_import', *self.paths, format='nt', context_per_file=True, processes=2, verbosity=0)
+        identifiers = [unicode(rdf_import.get_source_uri(path)) for path in self.paths]
+        self.assertEquals(set(models.NamedGraph.objects.values_list('identifier', flat=True)), set(identifiers))
+        self.assertEquals([len(utils.get_named_graph(identifier)) for identifier in identifiers], [11, 11])
+
+    def testWriters(self):
+        call_command('rdf_import', self.directory, format='nt', context=str(CONTEXT), writers=3, batch_size=2,
+                     verbosity=0)
+        call_command('rdf_import', self.paths[0], format='nt', context=str(CONTEXT), processes=2, writers=2,
+                     batch_size=5, verbosity=0)
+        graph = utils.get_named_graph(CONTEXT)
+        self.assertEquals(len(graph), 23)
+        self.assertEquals(len(utils.get_conjunctive_graph()), 23)
+        self.assertEquals(len(list(graph)), 23)
+
+    def testNQuads(self):
+        path = os.path.join(self.directory, 'quads.nq')
+        with open(path, 'w') as f:
+            f.write("<http://example.com/s> <http://example.com/p> <http://example.com/o> <{0}> .\n".format(CONTEXT))
+            f.write("<http://example.com/s> <http://example.com/p> \"o\" <http://example.com/other> .\n")
+        call_command('rdf_import', path, format='nquads', processes=2, chunk_size=10, verbosity=0)
+        self.assertEquals(len(utils.get_named_graph(CONTEXT)), 1)
+        self.assertEquals(len(utils.get_named_graph(URIRef("http://example.com/other"))), 1)
+
+    def testSync(self):
+        graph = utils.get_named_graph(CONTEXT)
+        graph.add((CONTEXT, CONTEXT, CONTEXT))
+        call_command('rdf_import', self.directory, format='nt', context=str(CONTEXT), sync=True, processes=2,
+                     verbosity=0)
+        self.assertEquals(len(graph), 22)
+        self.assertNotIn((CONTEXT, CONTEXT, CONTEXT), graph)
+
+    def testInvalidFile(self):
+        with open(self.paths[1], 'a') as f:
+            f.write("not N-Triples\n")
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.directory, format='nt',
+                          context=str(CONTEXT), processes=2, verbosity=0)
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.directory, format='nt',
+                          context=str(CONTEXT), context_per_file=True, verbosity=0)
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.directory, format='nt', writers=0,
+                          verbosity=0)
+        self.assertRaises(CommandError, rdf_import.Command().handle, self.directory, format='nt', writers=2,
+                          verbosity=0)
+
+
+class RecountTest(test.TestCase):
+    """
+    Tests for the rdf_recount command.
+    """
+
+    def testRecount(self):
+        graph = utils.get_named_graph(CONTEXT)
+        graph.add((CONTEXT, CONTEXT, CONTEXT))
+        self.assertEquals(len(graph), 1)
+        self.assertEquals(len(utils.get_conjunctive_graph()), 1)
+        self.assertEquals(models.TripleCount.objects.all().update(count=42), 2)
+
+        call_command('rdf_recount', verbosity=0)
+        self.assertEquals(len(graph), 1)
+        self.assertEquals(len(utils.get_conjunctive_graph()), 1)
+
+
+class ExportTest(test.TestCase):
+    """
+    Tests for the rdf_export command.
+    """
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+        self.graph = utils.get_named_graph(CONTEXT)
+        self.graph.parse(data=NT_DOCUMENT, format='nt')
+        self.graph.add((CONTEXT, CONTEXT, Literal(u"caf\xe9 \"quoted\"\n", lang='fr')))
+        utils.get_named_graph(URIRef("http://example.com/other")).add((CONTEXT, CONTEXT, CONTEXT))
+        utils.get_named_graph(URIRef("http://example.com/copy")).parse(data=NT_DOCUMENT, format='nt')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def testExportNTriples(self):
+        call_command('rdf_export', self.path, format='nt', context=str(CONTEXT))
+        exported = Graph().parse(self.path, format='nt')
+        self.assertEquals(len(exported), 11)
+        self.assertEquals(set(exported), set(self.graph))
+
+    def testExportDistinctNTriples(self):
+        call_command('rdf_export', self.path, format='nt')
+        self.assertEquals(len(open(self.path).readlines()), 12)
+
+    def testExportNQuads(self):
+        call_command('rdf_export', self.path, format='nquads')
+        exported = ConjunctiveGraph()
+        exported.parse(self.path, format='nquads')
+        quads = list(exported.quads((None, None, None)))
+        self.assertEquals(len(quads), 22)
+        self.assertEquals(set((s, p, o) for s, p, o, c in quads if c == CONTEXT), set(self.graph))
+
+
+class BenchmarkTest(test.TestCase):
+    """
+    Tests for the rdf_benchmark command.
+    """
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def testBenchmark(self):
+        utils.get_named_graph(CONTEXT).add((CONTEXT, CONTEXT, CONTEXT))
+        call_command('rdf_benchmark', self.path, size=300, contexts=3, repeat=1, samples=10, label='test', verbosity=0)
+
+        with open(self.path) as f:
+            report = json.load(f)
+        self.assertEquals(report['label'], 'test')
+        self.assertEquals(report['parameters'], dict(size=300, contexts=3, repeat=1, samples=10, seed=0))
+        self.assertEquals(report['results']['bulk_load']['operations'], 300)
+        for name in ('add', 'triples_spo', 'triples_???', 'triples_all_contexts_?p?', 'len_context', 'len_store',
+                     'contexts', 'export_nt', 'remove', 'remove_context'):
+            self.assertIn(name, report['results'])
+            self.assertTrue(report['results'][name]['seconds'] >= 0)
+
+        # the benchmark leaves the store as it was
+        self.assertEquals(list(models.NamedGraph.objects.values_list('identifier', flat=True)), [unicode(CONTEXT)])
+        self.assertEquals(len(utils.get_conjunctive_graph()), 1)
+
+    def testInvalidParameters(self):
+        self.assertRaises(CommandError, rdf_benchmark.Command().handle, self.path, size=0, contexts=3, repeat=1,
+                          samples=10, seed=0, verbosity=0)
@@ -0,0 +1,112 @@
+"""
+Unittests for running store operations in worker threads.
+"""
+import Queue
+import threading
+import time
+from django import test
+import rdflib
+from rdflib.namespace import RDF, Namespace
+from rdflib.term import Literal
+from rdflib_django import caches
+from rdflib_django.executor import POLL_INTERVAL, StoreExecutor
+
+
+EX = Namespace("http://www.example.com/")
+
+
+class StoreExecutorTest(test.TransactionTestCase):
+    """
+    Checks on the StoreExecutor, whose workers use their own database connections.
+    """
+
+    def setUp(self):
+        caches.named_graphs.clear()
+        self.graph = rdflib.Graph('Django', identifier=EX['executor'])
+        self.executor = StoreExecutor(self.graph.store, workers=4, prefetch=1)
+
+    def tearDown(self):
+        self.executor.close()
+        caches.named_graphs.clear()
+
+    def test_operations(self):
+        """
+        Operations submitted at the same time all complete.
+        """
+        graphs = [rdflib.Graph(self.graph.store, identifier=EX['graph-{0}'.format(i)]) for i in range(4)]
+        added = [self.executor.aadd_n((EX['s{0}'.format(j)], RDF.value, Literal(j), graph) for j in range(i + 1))
+                 for i, graph in enumerate(graphs)]
+        for result in added:
+            result.get(timeout=10)
+
+        lengths = [self.executor.alen(graph) for graph in graphs]
+        self.assertEquals([result.get(timeout=10) for result in lengths], [1, 2, 3, 4])
+        self.assertEquals(set(self.executor.acontexts().get(timeout=10)), set(graph.identifier for graph in graphs))
+        self.assertEquals(self.executor.alen().get(timeout=10), 4)
+
+    def test_triples(self):
+        """
+        Triples are streamed in chunks.
+        """
+        self.graph.store.addN((EX['s{0}'.format(i)], RDF.value, Literal(i), self.graph) for i in range(25))
+        chunks = list(self.executor.atriples((None, RDF.value, None), self.graph, chunk_size=10))
+        self.assertEquals([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEquals(set(triple for chunk in chunks for triple in chunk), set(self.graph))
+
+    def test_backpressure(self):
+        """
+        The worker does not read further ahead than the prefetched chunks, and stops when the stream is closed.
+        """
+        produced = []
+        waiting = threading.Event()
+
+        def items():
+            for i in range(100):
+                produced.append(i)
+                if len(produced) == 2:
+                    waiting.set()
+                yield i
+
+        with self.executor.stream(items, 1) as stream:
+            self.assertTrue(waiting.wait(10))
+            # one chunk in the stream, and one waiting to be put in it
+            time.sleep(2 * POLL_INTERVAL)
+            self.assertEquals(len(produced), 2)
+            self.assertEquals(stream.next(timeout=10), [0])
+        self.executor.close()
+        self.assertTrue(len(produced) < 5)
+
+    def test_abandoned_streams(self):
+        """
+        A stream that is dropped before its end releases its worker, so the executor can be closed.
+        """
+        self.graph.store.addN((EX['s{0}'.format(i)], RDF.value, Literal(i), self.graph) for i in range(25))
+        for chunk in self.executor.atriples((None, RDF.value, None), self.graph, chunk_size=1):
+            break
+
+        closing = threading.Thread(target=self.executor.close)
+        closing.start()
+        closing.join(10)
+        self.assertFalse(closing.is_alive())
+
+    def test_errors(self):
+        """
+        The consumer of a stream receives the exception of the worker.
+        """
+        def items():
+            yield 1
+            raise ValueError("failed")
+
+        stream = self.executor.stream(items, 1)
+        self.assertEquals(stream.next(timeout=10), [1])
+        self.assertRaises(ValueError, stream.next, 10)
+        self.assertRaises(StopIteration, stream.next)
+
+        stream = self.executor.stream(lambda: iter(()), 1)
+        self.assertEquals(list(stream), [])
+
+        started = threading.Event()
+        stream = self.executor.stream(lambda: iter([started.wait(10)]), 1)
+        self.assertRaises(Queue.Empty, stream.next, 0.01)
+        started.set()
+        self.assertEquals(stream.next(timeout=10), [True])
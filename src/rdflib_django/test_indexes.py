@@ -0,0 +1,78 @@
+"""
+Unittests for the composite indexes, based on the query plans of SQLite.
+"""
+import itertools
+import re
+from django import test
+from django.db import connection
+from django.utils import unittest
+from rdflib.term import URIRef, Literal
+from rdflib_django import indexes, models
+from rdflib_django.store import _get_filter_parameters
+
+
+SUBJECT = URIRef("http://example.com/subject")
+PREDICATE = URIRef("http://example.com/predicate")
+OBJECTS = {
+    models.URIStatement: URIRef("http://example.com/object"),
+    models.LiteralStatement: Literal("object"),
+}
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "query plans are only checked on SQLite")
+class QueryPlanTest(test.TestCase):
+    """
+    Checks that every triple pattern uses the index returned by choose_index.
+    """
+
+    def get_query_plan(self, query_set):
+        """
+        Returns the query plan of SQLite for a query set as a single string.
+        """
+        sql, params = query_set.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return " ".join(row[-1] for row in cursor.fetchall())
+
+    def testPatterns(self):
+        for model, o in OBJECTS.items():
+            for bound in itertools.product([False, True], repeat=4):
+                s_bound, p_bound, o_bound, c_bound = bound
+                filter_parameters = _get_filter_parameters(
+                    SUBJECT if s_bound else None,
+                    PREDICATE if p_bound else None,
+                    o if o_bound else None,
+                    1 if c_bound else None)
+                plan = self.get_query_plan(model.objects.filter(**filter_parameters))  # pylint: disable=W0142
+
+                index = indexes.choose_index(*bound)    # pylint: disable=W0142
+                if index is None:
+                    self.assertNotIn("INDEX", plan)
+                    continue
+
+                used = re.search(r"INDEX {0}_(\w+)".format(model._meta.db_table), plan)    # pylint: disable=W0212
+                message = "{0} {1} should use {2}: {3}".format(model.__name__, bound, index, plan)
+                self.assertTrue(used, message)
+                self.assertEquals(indexes.get_bound_prefix(used.group(1), *bound, model=model),     # pylint: disable=W0142
+                                  indexes.get_bound_prefix(index, *bound, model=model), message)     # pylint: disable=W0142
+
+    def testLiteralPatterns(self):
+        for language, datatype in [(True, False), (False, True)]:
+            filter_parameters = {'predicate': PREDICATE}
+            if language:
+                filter_parameters['language'] = 'en'
+            if datatype:
+                filter_parameters['datatype'] = 'http://www.w3.org/2001/XMLSchema#integer'
+            plan = self.get_query_plan(models.LiteralStatement.objects.filter(**filter_parameters))  # pylint: disable=W0142
+
+            index = indexes.choose_index(False, True, False, False, language, datatype)
+            self.assertIn(indexes.get_index_name(models.LiteralStatement, index), plan)
+
+    def testRangePatterns(self):
+        for field in models.LiteralStatement.typed_value_fields:
+            query_set = models.LiteralStatement.objects.filter(**{  # pylint: disable=W0142
+                'predicate': PREDICATE, field + '__isnull': False}).order_by(field, 'subject')
+            plan = self.get_query_plan(query_set)
+
+            self.assertIn(indexes.get_index_name(models.LiteralStatement, indexes.get_range_index(field)), plan)
+            self.assertNotIn("TEMP B-TREE", plan)
@@ -0,0 +1,237 @@
+"""
+Unittests for the instrumentation of the stores.
+"""
+import json
+import logging
+from StringIO import StringIO
+import sys
+from django import test
+from django.core.cache import get_cache
+from django.core.management import call_command
+from django.db import connection
+from django.utils import unittest
+import rdflib
+from rdflib.namespace import RDF, RDFS, Namespace
+from rdflib.term import Literal
+from rdflib_django import instrumentation, models, slowlog, sql
+
+
+EX = Namespace("http://www.example.com/")
+
+
+class _Handler(logging.Handler):
+    """
+    Keeps the log records.
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class InstrumentationTest(test.TestCase):
+    """
+    Checks on recording store operations.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django', identifier=EX['instrumented'])
+        self.graph.addN((EX['s{0}'.format(i)], RDFS.label, Literal(i), self.graph) for i in range(10))
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def test_disabled(self):
+        """
+        Nothing is recorded while instrumentation is disabled.
+        """
+        list(self.graph)
+        len(self.graph)
+        self.assertEquals(instrumentation.stats(), {})
+
+    def test_capture(self):
+        """
+        Every operation is recorded by its shape, with the rows it yields and its queries.
+        """
+        with instrumentation.capture() as captured:
+            list(self.graph.triples((None, RDFS.label, None)))
+            list(self.graph.triples((None, RDFS.label, None)))
+            list(self.graph.store.triples((EX['s1'], None, None), None))
+            self.graph.add((EX['s1'], RDF.type, EX['Thing']))
+            self.graph.remove((EX['s1'], RDF.type, EX['Thing']))
+
+        self.assertEquals(sorted(captured), [
+            ('add', 'spoc'),
+            ('remove', 'spoc'),
+            ('triples', '?p?c'),
+            ('triples', 's???'),
+        ])
+        labels = captured[('triples', '?p?c')]
+        self.assertEquals((labels['calls'], labels['rows']), (2, 20))
+        self.assertTrue(labels['queries'] >= 2)
+        self.assertTrue(labels['seconds'] > 0)
+        self.assertEquals(captured[('add', 'spoc')]['rows'], 0)
+        self.assertEquals(instrumentation.stats(), {})
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', "server-side cursors are only used on PostgreSQL")
+    def test_server_side_cursors(self):
+        """
+        The queries of server-side cursors are recorded as well.
+        """
+        operation = instrumentation.Operation(self.graph.store, 'triples', None, (), {})
+        with operation:
+            rows = list(sql.iterate_rows(models.LiteralStatement.objects.all(), ['pk'], 3))
+        self.assertEquals(len(rows), 10)
+        self.assertEquals(len(operation.queries), 1)
+        self.assertEquals(operation.queries[0]['alias'], connection.alias)
+        self.assertIn('ORDER BY', operation.queries[0]['statement'])
+
+    def test_partial_iteration(self):
+        """
+        An operation that is not iterated to the end ends when its iterator is closed.
+        """
+        with instrumentation.capture() as captured:
+            triples = self.graph.triples((None, None, None))
+            next(triples)
+            triples.close()
+        self.assertEquals(captured[('triples', '???c')]['rows'], 1)
+
+    def test_enable(self):
+        """
+        Enabled instrumentation records the operations in the process-wide stats.
+        """
+        instrumentation.enable()
+        self.assertTrue(instrumentation.is_enabled())
+        len(self.graph)
+        list(self.graph.store.contexts())
+        self.assertEquals(sorted(instrumentation.stats()), [('__len__', '???c'), ('contexts', None)])
+
+        instrumentation.disable()
+        len(self.graph)
+        self.assertEquals(instrumentation.stats()[('__len__', '???c')]['calls'], 1)
+
+    def test_queries(self):
+        """
+        The queries of operations are counted without keeping them in the connection, unless DEBUG is set.
+        """
+        queries = len(connection.queries)
+        with instrumentation.capture() as captured:
+            self.graph.add((EX['s1'], RDF.type, EX['Thing']))
+        self.assertTrue(captured[('add', 'spoc')]['queries'] > 0)
+        self.assertEquals(len(connection.queries), queries)
+        self.assertEquals(connection.use_debug_cursor, None)
+
+    def test_signal_and_logging(self):
+        """
+        Every recorded operation sends a signal and logs a message.
+        """
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append((sender, kwargs['operation'], kwargs['shape'], kwargs['rows'], len(kwargs['queries'])))
+
+        handler = _Handler()
+        logger = logging.getLogger('rdflib_django.instrumentation')
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        instrumentation.operation_finished.connect(receiver)
+        try:
+            with instrumentation.capture():
+                list(self.graph.triples((None, None, None)))
+        finally:
+            instrumentation.operation_finished.disconnect(receiver)
+            logger.removeHandler(handler)
+            logger.setLevel(logging.NOTSET)
+
+        self.assertEquals(len(received), 1)
+        self.assertEquals(received[0][:4], (type(self.graph.store), 'triples', '???c', 10))
+        self.assertEquals(len(handler.records), 1)
+        self.assertTrue(handler.records[0].getMessage().startswith('triples ???c: '))
+
+
+class SlowLogTest(test.TestCase):
+    """
+    Checks on logging slow operations.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django', identifier=EX['slow'])
+        self.graph.addN((EX['s{0}'.format(i)], RDFS.label, Literal(i), self.graph) for i in range(10))
+        slowlog.clear()
+
+    def tearDown(self):
+        slowlog.stop()
+        slowlog.clear()
+
+    def test_threshold(self):
+        """
+        Only the operations that take longer than the threshold are logged.
+        """
+        slowlog.start(1000)
+        list(self.graph.triples((None, RDFS.label, None)))
+        self.assertEquals(slowlog.get_entries(), [])
+
+        slowlog.start(0)
+        list(self.graph.triples((None, RDFS.label, None)))
+        len(self.graph)
+        slowlog.stop()
+        list(self.graph.triples((None, RDFS.label, None)))
+
+        entries = slowlog.get_entries()
+        self.assertEquals([(entry['operation'], entry['shape'], entry['rows']) for entry in entries],
+                          [('triples', '?p?c', 10), ('__len__', '???c', 0)])
+        self.assertEquals(entries[0]['pattern'], u'(?, {0}, ?) in {1}'.format(RDFS.label.n3(), EX['slow'].n3()))
+        self.assertFalse(instrumentation._is_recording())  # pylint: disable=W0212
+
+    def test_query_plans(self):
+        """
+        Every query of a slow operation is logged with its query plan.
+        """
+        slowlog.start(0)
+        list(self.graph.triples((EX['s1'], None, None)))
+        queries = slowlog.get_entries()[-1]['queries']
+        self.assertTrue(queries)
+        for query in queries:
+            self.assertIn('SELECT', query['sql'])
+            self.assertTrue(query['plan'])
+        self.assertTrue(any('USING' in line for line in queries[-1]['plan']))
+
+    def test_ring_buffer(self):
+        """
+        The log keeps the last entries.
+        """
+        log = slowlog.SlowLog(get_cache('django.core.cache.backends.locmem.LocMemCache'), 3)
+        for i in range(5):
+            log.append({'operation': i})
+        self.assertEquals([entry['operation'] for entry in log.get_entries()], [2, 3, 4])
+        log.clear()
+        self.assertEquals(log.get_entries(), [])
+
+    def test_command(self):
+        """
+        The rdf_slowlog command shows the log.
+        """
+        slowlog.start(0)
+        list(self.graph.triples((EX['s1'], None, None)))
+        slowlog.stop()
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('rdf_slowlog')
+            text = sys.stdout.getvalue()
+            sys.stdout = StringIO()
+            call_command('rdf_slowlog', json=True, clear=True)
+            dumped = json.loads(sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+
+        self.assertIn('DjangoStore.triples s??c: ', text)
+        self.assertIn('SELECT', text)
+        self.assertEquals([entry['pattern'] for entry in dumped], [u'({0}, ?, ?) in {1}'.format(EX['s1'].n3(), EX['slow'].n3())])
+        self.assertEquals(slowlog.get_entries(), [])
@@ -1,9 +1,11 @@
 """
 Unittests for namespace management.
 """
+from django import test
 from django.utils import unittest
 from rdflib.graph import Graph
 from rdflib.term import URIRef
+from rdflib_django import caches, models
 from rdflib_django.store import DjangoStore
 
 
@@ -63,3 +65,64 @@ class NamespaceTest(unittest.TestCase):
 
         g.bind(ns[0], ns[1])
         self.assertIn(ns, list(g.namespaces()))
+
+
+class NamespaceCacheTest(test.TransactionTestCase):
+    """
+    Checks on the caching of namespaces.
+    """
+
+    def setUp(self):
+        self.store = DjangoStore()
+        self.check_interval = caches.namespaces.check_interval
+        caches.namespaces.invalidate()
+        self.store.bind("example", URIRef("http://example.com/"))
+
+    def tearDown(self):
+        caches.namespaces.check_interval = self.check_interval
+        caches.namespaces.invalidate()
+
+    def testLookupsAreCached(self):
+        """
+        Once the namespaces are loaded, looking them up does not query the database.
+        """
+        self.assertEquals(self.store.namespace("example"), "http://example.com/")
+        with self.assertNumQueries(0):
+            self.assertEquals(self.store.namespace("example"), "http://example.com/")
+            self.assertEquals(self.store.prefix(URIRef("http://example.com/")), "example")
+            self.assertIn(("example", "http://example.com/"), list(self.store.namespaces()))
+            self.assertIsNone(self.store.namespace("unknown"))
+
+    def testUnchangedBindingIsNoop(self):
+        """
+        Binding a prefix to the namespace it is bound to does not write to the database.
+        """
+        self.store.namespace("example")
+        with self.assertNumQueries(0):
+            self.store.bind("example", URIRef("http://example.com/"))
+
+    def testRebinding(self):
+        """
+        Binding a prefix or namespace again replaces the namespace that used it.
+        """
+        self.store.bind("example", URIRef("http://example.com/other/"))
+        self.assertEquals(self.store.namespace("example"), "http://example.com/other/")
+        self.assertIsNone(self.store.prefix(URIRef("http://example.com/")))
+
+        self.store.bind("other", URIRef("http://example.com/other/"))
+        self.assertEquals(self.store.prefix(URIRef("http://example.com/other/")), "other")
+        self.assertIsNone(self.store.namespace("example"))
+
+    def testVersionStamp(self):
+        """
+        Changes made by other processes are seen once they change the version stamp.
+        """
+        caches.namespaces.check_interval = 0
+        self.assertEquals(self.store.namespace("example"), "http://example.com/")
+
+        # an update does not send signals, like a change made by another process
+        models.NamespaceModel.objects.filter(prefix="example").update(uri="http://example.com/changed/")
+        self.assertEquals(self.store.namespace("example"), "http://example.com/")
+
+        caches.namespaces.shared_cache.set(caches.NamespaceCache.VERSION_KEY, "changed")
+        self.assertEquals(self.store.namespace("example"), "http://example.com/changed/")
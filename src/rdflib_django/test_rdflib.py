@@ -545,3 +545,17 @@ class ContextTest(test.TestCase):
         self.removeStuff()
         self.assertEquals(len(list(c1triples((Any, Any, Any)))), 0)
         self.assertEquals(len(list(triples((Any, Any, Any)))), 0)
+
+
+class TermDictionaryGraphTest(GraphTest):
+    """
+    Testing the basic graph functionality using the term dictionary.
+    """
+    store_name = "DjangoTermDictionary"
+
+
+class TermDictionaryContextTest(ContextTest):
+    """
+    Testing different contexts using the term dictionary.
+    """
+    store_name = "DjangoTermDictionary"
@@ -0,0 +1,164 @@
+"""
+Unit tests for the evaluation of SPARQL queries in the database.
+"""
+from django import test
+from django.utils import unittest
+import rdflib
+from rdflib.graph import ConjunctiveGraph
+from rdflib.namespace import RDF, RDFS, Namespace
+from rdflib.term import Literal, Variable
+from rdflib_django import sparql
+
+try:
+    import rdfextras
+    rdfextras.registerplugins()
+except ImportError:
+    rdfextras = None
+
+
+EX = Namespace("http://www.example.com/")
+
+
+@unittest.skipUnless(rdfextras, "rdfextras is not installed")
+class SPARQLTest(test.TestCase):
+    """
+    Compares the results of queries evaluated in the database with the results of rdfextras.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django', identifier=EX['sparql'])
+        for i in range(10):
+            resource = EX['resource{0}'.format(i)]
+            self.graph.add((resource, RDF.type, EX['Even'] if i % 2 == 0 else EX['Odd']))
+            self.graph.add((resource, RDFS.label, Literal('Resource {0}'.format(i), lang='en')))
+            self.graph.add((resource, EX['size'], Literal(i)))
+            self.graph.add((resource, EX['next'], EX['resource{0}'.format((i + 1) % 10)]))
+
+    def assertSameResults(self, query, ordered=False, queries=1):
+        """
+        Checks that a query is evaluated with the given number of SQL queries, and gives the same results as
+        rdfextras, on the graph and on the conjunctive graph. Querying the graph also looks up its named graph.
+        """
+        for graph, lookups in ((self.graph, 1), (ConjunctiveGraph('Django'), 0)):
+            with self.assertNumQueries(queries + lookups):
+                results = list(graph.query(query, initNs={'ex': EX}))
+            expected = list(graph.query(query, initNs={'ex': EX}, use_store_provided=False))
+            if not ordered:
+                results, expected = sorted(results), sorted(expected)
+            self.assertEquals(results, expected)
+        return results
+
+    def testJoin(self):
+        results = self.assertSameResults(
+            "SELECT ?s ?label WHERE { ?s a ex:Even . ?s rdfs:label ?label . ?s ex:next ?next . ?next a ex:Odd }")
+        self.assertEquals(len(results), 5)
+
+    def testObjectVariables(self):
+        results = self.assertSameResults("SELECT ?p ?o WHERE { ex:resource3 ?p ?o }")
+        self.assertEquals(len(results), 4)
+
+    def testBlankNodes(self):
+        results = self.assertSameResults("SELECT ?s WHERE { _:b ex:next ?s . _:b ex:size 4 }")
+        self.assertEquals(results, [(EX['resource5'],)])
+
+    def testLiteralConstant(self):
+        results = self.assertSameResults('SELECT ?s WHERE { ?s rdfs:label "Resource 3"@en }')
+        self.assertEquals(results, [(EX['resource3'],)])
+
+    def testFilter(self):
+        results = self.assertSameResults(
+            "SELECT ?s WHERE { ?s a ex:Odd . ?s ex:size ?size FILTER (?size > 2 && ?size <= 7) }")
+        self.assertEquals(len(results), 3)
+
+        results = self.assertSameResults(
+            "SELECT ?s WHERE { ?s ex:size ?size FILTER (?size < 2 || ?size = 9) }")
+        self.assertEquals(len(results), 3)
+
+    def testPrecision(self):
+        for i, value in enumerate((2 ** 53, 2 ** 53 + 1, 2 ** 53 + 2)):
+            self.graph.add((EX['big{0}'.format(i)], EX['size'], Literal(value)))
+        results = self.assertSameResults("SELECT ?s WHERE { ?s ex:size ?size FILTER (?size > 9007199254740993) }")
+        self.assertEquals(results, [(EX['big2'],)])
+
+        results = list(self.graph.query("SELECT ?s WHERE { ?s ex:size ?size FILTER (?size = 9007199254740993) }",
+                                        initNs={'ex': EX}))
+        self.assertEquals(results, [(EX['big1'],)])
+
+    def testOrderLimitOffset(self):
+        results = self.assertSameResults(
+            "SELECT ?s ?size WHERE { ?s ex:size ?size } ORDER BY DESC(?size) LIMIT 3 OFFSET 2", ordered=True)
+        self.assertEquals([size for _, size in results], [Literal(7), Literal(6), Literal(5)])
+
+    def testDistinct(self):
+        results = self.assertSameResults("SELECT DISTINCT ?type WHERE { ?s a ?type }")
+        self.assertEquals(results, [(EX['Even'],), (EX['Odd'],)])
+
+    def testInitBindings(self):
+        results = list(self.graph.query("SELECT ?s WHERE { ?s a ?type }",
+                                        initNs={'ex': EX}, initBindings={Variable('type'): EX['Odd']}))
+        self.assertEquals(len(results), 5)
+
+    def testUntranslatable(self):
+        results = list(self.graph.query("SELECT ?s ?x WHERE { ?s a ex:Odd OPTIONAL { ?s ex:missing ?x } }",
+                                        initNs={'ex': EX}))
+        self.assertEquals(len(results), 5)
+
+    def testBatchUnify(self):
+        s, o = Variable('s'), Variable('o')
+        patterns = [(s, EX['next'], o, EX['sparql']), (o, EX['size'], Literal(4), EX['sparql'])]
+        with self.assertNumQueries(2):
+            self.assertEquals(list(self.graph.store.batch_unify(patterns)), [{s: EX['resource3'], o: EX['resource4']}])
+
+    def testManyObjectVariables(self):
+        variables = [Variable('o{0}'.format(i)) for i in range(sparql.MAX_OBJECT_VARIABLES + 1)]
+        patterns = [(EX['resource{0}'.format(i)], EX['size'], variable, None) for i, variable in enumerate(variables)]
+        self.assertRaises(sparql.Untranslatable, sparql.BGPQuery, patterns)
+        self.assertEquals(list(self.graph.store.batch_unify(patterns)),
+                          [dict((variable, Literal(i)) for i, variable in enumerate(variables))])
+
+    def testOptional(self):
+        self.graph.add((EX['resource2'], EX['nickname'], Literal('Two')))
+        self.graph.add((EX['resource4'], EX['nickname'], EX['four']))
+        results = self.assertSameResults(
+            "SELECT ?s ?nickname WHERE { ?s a ex:Even OPTIONAL { ?s ex:nickname ?nickname } }", queries=2)
+        self.assertEquals(len(results), 5)
+        self.assertEquals(set(nickname for _, nickname in results), set([None, Literal('Two'), EX['four']]))
+
+        results = self.assertSameResults(
+            "SELECT ?s ?nickname WHERE { ?s ex:size ?size OPTIONAL { ?s ex:nickname ?nickname } } "
+            "ORDER BY DESC(?size) LIMIT 3 OFFSET 5", ordered=True, queries=2)
+        self.assertEquals(results, [(EX['resource4'], EX['four']), (EX['resource3'], None), (EX['resource2'], Literal('Two'))])
+
+    def testBindJoin(self):
+        s, label = Variable('s'), Variable('label')
+        solutions = [{s: EX['resource{0}'.format(i)]} for i in range(10)] + [{s: Literal('resource')}]
+        patterns = [(s, RDFS.label, label, EX['sparql'])]
+
+        # blocks of three solutions, since the label may be stored in both statement tables
+        with self.assertNumQueries(1 + 4):
+            results = list(sparql.bind_join(patterns, solutions, optional=True, block_size=6))
+        self.assertEquals(results, [dict(solution, label=Literal('Resource {0}'.format(i), lang='en'))
+                                    if i < 10 else solution for i, solution in enumerate(solutions)])
+
+
+@unittest.skipUnless(rdfextras, "rdfextras is not installed")
+class TermDictionarySPARQLTest(test.TestCase):
+    """
+    Checks on queries over a store that uses the term dictionary.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('DjangoTermDictionary', identifier=EX['sparql'])
+        for i in range(10):
+            resource = EX['resource{0}'.format(i)]
+            self.graph.add((resource, RDF.type, EX['Even'] if i % 2 == 0 else EX['Odd']))
+            self.graph.add((resource, EX['size'], Literal(i)))
+        rdflib.Graph('Django', identifier=EX['sparql']).add((EX['resource0'], EX['size'], Literal(42)))
+
+    def testSelect(self):
+        results = list(self.graph.query(
+            "SELECT ?s WHERE { ?s a ex:Odd . ?s ex:size ?size FILTER (?size > 2) }", initNs={'ex': EX}))
+        self.assertEquals(sorted(results), [(EX['resource{0}'.format(i)],) for i in (3, 5, 7, 9)])
+
+        results = list(self.graph.query("SELECT ?size WHERE { ex:resource0 ex:size ?size }", initNs={'ex': EX}))
+        self.assertEquals(results, [(Literal(0),)])
@@ -2,11 +2,18 @@
 Unit tests for the store class. Includes all unit tests that are hard or annoying to doctest.
 """
 import datetime
+from decimal import Decimal
+import threading
+import time
 from django import test
+from django.core.signals import request_finished
+from django.db import connection, transaction
+from django.db.models import signals
 import rdflib
 from rdflib.graph import Graph
-from rdflib.namespace import RDF, RDFS, Namespace
-from rdflib.term import URIRef, Literal, BNode
+from rdflib.namespace import RDF, RDFS, XSD, Namespace
+from rdflib.term import URIRef, Literal, BNode, Variable
+from rdflib_django import benchmarks, caches, counts, models, routing, sql
 
 
 EX = Namespace("http://www.example.com/")
@@ -93,3 +100,930 @@ class GraphTest(test.TestCase):
         self.assertEquals(self.graph.value(artis, EX['date']), date_literal)
         self.assertEquals(self.graph.value(artis, EX['bool']), bool_literal)
         self.assertEquals(self.graph.value(artis, EX['number']), number_literal)
+
+
+class TermDictionaryGraphTest(GraphTest):
+    """
+    The same checks, using the term dictionary.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('DjangoTermDictionary')
+
+
+class AddNTest(test.TestCase):
+    """
+    Checks on the bulk loading of quads.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django')
+        self.other = rdflib.Graph('Django')
+
+    def test_add_quads_in_multiple_contexts(self):
+        """
+        Quads end up in their own context.
+        """
+        self.graph.store.addN([
+            (artis, RDF.type, zoo, self.graph),
+            (artis, RDFS.label, artis_label, self.graph),
+            (berlin_zoo, RDF.type, zoo, self.other),
+            (berlin_zoo, EX['number'], number_literal, self.other),
+            (berlin_zoo, EX['date'], date_literal, self.other),
+            ])
+
+        self.assertEquals(len(self.graph), 2)
+        self.assertEquals(len(self.other), 3)
+        self.assertEquals(self.graph.value(artis, RDFS.label), artis_label)
+        self.assertEquals(self.other.value(berlin_zoo, EX['date']), date_literal)
+
+    def test_duplicates_are_ignored(self):
+        """
+        Duplicates within a batch and statements that are already stored are skipped.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        self.graph.add((artis, RDFS.label, artis_label))
+        self.graph.add((anonymous, RDF.type, zoo))
+
+        self.graph.store.addN([
+            (artis, RDF.type, zoo, self.graph),
+            (artis, RDFS.label, artis_label, self.graph),
+            (anonymous, RDF.type, zoo, self.graph),
+            (artis, RDF.type, org, self.graph),
+            (artis, RDF.type, org, self.graph),
+            ])
+
+        self.assertEquals(len(self.graph), 4)
+
+    def test_batches(self):
+        """
+        Batches are processed with a fixed number of queries.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        self.graph.store.batch_size = 10
+        subjects = [EX['resource-{0}'.format(i)] for i in range(10)]
+
+        # per batch: one for the named graph, a lookup of known triples and an insert for each kind of object,
+        # a lock of the count of the store, a check of the new triples for each kind of object,
+        # and an update of the count of the named graph and the store
+        with self.assertNumQueries(2 * (1 + 2 * 2 + 1 + 2 + 2)):
+            self.graph.store.addN(
+                quad
+                for s in subjects
+                for quad in [(s, RDFS.label, Literal(s), self.graph), (s, RDF.type, zoo, self.graph)])
+
+        self.assertEquals(len(self.graph), 21)
+
+
+class NamedGraphCacheTest(test.TransactionTestCase):
+    """
+    Checks on the caching of named graphs.
+    """
+
+    def setUp(self):
+        caches.named_graphs.clear()
+        self.graph = rdflib.Graph('Django', identifier=EX['cached'])
+
+    def tearDown(self):
+        caches.named_graphs.clear()
+
+    def test_lookups_are_cached(self):
+        """
+        Once a named graph is known, using it does not query for it again.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        self.assertIn(EX['cached'], dict(caches.named_graphs.items()))
+
+        self.assertEquals(len(self.graph), 1)
+        with self.assertNumQueries(1):
+            self.assertEquals(len(self.graph), 1)
+
+    def test_reading_does_not_create(self):
+        """
+        Reading from an unknown named graph does not create it.
+        """
+        self.assertEquals(len(self.graph), 0)
+        self.assertEquals(list(self.graph.triples((None, None, None))), [])
+        self.graph.remove((None, None, None))
+        self.assertFalse(models.NamedGraph.objects.filter(identifier=EX['cached']).exists())
+
+    def test_invalidation(self):
+        """
+        Renaming, deleting or destroying graphs invalidates the cache.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        named_graph = models.NamedGraph.objects.get(identifier=EX['cached'])
+        named_graph.identifier = EX['renamed']
+        named_graph.save()
+        self.assertEquals(len(self.graph), 0)
+        self.assertEquals(len(rdflib.Graph('Django', identifier=EX['renamed'])), 1)
+
+        named_graph.delete()
+        self.assertEquals(len(caches.named_graphs), 0)
+
+        self.graph.add((artis, RDF.type, zoo))
+        self.graph.destroy(None)
+        self.assertEquals(len(caches.named_graphs), 0)
+
+    def test_other_processes(self):
+        """
+        Renaming or deleting a graph in another process invalidates the cache once the version stamp is checked.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        self.assertEquals(len(self.graph), 1)
+        self.assertIsNotNone(caches.named_graphs.get(EX['cached']))
+
+        caches.shared_cache.set(caches.NamedGraphCache.VERSION_KEY, 'changed by another process')
+        self.assertIsNotNone(caches.named_graphs.get(EX['cached']))
+        check_interval, caches.named_graphs.check_interval = caches.named_graphs.check_interval, 0
+        try:
+            self.assertIsNone(caches.named_graphs.get(EX['cached']))
+        finally:
+            caches.named_graphs.check_interval = check_interval
+
+    def test_replace_waits_for_other_processes(self):
+        """
+        Replacing a graph only removes the old version once other processes have checked the version stamp.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        old_id = models.NamedGraph.objects.get(identifier=EX['cached']).id
+        check_interval, caches.named_graphs.check_interval = caches.named_graphs.check_interval, 0.2
+        other_process = caches.NamedGraphCache(10, caches.shared_cache, 0.2)
+        self.assertIsNone(other_process.get(EX['cached']))
+        other_process.set(EX['cached'], old_id)
+        try:
+            staging = self.graph.store.create_staging_graph()
+            staging.add((artis, RDF.type, org))
+            thread = self.graph.store.replace_context(self.graph, staging, background=True)
+            self.assertEquals(other_process.get(EX['cached']), old_id)
+            self.assertTrue(models.URIStatement.objects.filter(context_id=old_id).exists())
+
+            thread.join()
+            self.assertIsNone(other_process.get(EX['cached']))
+            self.assertFalse(models.NamedGraph.objects.filter(id=old_id).exists())
+            self.assertEquals(list(self.graph), [(artis, RDF.type, org)])
+
+            staging = self.graph.store.create_staging_graph()
+            start = time.time()
+            self.graph.store.replace_context(self.graph, staging)
+            self.assertGreaterEqual(time.time() - start, 0.2)
+            self.assertEquals(len(self.graph), 0)
+        finally:
+            caches.named_graphs.check_interval = check_interval
+
+
+class ResultCacheTest(test.TransactionTestCase):
+    """
+    Checks on the result cache.
+    """
+
+    def setUp(self):
+        caches.shared_cache.clear()
+        caches.named_graphs.clear()
+        caches.results.reset_stats()
+        # the shared cache has lost the version stamp, which must not clear the named graph cache halfway a test
+        self.check_interval, caches.named_graphs.check_interval = caches.named_graphs.check_interval, 3600
+        self.max_triples = caches.results.max_triples
+        self.graph = rdflib.Graph('Django', identifier=EX['results'])
+        self.graph.store.result_cache = caches.results
+        self.conjunctive = rdflib.ConjunctiveGraph(self.graph.store)
+        self.graph.add((artis, RDF.type, zoo))
+        self.graph.add((artis, RDFS.label, artis_label))
+
+    def tearDown(self):
+        caches.shared_cache.clear()
+        caches.named_graphs.clear()
+        caches.named_graphs.check_interval = self.check_interval
+        caches.results.max_triples = self.max_triples
+
+    def test_hits(self):
+        """
+        Reading the same pattern again is served from the cache.
+        """
+        expected = set([(artis, RDF.type, zoo), (artis, RDFS.label, artis_label)])
+        self.assertEquals(set(self.graph.triples((artis, None, None))), expected)
+        with self.assertNumQueries(0):
+            self.assertEquals(set(self.graph.triples((artis, None, None))), expected)
+        self.assertEquals(list(self.graph.triples((berlin_zoo, None, None))), [])
+
+        stats = caches.results.stats()
+        self.assertEquals((stats['hits'], stats['misses'], stats['sets']), (1, 2, 2))
+        self.assertAlmostEquals(stats['hit_ratio'], 1 / 3.0)
+
+    def test_writes_invalidate(self):
+        """
+        Adding or removing statements invalidates the results of the named graph and of all named graphs.
+        """
+        for graph in (self.graph, self.conjunctive):
+            self.assertEquals(len(list(graph.triples((artis, None, None)))), 2)
+
+        self.graph.add((artis, RDF.type, org))
+        for graph in (self.graph, self.conjunctive):
+            self.assertEquals(len(list(graph.triples((artis, None, None)))), 3)
+
+        self.graph.remove((artis, RDF.type, None))
+        for graph in (self.graph, self.conjunctive):
+            self.assertEquals(list(graph.triples((artis, None, None))), [(artis, RDFS.label, artis_label)])
+
+    def test_unchanged_writes(self):
+        """
+        Writes that do not change a named graph do not invalidate its results.
+        """
+        list(self.graph.triples((artis, None, None)))
+        self.graph.add((artis, RDF.type, zoo))
+        self.graph.remove((berlin_zoo, None, None))
+        with self.assertNumQueries(0):
+            list(self.graph.triples((artis, None, None)))
+
+    def test_destroy(self):
+        """
+        Destroying the store invalidates all results, even if primary keys of named graphs are reused.
+        """
+        list(self.graph.triples((artis, None, None)))
+        self.graph.store.destroy()
+        self.graph.add((berlin_zoo, RDF.type, zoo))
+        self.assertEquals(list(self.graph.triples((artis, None, None))), [])
+
+    def read_in_thread(self):
+        """
+        Reads the triples of artis in another thread, with its own database connection.
+        """
+        result = []
+
+        def read():
+            try:
+                result.extend(self.graph.triples((artis, None, None)))
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return set(result)
+
+    def test_reads_before_commit(self):
+        """
+        Results that others read and cache before a write is committed are invalidated once it is committed.
+        """
+        before = set([(artis, RDF.type, zoo), (artis, RDFS.label, artis_label)])
+        after = before | set([(artis, RDF.type, org)])
+
+        self.graph.store.begin()
+        self.graph.add((artis, RDF.type, org))
+        self.assertEquals(len(self.graph), 3)
+        self.assertEquals(self.read_in_thread(), before)
+        self.graph.commit()
+        self.assertEquals(self.read_in_thread(), after)
+
+        with transaction.commit_on_success():
+            self.graph.remove((artis, RDF.type, org))
+            self.assertEquals(self.read_in_thread(), after)
+        request_finished.send(sender=None)
+        self.assertEquals(self.read_in_thread(), before)
+
+    def test_large_results(self):
+        """
+        Patterns with more than max_triples triples are not cached.
+        """
+        caches.results.max_triples = 1
+        list(self.graph.triples((artis, None, None)))
+        list(self.graph.triples((None, RDF.type, None)))
+        self.assertEquals(caches.results.stats()['sets'], 1)
+
+
+class TransactionTest(test.TransactionTestCase):
+    """
+    Checks on store transactions.
+    """
+
+    def setUp(self):
+        caches.named_graphs.clear()
+        self.graph = rdflib.Graph('Django', identifier=EX['transactions'])
+        self.graph.add((artis, RDF.type, zoo))
+
+    def tearDown(self):
+        caches.named_graphs.clear()
+
+    def test_commit(self):
+        """
+        Committed writes are stored.
+        """
+        self.graph.add((artis, RDFS.label, artis_label))
+        with self.graph.store.atomic():
+            self.graph.add((berlin_zoo, RDF.type, zoo))
+            self.graph.remove((artis, RDF.type, zoo))
+            self.graph.remove((artis, RDFS.label, artis_label))
+        self.assertEquals(list(self.graph.triples((None, None, None))), [(berlin_zoo, RDF.type, zoo)])
+
+    def test_rollback(self):
+        """
+        Rolled back writes are discarded, whether they were flushed or not.
+        """
+        self.graph.store.begin()
+        self.graph.add((berlin_zoo, RDF.type, zoo))
+        self.assertEquals(len(self.graph), 2)
+        self.graph.remove((artis, None, None))
+        self.graph.rollback()
+        self.assertEquals(list(self.graph.triples((None, None, None))), [(artis, RDF.type, zoo)])
+
+        def fail():
+            with self.graph.store.atomic():
+                self.graph.add((berlin_zoo, RDF.type, zoo))
+                raise ValueError()
+        self.assertRaises(ValueError, fail)
+        self.assertEquals(len(self.graph), 1)
+        self.assertRaises(ValueError, lambda: [self.graph.store.begin() for _ in range(2)])
+        self.graph.rollback()
+
+    def test_batches(self):
+        """
+        Writes are buffered, and written in batches when the buffer is full or the store is read.
+        """
+        self.graph.store.batch_size = 10
+        subjects = [EX['resource-{0}'.format(i)] for i in range(10)]
+        self.assertEquals(len(self.graph), 1)
+        with self.graph.store.atomic():
+            with self.assertNumQueries(0):
+                for s in subjects[:9]:
+                    self.graph.add((s, RDF.type, zoo))
+
+            # a lookup of known triples and an insert, a lock and a check of the new triples, and an update of the counts
+            with self.assertNumQueries(2 + 2 + 2):
+                self.graph.add((subjects[9], RDF.type, zoo))
+
+            with self.assertNumQueries(0):
+                for s in subjects[:5]:
+                    self.graph.remove((s, RDF.type, zoo))
+            # a lock, the deltas, a delete by triple key, and the updates of the counts, then the count itself
+            with self.assertNumQueries(1 + 2 + 1 + 2 + 1):
+                self.assertEquals(len(self.graph), 6)
+
+            self.graph.remove((artis, None, None))
+        self.assertEquals(len(self.graph), 5)
+
+    def test_savepoints(self):
+        """
+        Within a transaction managed by the caller, the store transaction does not commit the transaction.
+        """
+        with transaction.commit_on_success():
+            self.graph.store.begin()
+            self.graph.add((berlin_zoo, RDF.type, zoo))
+            self.graph.rollback()
+            self.assertEquals(len(self.graph), 1)
+
+            with self.graph.store.atomic():
+                self.graph.add((berlin_zoo, RDF.type, zoo))
+            self.assertTrue(transaction.is_managed())
+        self.assertEquals(len(self.graph), 2)
+
+
+class RemoveTest(test.TestCase):
+    """
+    Checks on the removal of statements and named graphs.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django', identifier=EX['remove'])
+        self.other = rdflib.Graph('Django', identifier=EX['other'])
+        self.conjunctive = rdflib.ConjunctiveGraph('Django')
+        for graph in (self.graph, self.other):
+            graph.add((artis, RDF.type, zoo))
+            graph.add((artis, RDFS.label, artis_label))
+        self.graph.add((berlin_zoo, RDF.type, zoo))
+        self.named_graph_id = models.NamedGraph.objects.get(identifier=EX['remove']).id
+
+    def test_set_based_delete(self):
+        """
+        Statements are deleted by a single statement, unless receivers are connected to the delete signals.
+        """
+        with self.assertNumQueries(1):
+            self.assertEquals(sql.delete(models.URIStatement.objects.filter(context_id=self.named_graph_id)), 2)
+        self.assertEquals(list(self.graph.triples((None, None, None))), [(artis, RDFS.label, artis_label)])
+        self.assertEquals(sql.delete(models.URIStatement.objects.filter(triple_key__in=[])), 0)
+
+        deleted = []
+        receiver = lambda sender, instance, **kwargs: deleted.append(instance)
+        signals.pre_delete.connect(receiver, sender=models.LiteralStatement)
+        try:
+            self.assertEquals(sql.delete(models.LiteralStatement.objects.filter(context_id=self.named_graph_id)), 1)
+        finally:
+            signals.pre_delete.disconnect(receiver, sender=models.LiteralStatement)
+        self.assertEquals(len(deleted), 1)
+
+    def test_replace_in_transaction(self):
+        """
+        A context cannot be replaced within a transaction managed by the caller, which leaves it unchanged.
+        """
+        staging = self.graph.store.create_staging_graph()
+        staging.add((artis, RDF.type, org))
+        for background in (False, True):
+            self.assertRaises(transaction.TransactionManagementError,
+                              self.graph.store.replace_context, self.graph, staging, background=background)
+        self.assertEquals(len(self.graph), 3)
+        self.assertEquals(models.NamedGraph.objects.get(identifier=EX['remove']).id, self.named_graph_id)
+        self.assertEquals(list(staging), [(artis, RDF.type, org)])
+
+    def test_remove_context(self):
+        """
+        Removing a context removes its statements and the named graph, and maintains the count of the store.
+        """
+        self.assertEquals(len(self.conjunctive), 3)
+        self.graph.store.remove_context(self.graph)
+
+        self.assertEquals(set(self.conjunctive.contexts()), set([self.other]))
+        self.assertEquals(len(self.graph), 0)
+        self.assertEquals(len(self.other), 2)
+        self.assertEquals(len(self.conjunctive), 2)
+        self.assertEquals(counts.count_triples(), 2)
+        self.assertFalse(models.TripleCount.objects.filter(context_id=self.named_graph_id).exists())
+
+        self.graph.store.remove_context(self.graph)
+        self.graph.add((berlin_zoo, RDF.type, zoo))
+        self.assertEquals(len(self.graph), 1)
+
+
+class ReplaceContextTest(test.TransactionTestCase):
+    """
+    Checks on replacing named graphs, which commits the renaming.
+    """
+
+    def setUp(self):
+        caches.named_graphs.clear()
+        self.graph = rdflib.Graph('Django', identifier=EX['replace'])
+        self.other = rdflib.Graph('Django', identifier=EX['other'])
+        self.conjunctive = rdflib.ConjunctiveGraph('Django')
+        for graph in (self.graph, self.other):
+            graph.add((artis, RDF.type, zoo))
+        self.graph.add((berlin_zoo, RDF.type, zoo))
+
+    def tearDown(self):
+        caches.named_graphs.clear()
+
+    def test_replace_context(self):
+        """
+        Replacing a context renames the staging graph, and removes the old version and its count.
+        """
+        staging = self.graph.store.create_staging_graph()
+        staging.add((artis, RDF.type, org))
+        staging_id = models.NamedGraph.objects.get(identifier=staging.identifier).id
+
+        self.graph.store.replace_context(self.graph, staging)
+        self.assertEquals(list(self.graph), [(artis, RDF.type, org)])
+        self.assertEquals(models.NamedGraph.objects.get(identifier=EX['replace']).id, staging_id)
+        self.assertEquals(set(self.conjunctive.contexts()), set([self.graph, self.other]))
+        self.assertEquals(len(self.conjunctive), 2)
+        self.assertEquals(counts.count_triples(), 2)
+
+    def test_replace_in_transaction(self):
+        """
+        A context cannot be replaced within a transaction managed by the caller.
+        """
+        staging = self.graph.store.create_staging_graph()
+        staging.add((artis, RDF.type, org))
+        with transaction.commit_on_success():
+            self.assertRaises(transaction.TransactionManagementError,
+                              self.graph.store.replace_context, self.graph, staging)
+        self.assertEquals(len(self.graph), 2)
+        self.assertIn(staging.identifier, set(graph.identifier for graph in self.conjunctive.contexts()))
+
+
+class ReplicaTest(test.TransactionTestCase):
+    """
+    Checks on the routing of reads to a replica database, which is not replicated to in these tests.
+    """
+
+    multi_db = True
+
+    def setUp(self):
+        caches.named_graphs.clear()
+        self.graph = rdflib.Graph('Django', identifier=EX['replicated'])
+        self.graph.store.read_databases = ('replica',)
+        self.conjunctive = rdflib.ConjunctiveGraph(self.graph.store)
+        self.graph.add((artis, RDF.type, zoo))
+        caches.named_graphs.clear()
+        self.replica = models.NamedGraph.objects.using('replica').create(identifier=EX['replica-only'])
+
+    def tearDown(self):
+        caches.named_graphs.clear()
+
+    def assertReadsFrom(self, database):
+        """
+        Checks that the reads of the graph use a database.
+        """
+        primary = database == 'default'
+        self.assertEquals(len(self.graph), 1 if primary else 0)
+        self.assertEquals(len(self.conjunctive), 1 if primary else 0)
+        self.assertEquals(list(self.graph.triples((None, None, None))), [(artis, RDF.type, zoo)] if primary else [])
+        self.assertEquals(set(self.conjunctive.contexts()),
+                          set([self.graph] if primary else [self.conjunctive.get_context(EX['replica-only'])]))
+        self.assertEquals(len(list(self.graph.store.batch_unify([(Variable('s'), RDF.type, zoo, None)]))),
+                          1 if primary else 0)
+
+    def test_reads(self):
+        """
+        Reads go to the replica, unless the thread is pinned or in a transaction.
+        """
+        self.assertReadsFrom('replica')
+
+        with routing.pinned():
+            self.assertReadsFrom('default')
+        with self.graph.store.atomic():
+            self.assertReadsFrom('default')
+        with transaction.commit_on_success():
+            self.assertReadsFrom('default')
+        self.graph.store.read_databases = ()
+        self.assertReadsFrom('default')
+
+    def test_writes(self):
+        """
+        Writes go to the primary database.
+        """
+        self.graph.add((berlin_zoo, RDF.type, zoo))
+        self.graph.remove((artis, None, None))
+        self.assertEquals(models.URIStatement.objects.using('default').count(), 1)
+        self.assertEquals(models.URIStatement.objects.using('replica').count(), 0)
+
+    def test_middleware(self):
+        """
+        Requests with unsafe methods are pinned to the primary database.
+        """
+        middleware = routing.PinningMiddleware()
+        factory = test.client.RequestFactory()
+        for request, pinned in ((factory.get('/'), False), (factory.post('/'), True)):
+            middleware.process_request(request)
+            self.assertEquals(routing.is_pinned(), pinned)
+            middleware.process_response(request, None)
+            self.assertFalse(routing.is_pinned())
+
+
+class StatementKeyTest(test.TestCase):
+    """
+    Checks on the hash-based primary keys of statements.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django')
+
+    def test_keys_are_deterministic(self):
+        """
+        A statement gets the same key whenever it is stored in the same context.
+        """
+        self.graph.add((artis, RDFS.label, artis_label))
+        key = models.LiteralStatement.objects.get().pk
+
+        self.graph.remove((artis, RDFS.label, artis_label))
+        self.graph.add((artis, RDFS.label, artis_label))
+        self.assertEquals(models.LiteralStatement.objects.get().pk, key)
+
+        rdflib.Graph('Django').add((artis, RDFS.label, artis_label))
+        self.assertEquals(models.LiteralStatement.objects.filter(pk=key).count(), 1)
+        self.assertEquals(models.LiteralStatement.objects.count(), 2)
+
+    def test_insert_ignore_fallback(self):
+        """
+        Databases without conflict-ignoring inserts skip stored statements as well.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+
+        vendor_sql = sql.INSERT_IGNORE_SQL.pop(connection.vendor, None)
+        try:
+            self.graph.addN([(artis, RDF.type, zoo, self.graph), (artis, RDF.type, org, self.graph)])
+        finally:
+            if vendor_sql is not None:
+                sql.INSERT_IGNORE_SQL[connection.vendor] = vendor_sql
+
+        self.assertEquals(len(self.graph), 2)
+
+
+class TripleCountTest(test.TestCase):
+    """
+    Checks on the maintained statement counts.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django')
+        self.other = rdflib.Graph('Django')
+        self.conjunctive = rdflib.ConjunctiveGraph('Django')
+
+    def assertCounts(self, graph_count, other_count, total_count):
+        """
+        Checks the maintained counts against counts calculated from the statement tables.
+        """
+        self.assertEquals((len(self.graph), len(self.other), len(self.conjunctive)),
+                          (graph_count, other_count, total_count))
+        counts.recount()
+        self.assertEquals((len(self.graph), len(self.other), len(self.conjunctive)),
+                          (graph_count, other_count, total_count))
+
+    def test_counts_are_maintained(self):
+        """
+        Adding and removing statements updates the counts.
+        """
+        self.assertCounts(0, 0, 0)
+
+        self.graph.add((artis, RDF.type, zoo))
+        self.graph.add((artis, RDFS.label, artis_label))
+        self.other.addN([(artis, RDF.type, zoo, self.other), (berlin_zoo, RDF.type, zoo, self.other)])
+        self.graph.add((artis, RDF.type, zoo))
+        self.assertCounts(2, 2, 3)
+
+        self.graph.remove((artis, RDF.type, zoo))
+        self.assertCounts(1, 2, 3)
+
+        self.other.remove((None, RDF.type, None))
+        self.assertCounts(1, 0, 1)
+
+        self.graph.add((berlin_zoo, RDF.type, zoo))
+        self.other.add((berlin_zoo, RDF.type, zoo))
+        self.conjunctive.remove((None, None, zoo))
+        self.assertCounts(1, 0, 1)
+
+        self.conjunctive.destroy(None)
+        self.assertCounts(0, 0, 0)
+
+    def test_len_reads_counts(self):
+        """
+        Once calculated, lengths are read with a single query.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        len(self.conjunctive)
+
+        with self.assertNumQueries(1):
+            self.assertEquals(len(self.conjunctive), 1)
+
+
+    def test_missing_counts_are_not_stored_by_readers(self):
+        """
+        Missing counts are calculated when they are read, and only created by syncdb.
+        """
+        self.graph.add((artis, RDF.type, zoo))
+        models.TripleCount.objects.all().delete()
+
+        self.assertEquals((len(self.graph), len(self.conjunctive)), (1, 1))
+        self.assertFalse(models.TripleCount.objects.exists())
+
+        counts.create_missing_counts([], 'default', verbosity=0)
+        counts.create_missing_counts([], 'default', verbosity=0)
+        self.assertEquals(models.TripleCount.objects.filter(context__isnull=True).count(), 1)
+        self.assertEquals(models.TripleCount.objects.count(), 2)
+        self.assertCounts(1, 0, 1)
+
+    def test_destroy_keeps_store_count(self):
+        """
+        The count of the store is created once and survives destroying the store; the count of a
+        context is created with its named graph.
+        """
+        self.conjunctive.destroy(None)
+        self.assertEquals(models.TripleCount.objects.filter(context__isnull=True).count(), 1)
+
+        self.graph.add((artis, RDF.type, zoo))
+        self.assertEquals(models.TripleCount.objects.count(), 2)
+        with self.assertNumQueries(1):
+            self.assertEquals(len(self.conjunctive), 1)
+
+
+class TriplesTest(test.TestCase):
+    """
+    Checks on reading triples in chunks.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django')
+        self.conjunctive = rdflib.ConjunctiveGraph('Django')
+        self.subjects = [EX['resource-{0}'.format(i)] for i in range(10)]
+        self.graph.addN((s, RDF.type, zoo, self.graph) for s in self.subjects)
+        self.graph.addN((s, RDFS.label, Literal(s), self.graph) for s in self.subjects)
+        self.graph.store.batch_size = self.conjunctive.store.batch_size = 3
+
+    def test_chunks(self):
+        """
+        Patterns are read in chunks of batch_size rows.
+        """
+        # four chunks of statements with a URI object, and a single empty chunk of statements with a literal
+        with self.assertNumQueries(4 + 1):
+            triples = list(self.conjunctive.store.triples((None, RDF.type, None)))
+
+        self.assertEquals(set(triple for triple, _ in triples), set((s, RDF.type, zoo) for s in self.subjects))
+
+    def test_all_positions(self):
+        """
+        Every kind of triple pattern returns the matching triples.
+        """
+        all_triples = set(self.graph)
+        self.assertEquals(len(all_triples), 20)
+
+        for triple in all_triples:
+            for mask in range(8):
+                pattern = tuple(term if mask & (1 << i) else None for i, term in enumerate(triple))
+                expected = set(t for t in all_triples if all(p is None or p == t[i] for i, p in enumerate(pattern)))
+                self.assertEquals(set(self.graph.triples(pattern)), expected)
+
+    def test_choices(self):
+        """
+        A list of terms in any position matches each of them, using chunks of batch_size terms.
+        """
+        all_triples = set(self.graph)
+        labels = [Literal(s) for s in self.subjects[:5]] + [Literal(self.subjects[5], lang='en')]
+        for pattern in [(self.subjects[:5], None, None), (None, [RDF.type, RDFS.label], None),
+                        (None, None, labels + [zoo]), (self.subjects, RDFS.label, None), (None, [], zoo)]:
+            choices = [term if isinstance(term, list) else [term] for term in pattern]
+            expected = set(t for t in all_triples
+                           if all(not terms or terms == [None] or t[i] in terms for i, terms in enumerate(choices)))
+            self.assertEquals(set(triple for triple, _ in self.graph.store.triples_choices(pattern, self.graph)), expected)
+
+        # two chunks of three subjects, for both statement tables; each reads a full chunk of rows and an empty one
+        with self.assertNumQueries(2 * 2 * 2):
+            list(self.conjunctive.store.triples_choices((self.subjects[:6], None, None)))
+
+    def test_modify_while_iterating(self):
+        """
+        The store can be written to while iterating over triples.
+        """
+        for s, _, _ in self.graph.triples((None, RDF.type, zoo)):
+            self.graph.add((s, RDF.type, org))
+
+        self.assertEquals(len(self.graph), 30)
+
+    def test_benchmark(self):
+        """
+        The microbenchmark compares both ways of reading triples.
+        """
+        self.assertEquals(sorted(benchmarks.compare_triples(size=20, repeat=1)), ['models', 'rows'])
+
+
+class TermDictionaryTriplesTest(test.TestCase):
+    """
+    Checks on reading triples using the term dictionary.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('DjangoTermDictionary')
+        self.subjects = [EX['resource-{0}'.format(i)] for i in range(10)]
+        self.graph.addN((s, RDF.type, zoo, self.graph) for s in self.subjects)
+        self.graph.addN((s, RDFS.label, Literal(s), self.graph) for s in self.subjects)
+        self.graph.store.batch_size = 3
+
+    def test_choices(self):
+        """
+        A list of terms in any position matches each of them, using chunks of batch_size terms.
+        """
+        all_triples = set(self.graph)
+        labels = [Literal(s) for s in self.subjects[:5]] + [Literal(self.subjects[5], lang='en')]
+        for pattern in [(self.subjects[:5], None, None), (None, [RDF.type, RDFS.label], None),
+                        (None, None, labels + [zoo]), (self.subjects, RDFS.label, None), (None, [], zoo),
+                        ([EX['unknown']], None, None)]:
+            choices = [term if isinstance(term, list) else [term] for term in pattern]
+            expected = set(t for t in all_triples
+                           if all(not terms or terms == [None] or t[i] in terms for i, terms in enumerate(choices)))
+            self.assertEquals(set(triple for triple, _ in self.graph.store.triples_choices(pattern, self.graph)), expected)
+
+        self.assertEquals(set(o for _, _, o in self.graph.triples_choices((self.subjects[:2], RDFS.label, None))),
+                          set(labels[:2]))
+
+    def test_ranges(self):
+        """
+        Range queries are rejected.
+        """
+        self.assertRaises(TypeError, self.graph.store.range_triples, (None, RDFS.label), kind='numeric')
+
+
+class LiteralTest(test.TestCase):
+    """
+    Checks on the storage of literals in separate columns.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django')
+        self.graph.add((artis, RDFS.label, Literal('Artis', lang='nl')))
+        self.graph.add((artis, RDFS.label, Literal('Artis', lang='en')))
+        self.graph.add((artis, RDFS.label, Literal('Artis')))
+        self.graph.add((artis, EX['founded'], Literal(1838)))
+
+    def test_columns(self):
+        """
+        Literals are stored as their lexical form, language and datatype.
+        """
+        statement = models.LiteralStatement.objects.get(language='nl')
+        self.assertEquals((statement.object, statement.datatype), (u'Artis', u''))
+        statement = models.LiteralStatement.objects.get(predicate=EX['founded'])
+        self.assertEquals((statement.object, statement.language, statement.datatype),
+                          (u'1838', u'', u'http://www.w3.org/2001/XMLSchema#integer'))
+
+    def test_separators_in_lexical_form(self):
+        """
+        Lexical forms may contain anything, including the separators of the old serialization.
+        """
+        literal = Literal('a^^b^^c', lang='en')
+        self.graph.add((berlin_zoo, RDFS.label, literal))
+        self.assertEquals(list(self.graph.objects(berlin_zoo, RDFS.label)), [literal])
+        self.assertEquals(len(list(self.graph.triples((berlin_zoo, RDFS.label, literal)))), 1)
+
+    def test_separators_in_triple_keys(self):
+        """
+        Literals whose serializations collide on their separators are distinct triples.
+        """
+        first = Literal('a^^^^http://example.com/x', datatype=URIRef('http://example.com/y'))
+        second = Literal('a', datatype=URIRef('http://example.com/x^^^^http://example.com/y'))
+        self.graph.addN([(berlin_zoo, RDFS.label, first, self.graph), (berlin_zoo, RDFS.label, second, self.graph)])
+        self.assertEquals(set(self.graph.objects(berlin_zoo, RDFS.label)), set([first, second]))
+        self.assertEquals(models.LiteralStatement.objects.filter(subject=berlin_zoo).values('triple_key').distinct().count(), 2)
+
+    def test_language_and_datatype(self):
+        """
+        Triples can be filtered by the language or datatype of their object.
+        """
+        def objects(**kwargs):
+            return set(o for (_, _, o), _ in self.graph.store.triples((artis, None, None), self.graph, **kwargs))
+
+        self.assertEquals(objects(language='en'), set([Literal('Artis', lang='en')]))
+        self.assertEquals(objects(language=''), set([Literal('Artis'), Literal(1838)]))
+        self.assertEquals(objects(datatype=Literal(1838).datatype), set([Literal(1838)]))
+        self.assertEquals(len(list(self.graph.store.triples((artis, None, zoo), self.graph, language='en'))), 0)
+
+
+class RangeTest(test.TestCase):
+    """
+    Checks on the typed shadow columns and range queries over literal values.
+    """
+
+    def setUp(self):
+        self.graph = rdflib.Graph('Django')
+        self.graph.store.batch_size = 2
+        self.values = [Literal(v) for v in (3, 1.5, 10, -2)] + [Literal('7.25', datatype=XSD.decimal)]
+        for i, value in enumerate(self.values):
+            self.graph.add((EX['item-{0}'.format(i)], EX['size'], value))
+        self.graph.add((artis, EX['size'], Literal('large')))
+        self.graph.add((artis, EX['size'], Literal('huge', datatype=XSD.integer)))
+
+    def objects(self, *args, **kwargs):
+        """
+        Returns the objects of a range query over the sizes in the graph.
+        """
+        return [o for (_, _, o), _ in self.graph.store.range_triples((None, EX['size']), self.graph, *args, **kwargs)]
+
+    def test_typed_values(self):
+        """
+        Typed values are stored for valid literals of a supported datatype only.
+        """
+        values = dict((statement.object, statement.numeric_value)
+                      for statement in models.LiteralStatement.objects.filter(predicate=EX['size']))
+        self.assertEquals(values, {u'3': 3.0, u'1.5': 1.5, u'10': 10.0, u'-2': -2.0, u'7.25': 7.25,
+                                   u'large': None, u'huge': None})
+
+        self.graph.add((artis, EX['open'], Literal(True)))
+        self.graph.add((artis, EX['opened'], Literal(datetime.datetime(1838, 5, 1, 10, 30))))
+        statement = models.LiteralStatement.objects.get(predicate=EX['open'])
+        self.assertEquals((statement.boolean_value, statement.numeric_value), (True, None))
+        statement = models.LiteralStatement.objects.get(predicate=EX['opened'])
+        self.assertEquals((statement.datetime_value, statement.date_value), (datetime.datetime(1838, 5, 1, 10, 30), None))
+
+    def test_ranges(self):
+        """
+        Bounds select the values within a range, ordered by value.
+        """
+        self.assertEquals(self.objects(gt=1.5), [Literal(3), Literal('7.25', datatype=XSD.decimal), Literal(10)])
+        self.assertEquals(self.objects(gte=Literal(1.5), lt=10), [Literal(1.5), Literal(3), Literal('7.25', datatype=XSD.decimal)])
+        self.assertEquals(self.objects(lte=-2), [Literal(-2)])
+
+    def test_ordering(self):
+        """
+        Values are ordered across chunks, in ascending or descending order.
+        """
+        ordered = sorted(self.values, key=lambda literal: float(literal.toPython()))
+        self.assertEquals(self.objects(kind='numeric'), ordered)
+        self.assertEquals(self.objects(kind='numeric', descending=True), list(reversed(ordered)))
+        self.assertEquals(self.objects(kind='numeric', descending=True, limit=3), list(reversed(ordered))[:3])
+
+    def test_precision(self):
+        """
+        Numbers that a double cannot represent exactly have no typed value, and bounds that a double cannot
+        represent exactly still select the values within the range.
+        """
+        big = 2 ** 53
+        for value in (big, big + 1, big + 2):
+            self.graph.add((EX['big-{0}'.format(value - big)], EX['size'], Literal(value)))
+        self.graph.add((artis, EX['size'], Literal('0.1', datatype=XSD.decimal)))
+        self.graph.add((artis, EX['size'], Literal('0.10000000000000000001', datatype=XSD.decimal)))
+
+        values = dict((statement.object, statement.numeric_value)
+                      for statement in models.LiteralStatement.objects.filter(predicate=EX['size'], subject__in=[
+                          EX['big-0'], EX['big-1'], EX['big-2'], artis]))
+        self.assertEquals(values, {unicode(big): float(big), unicode(big + 1): None, unicode(big + 2): float(big + 2),
+                                   u'0.1': 0.1, u'0.10000000000000000001': None, u'large': None, u'huge': None})
+
+        self.assertEquals(self.objects(gt=big), [Literal(big + 2)])
+        self.assertEquals(self.objects(gt=big + 1), [Literal(big + 2)])
+        self.assertEquals(self.objects(gte=Decimal('9007199254740992.5')), [Literal(big + 2)])
+        self.assertEquals(self.objects(gt=10, lt=big + 1), [Literal(big)])
+        self.assertEquals(self.objects(gt=10, lte=Decimal('9007199254740991.9')), [])
+        self.assertEquals(self.objects(gt=Decimal('0.09999999999999999999'), lt=1),
+                          [Literal('0.1', datatype=XSD.decimal)])
+
+    def test_invalid_queries(self):
+        """
+        The kind of values must be known, and the bounds must match it.
+        """
+        self.assertRaises(ValueError, self.objects)
+        self.assertRaises(ValueError, self.objects, kind='string')
+        self.assertRaises(TypeError, self.objects, gt=datetime.date.today(), kind='numeric')
+        self.assertRaises(ValueError, list, self.graph.store.range_triples((None, None), kind='numeric'))
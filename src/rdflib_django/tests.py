@@ -4,7 +4,27 @@ Unittests and doctests for the rdflib_django app.
 import doctest
 from django.utils import unittest
 import rdflib_django
-from rdflib_django import store, test_store, test_rdflib, test_seq, test_namespaces
+from rdflib_django import (
+    store,
+    termstore,
+    bulk,
+    caches,
+    executor,
+    indexes,
+    instrumentation,
+    parallel,
+    routing,
+    slowlog,
+    test_store,
+    test_rdflib,
+    test_seq,
+    test_namespaces,
+    test_commands,
+    test_indexes,
+    test_sparql,
+    test_executor,
+    test_instrumentation,
+)
 
 
 def suite():
@@ -14,8 +34,22 @@ def suite():
     s = unittest.TestSuite()
     s.addTest(doctest.DocTestSuite(rdflib_django))
     s.addTest(doctest.DocTestSuite(store))
+    s.addTest(doctest.DocTestSuite(termstore))
+    s.addTest(doctest.DocTestSuite(bulk))
+    s.addTest(doctest.DocTestSuite(caches))
+    s.addTest(doctest.DocTestSuite(executor))
+    s.addTest(doctest.DocTestSuite(indexes))
+    s.addTest(doctest.DocTestSuite(instrumentation))
+    s.addTest(doctest.DocTestSuite(parallel))
+    s.addTest(doctest.DocTestSuite(routing))
+    s.addTest(doctest.DocTestSuite(slowlog))
     s.addTest(unittest.findTestCases(test_store))
     s.addTest(unittest.findTestCases(test_rdflib))
     s.addTest(unittest.findTestCases(test_seq))
     s.addTest(unittest.findTestCases(test_namespaces))
+    s.addTest(unittest.findTestCases(test_commands))
+    s.addTest(unittest.findTestCases(test_indexes))
+    s.addTest(unittest.findTestCases(test_sparql))
+    s.addTest(unittest.findTestCases(test_executor))
+    s.addTest(unittest.findTestCases(test_instrumentation))
     return s
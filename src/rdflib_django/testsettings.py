@@ -17,7 +17,14 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': '',
         'PORT': '',
-        }
+        # a file, so that the test database is shared by threads; see rdflib_django.executor
+        'TEST_NAME': DB_PATH + '.test',
+        },
+    # a stand-in for a read replica; see rdflib_django.routing
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DB_PATH + '.replica',
+        },
 }
 
 SITE_ID = 1
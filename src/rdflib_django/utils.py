@@ -1,10 +1,22 @@
 """
 Utility functions for using rdflib_django.
 """
+from django.conf import settings
 from rdflib.graph import ConjunctiveGraph, Graph
 from rdflib.store import VALID_STORE
 from rdflib.term import URIRef
 from rdflib_django.store import DjangoStore, DEFAULT_STORE
+from rdflib_django.termstore import TermStore
+
+
+def get_store_class():
+    """
+    Returns the store implementation to use: the TermStore if the DJANGO_RDFLIB_TERM_DICTIONARY
+    setting is True, the DjangoStore otherwise.
+    """
+    if getattr(settings, 'DJANGO_RDFLIB_TERM_DICTIONARY', False):
+        return TermStore
+    return DjangoStore
 
 
 def get_conjunctive_graph(store_id=None):
@@ -14,7 +26,7 @@ def get_conjunctive_graph(store_id=None):
     if not store_id:
         store_id = DEFAULT_STORE
 
-    store = DjangoStore(DEFAULT_STORE)
+    store = get_store_class()(DEFAULT_STORE)
     graph = ConjunctiveGraph(store=store, identifier=store_id)
     if graph.open(None) != VALID_STORE:
         raise ValueError("The store identified by {0} is not a valid store".format(store_id))
@@ -28,7 +40,7 @@ def get_named_graph(identifier, store_id=DEFAULT_STORE, create=True):
     if not isinstance(identifier, URIRef):
         identifier = URIRef(identifier)
 
-    store = DjangoStore(store_id)
+    store = get_store_class()(store_id)
     graph = Graph(store, identifier=identifier)
     if graph.open(None, create=create) != VALID_STORE:
         raise ValueError("The store identified by {0} is not a valid store".format(store_id))